@@ -4,7 +4,7 @@ from typing import Any, Dict, Optional
 
 import requests
 
-from FromKiotViet.get_authorization import auth_token
+from FromKiotViet.get_authorization import get_auth_token
 from Utility.get_env import LatestBranchId, retailer
 
 
@@ -12,7 +12,6 @@ BASE_URL = "https://api-man1.kiotviet.vn/api/branchs/{branch_id}/masterproducts"
 
 DEFAULT_HEADERS = {
 	"Accept": "application/json, text/plain, */*",
-	"Authorization": auth_token,
 	"BranchId": str(LatestBranchId),
 	"FingerPrintKey": "211d1f5bb8cc08a94863d2291f1c866d_Chrome_Desktop_Máy tính Windows",
 	"IsUseKvClient": "1",
@@ -89,7 +88,7 @@ def fetch_out_of_stock_master_products(
 	params.update(_build_paging(page, page_size))
 
 	headers = dict(DEFAULT_HEADERS)
-	headers["Authorization"] = auth_token
+	headers["Authorization"] = get_auth_token()
 	headers["BranchId"] = str(branch)
 	headers["X-RETAILER-CODE"] = retailer
 	headers["Retailer"] = retailer
@@ -1,3 +1,5 @@
+import threading
+
 import requests
 from Utility.get_env import UserName, Password, LatestBranchId, retailer
 
@@ -52,5 +54,26 @@ def get_authen() -> str:
     return get_authen_with_credentials(UserName, Password, LatestBranchId, retailer)
 
 
-# Cache the token for reuse
-auth_token = get_authen()
\ No newline at end of file
+_token = None
+_token_lock = threading.Lock()
+
+
+def get_auth_token(refresh: bool = False) -> str:
+    """
+    Return the cached KiotViet token, logging in on first use.
+
+    Login used to run at import time, which blocked app startup on a KiotViet
+    round trip; now it happens on the first call (or in the startup warm-up).
+    """
+    global _token
+    with _token_lock:
+        if _token is None or refresh:
+            _token = get_authen()
+        return _token
+
+
+def __getattr__(name):
+    # Backward compatibility for scripts still doing `from ... import auth_token`
+    if name == "auth_token":
+        return get_auth_token()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
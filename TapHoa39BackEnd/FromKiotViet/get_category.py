@@ -2,7 +2,7 @@ import requests
 
 import unidecode
 from Utility.get_env import LatestBranchId, retailer
-from FromKiotViet.get_authorization import auth_token
+from FromKiotViet.get_authorization import get_auth_token
 
 
 # URL API for categories
@@ -15,7 +15,7 @@ from FromKiotViet.get_authorization import auth_token
 def get_category():
     url = "https://api-man1.kiotviet.vn/api/categories"
     headers = {
-        "Authorization": auth_token,
+        "Authorization": get_auth_token(),
         "retailer": retailer,
         "branchid": LatestBranchId
     }
@@ -1,11 +1,12 @@
 import requests
-from FromKiotViet.get_authorization import auth_token
+from FromKiotViet.get_authorization import get_auth_token
 from Utility.get_env import LatestBranchId, retailer
 
 url = f"https://api-kvsync1.kiotviet.vn/api/resource/fetch"
-  # Headers
-header = {
-      "Authorization": auth_token,
+  # Headers (token is resolved per call so importing this module doesn't log in)
+def _header():
+  return {
+      "Authorization": get_auth_token(),
       "retailer": retailer,
       "branchid": LatestBranchId
   }
@@ -16,7 +17,7 @@ param = {
   }
 
 def get_all():
-    response = requests.get(url, headers=header, params=param)
+    response = requests.get(url, headers=_header(), params=param)
     if response.status_code == 200:
         data = response.json()
         raw_items = data.get('Data', [])
@@ -28,7 +29,7 @@ def get_all():
     
 
 def get_deleted_products():
-  response = requests.request("GET", url, headers=header, params=param)
+  response = requests.request("GET", url, headers=_header(), params=param)
   if response.status_code == 200:
       data = response.json()
       raw_items = data.get('Data', [])
@@ -41,7 +42,7 @@ def get_deleted_products():
       return None
     
 def get_inactive_products():
-  response = requests.request("GET", url, headers=header, params=param)
+  response = requests.request("GET", url, headers=_header(), params=param)
   if response.status_code == 200:
       data = response.json()
       raw_items = data.get('Data', [])
@@ -0,0 +1,99 @@
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator
+
+
+class JsonArrayStream:
+    """
+    Incrementally parse a JSON object of the form {"<key>": [item, ...], ...}.
+
+    Iterating yields the items of the `array_key` array one by one as the
+    byte chunks arrive (e.g. `response.iter_content()`), so the whole payload
+    is never held in memory. The other top-level values are collected in
+    `meta` and are complete once iteration has finished.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], array_key: str = "Data"):
+        self.meta: Dict[str, Any] = {}
+        self._array_key = array_key
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Append the next chunk, dropping what was already consumed. False at end of input."""
+        if self._eof:
+            return False
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk)
+            if text:
+                self._buf = self._buf[self._pos:] + text
+                self._pos = 0
+                return True
+        self._eof = True
+        tail = self._utf8.decode(b"", final=True)
+        if tail:
+            self._buf = self._buf[self._pos:] + tail
+            self._pos = 0
+            return True
+        return False
+
+    def _peek(self) -> str:
+        """Next non-whitespace character ("" at end of input)."""
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def _take(self, expected: str) -> str:
+        char = self._peek()
+        if char not in expected:
+            raise ValueError(f"Invalid JSON stream: expected {expected!r}, got {char or 'end of input'!r}")
+        self._pos += 1
+        return char
+
+    def _value(self):
+        while True:
+            if not self._peek():
+                raise ValueError("Invalid JSON stream: unexpected end of input")
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number ending exactly at the chunk boundary may continue in the next chunk
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def __iter__(self) -> Iterator[Any]:
+        self._take("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._take(":")
+            if key == self._array_key and self._peek() == "[":
+                self._pos += 1
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._take(",]") == "]":
+                            break
+            else:
+                self.meta[key] = self._value()
+            if self._take(",}") == "}":
+                return
@@ -7,11 +7,23 @@ from flask import Flask
 from flask_cors import CORS
 from flask_socketio import SocketIO
 
-from firebase.firebase_service.cache import Cache
+from firebase.firebase_service.cache_backends import create_cache
 from firebase.firebase_service.customer_service import FirestoreCustomerService
 from firebase.firebase_service.invoice_service import FirestoreInvoiceService
 from firebase.firebase_service.order_service import FirestoreorderService
-from firebase.firebase_service.product_service import FirestoreProductService
+from firebase.firebase_service.product_service import SYNC_STATE_COLLECTION, FirestoreProductService, db as products_db
+from firebase.firebase_service.sync_jobs import SyncJobRunner
+from firebase.firebase_service.sync_scheduler import (
+    CUSTOMER_SYNC_INTERVAL_MINUTES,
+    PRODUCT_SYNC_INTERVAL_MINUTES,
+    SYNC_SCHEDULER_ENABLED,
+    SYNC_SCHEDULER_TICK_SECONDS,
+    FirestoreLease,
+    SyncScheduler,
+)
+from firebase.firebase_khachhang.import_to_firestore import update_customer_from_kiotviet_to_firestore
+from firebase.firebase_service.warmup import Warmup
+from FromKiotViet.get_authorization import get_auth_token
 from routes.firebase_customers import create_firebase_customers_bp
 from routes.firebase_invoices import create_firebase_invoices_bp
 from routes.firebase_orders import create_firebase_orders_bp
@@ -21,18 +33,66 @@ from routes.sync_routes import create_sync_routes_bp
 from routes.static_routes import create_static_routes_bp
 from routes.firebase_websocket import register_namespaces
 from routes.auth_routes import auth_bp
+from routes.admin_routes import create_admin_routes_bp
+from routes.health_routes import create_health_routes_bp
 
 # SocketIO middleware removed — websockets are no longer used.
 
+# Warm-up nạp sẵn products/customers khi khởi động (tắt bằng WARMUP_ENABLED=0)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") not in ("0", "false", "False")
+WARMUP_WAIT_SECONDS = float(os.getenv("WARMUP_WAIT_SECONDS", "0"))
+
+
+def _build_warmup(product_service, customer_service) -> Warmup:
+    def _warm_products():
+        # Serve the disk snapshot immediately; the stale entries reload from Firestore in the background
+        restored = product_service.restore_catalog_snapshot()
+        products = product_service.read_all_products()
+        indexed = product_service.warm_product_index()
+        return {"restored_from_snapshot": restored, "products": len(products or []), "indexed": indexed}
+
+    return Warmup({
+        "products": _warm_products,
+        "customers": lambda: {"customers": len(customer_service.read_all_customers() or [])},
+        "kiotviet_login": lambda: {"authenticated": get_auth_token() is not None},
+    })
+
+
+def _build_sync_jobs(product_service) -> SyncJobRunner:
+    return SyncJobRunner({
+        "products": product_service.sync_products_from_kiotviet,
+        "customers": update_customer_from_kiotviet_to_firestore,
+    })
+
+
+def _build_sync_scheduler(sync_jobs) -> SyncScheduler:
+    # One lease for all workers/hosts: only the holder runs scheduled syncs
+    lease = FirestoreLease(
+        products_db,
+        products_db.collection(SYNC_STATE_COLLECTION).document("sync_scheduler"),
+        ttl=3 * SYNC_SCHEDULER_TICK_SECONDS,
+    )
+    return SyncScheduler(
+        sync_jobs,
+        {
+            "products": {"interval": PRODUCT_SYNC_INTERVAL_MINUTES * 60, "params": {"mode": "auto"}},
+            "customers": {"interval": CUSTOMER_SYNC_INTERVAL_MINUTES * 60},
+        },
+        lease=lease,
+    )
+
 
 def _build_app() -> Flask:
     app = Flask(__name__)
     CORS(app, resources={r"/*": {"origins": "*"}})
 
-    product_service = FirestoreProductService(Cache())
-    invoice_service = FirestoreInvoiceService(Cache())
-    customer_service = FirestoreCustomerService(Cache())
-    order_service = FirestoreorderService(Cache())
+    product_service = FirestoreProductService(create_cache("products"))
+    invoice_service = FirestoreInvoiceService(create_cache("invoices"))
+    customer_service = FirestoreCustomerService(create_cache("customers"))
+    order_service = FirestoreorderService(create_cache("orders"))
+    warmup = _build_warmup(product_service, customer_service)
+    sync_jobs = _build_sync_jobs(product_service)
+    sync_scheduler = _build_sync_scheduler(sync_jobs) if SYNC_SCHEDULER_ENABLED else None
 
     # Initialize SocketIO without async_mode (uses threading by default)
     # Frontend uses polling transport only, so no WebSocket needed
@@ -54,11 +114,13 @@ def _build_app() -> Flask:
     except Exception:
         # best-effort registration; avoid crashing startup if socketio not available
         pass
+    app.register_blueprint(create_health_routes_bp(warmup))
     app.register_blueprint(auth_bp)
+    app.register_blueprint(create_admin_routes_bp())
     app.register_blueprint(create_static_routes_bp())
     app.register_blueprint(create_kiotviet_routes_bp())
-    app.register_blueprint(create_sync_routes_bp(product_service))
-    app.register_blueprint(create_firebase_products_bp(product_service, socketio))
+    app.register_blueprint(create_sync_routes_bp(product_service, sync_jobs, sync_scheduler))
+    app.register_blueprint(create_firebase_products_bp(product_service, socketio, sync_jobs))
     app.register_blueprint(
         create_firebase_invoices_bp(
             invoice_service,
@@ -72,6 +134,13 @@ def _build_app() -> Flask:
 
     # Attach socketio to app for external use if needed
     app.socketio = socketio
+    app.warmup = warmup
+    app.sync_jobs = sync_jobs
+    app.sync_scheduler = sync_scheduler
+    if WARMUP_ENABLED:
+        warmup.start()
+    if sync_scheduler is not None:
+        sync_scheduler.start()
 
     return app
 
@@ -88,6 +157,9 @@ if __name__ == "__main__":
     print(f"Server URL: http://0.0.0.0:{port}")
     print(f"{'='*60}\n")
 
+    if WARMUP_ENABLED and WARMUP_WAIT_SECONDS > 0:
+        app.warmup.wait(WARMUP_WAIT_SECONDS)
+
     # Use socketio.run() which handles both regular HTTP and Socket.IO
     # Using threading mode (default) instead of eventlet to avoid blocking REST APIs
     app.socketio.run(
@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 from firebase.init_firebase import init_firestore
+from firebase.firebase_service.product_changes import sync_timestamp
 from google.cloud import firestore
 
 load_dotenv()
@@ -26,6 +27,21 @@ def _parse_int(value):
         return None
 
 
+# Mỗi dòng hóa đơn ghi tối đa 2 document (sản phẩm + marker); Firestore giới hạn 500 ghi / transaction
+INVOICE_LINES_PER_TRANSACTION = 250
+
+
+def _item_product_id(item):
+    return item.get("productId") or item.get("Id") or item.get("id")
+
+
+def _target_onhand(item):
+    for key in ("OnHand", "onHand", "onhand"):
+        if key in item:
+            return _parse_int(item.get(key))
+    return None
+
+
 def update_products_from_banhang_app_to_firestore(update_payload):
     try:
         if not isinstance(update_payload, list):
@@ -34,80 +50,84 @@ def update_products_from_banhang_app_to_firestore(update_payload):
 
         # We'll persist processed event markers when an event/invoice id is provided
         processed_collection = db.collection("product_updates_processed")
+        products_collection = db.collection(COLLECTION_NAME)
 
-        @firestore.transactional
-        def _process_single(transaction, doc_ref, proc_ref, item):
-            # Use doc_ref.get() with transaction parameter (correct Firestore Python SDK usage)
-            doc = doc_ref.get(transaction=transaction)
-            if not doc.exists:
-                return None
-            product_doc = doc.to_dict() or {}
-            current_onhand = product_doc.get("OnHand", 0) or 0
-
-            # Determine explicit target if provided
-            target_onhand = None
-            for key in ("OnHand", "onHand", "onhand"):
-                if key in item:
-                    target_onhand = _parse_int(item.get(key))
-                    break
-
-            minus_value = _parse_int(item.get("minus", 0)) or 0
-
-            # If proc_ref (event marker) exists, skip to make it idempotent
-            if proc_ref is not None:
-                proc_doc = proc_ref.get(transaction=transaction)
-                if proc_doc.exists:
-                    # Already applied
-                    return {
-                        "Id": str(item.get("productId") or item.get("Id") or item.get("id")),
-                        "skipped": True,
-                    }
-
-            if target_onhand is None:
-                # Compute target using current_onhand inside transaction for atomicity
-                target_onhand = int(current_onhand) - int(minus_value)
-
-            # Update product OnHand
-            transaction.update(doc_ref, {"OnHand": target_onhand})
-
-            # Create processed marker if available — use transaction.set
-            if proc_ref is not None:
-                try:
-                    transaction.set(proc_ref, {"applied": True, "productId": str(item.get("productId") or item.get("Id") or item.get("id")), "minus": minus_value})
-                except Exception:
-                    # best-effort: ignore set errors inside transaction wrapper
-                    pass
-
-            return {
-                "Id": str(item.get("productId") or item.get("Id") or item.get("id")),
-                "old_OnHand": current_onhand,
-                "new_OnHand": target_onhand,
-            }
-
+        lines = []
         for item in update_payload:
-            product_id = item.get("productId") or item.get("Id") or item.get("id")
+            product_id = _item_product_id(item)
             if not product_id:
                 continue
-
-            doc_ref = db.collection(COLLECTION_NAME).document(str(product_id))
-
             # Use event id (invoiceId, eventId) to create idempotent marker when available
             event_id = item.get("eventId") or item.get("invoiceId") or item.get("billId") or item.get("receiptId")
-            proc_ref = None
-            if event_id:
-                proc_ref = processed_collection.document(f"{str(event_id)}_{str(product_id)}")
+            marker_id = f"{str(event_id)}_{str(product_id)}" if event_id else None
+            lines.append((str(product_id), marker_id, item))
 
+        @firestore.transactional
+        def _process_lines(transaction, chunk):
+            """
+            Apply a group of invoice lines atomically.
+
+            Products and markers are read with one get_all; lines are then applied
+            in order to the in-memory state, so repeated products and repeated
+            markers behave exactly as if each line had its own transaction.
+            """
+            product_refs = {pid: products_collection.document(pid) for pid, _, _ in chunk}
+            marker_refs = {marker_id: processed_collection.document(marker_id) for _, marker_id, _ in chunk if marker_id}
+            refs = list(product_refs.values()) + list(marker_refs.values())
+            snapshots = {snapshot.reference.path: snapshot for snapshot in transaction.get_all(refs)}
+
+            def _exists(ref):
+                snapshot = snapshots.get(ref.path)
+                return snapshot is not None and snapshot.exists
+
+            onhand = {
+                pid: (snapshots[ref.path].to_dict() or {}).get("OnHand", 0) or 0
+                for pid, ref in product_refs.items()
+                if _exists(ref)
+            }
+            applied_markers = {marker_id for marker_id, ref in marker_refs.items() if _exists(ref)}
+
+            results = []
+            touched = set()
+            new_markers = {}
+            for pid, marker_id, item in chunk:
+                if pid not in onhand:
+                    continue
+                # Already applied
+                if marker_id and marker_id in applied_markers:
+                    continue
+                try:
+                    current_onhand = onhand[pid]
+                    minus_value = _parse_int(item.get("minus", 0)) or 0
+                    target_onhand = _target_onhand(item)
+                    if target_onhand is None:
+                        target_onhand = int(current_onhand) - int(minus_value)
+                except Exception as exc:
+                    # Best-effort logging; continue with next item
+                    print(f"Error processing product {pid}: {exc}")
+                    continue
+
+                onhand[pid] = target_onhand
+                touched.add(pid)
+                if marker_id:
+                    applied_markers.add(marker_id)
+                    new_markers[marker_id] = {"applied": True, "productId": pid, "minus": minus_value}
+                results.append({"Id": pid, "old_OnHand": current_onhand, "new_OnHand": target_onhand})
+
+            # One write per product (its final OnHand); SyncTimestamp feeds GET /products/changes
+            for pid in touched:
+                transaction.update(product_refs[pid], {"OnHand": onhand[pid], "SyncTimestamp": sync_timestamp()})
+            for marker_id, marker in new_markers.items():
+                transaction.set(marker_refs[marker_id], marker)
+            return results
+
+        for start in range(0, len(lines), INVOICE_LINES_PER_TRANSACTION):
+            chunk = lines[start:start + INVOICE_LINES_PER_TRANSACTION]
             try:
-                # Create a transaction and pass it to the decorated function
-                transaction = db.transaction()
-                result = _process_single(transaction, doc_ref, proc_ref, item)
-                if result:
-                    # result may be dict or None
-                    if isinstance(result, dict) and not result.get("skipped"):
-                        updated_products.append(result)
+                updated_products.extend(_process_lines(db.transaction(), chunk))
             except Exception as exc:
-                # Best-effort logging; continue with next item
-                print(f"Error processing product {product_id}: {exc}")
+                # Best-effort logging; continue with the next group of lines
+                print(f"Error processing products {', '.join(pid for pid, _, _ in chunk)}: {exc}")
 
         return {
             "message": f"Đã cập nhật số lượng {len(updated_products)} sản phẩm",
@@ -116,4 +136,3 @@ def update_products_from_banhang_app_to_firestore(update_payload):
     except Exception as e:
         print(f"Lỗi khi cập nhật sản phẩm từ hóa đơn: {e}")
         return {"error": str(e)}
-    
\ No newline at end of file
@@ -1,10 +1,10 @@
-import time
 from datetime import datetime
 from typing import List, Tuple
 
-from google.api_core.exceptions import ResourceExhausted
 from google.cloud import firestore
 from firebase.init_firebase import init_firestore
+from firebase.firebase_service.bulk_writes import BulkWrites
+from firebase.firebase_service.invoice_service import INVOICES_TAG
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,9 +13,6 @@ load_dotenv()
 # Set FIREBASE_SERVICE_ACCOUNT_HOADON in .env (JSON content)
 DB = init_firestore("FIREBASE_SERVICE_ACCOUNT_HOADON", app_name="hoadon_app")
 INV_COLLECTION = "invoices"
-BATCH_LIMIT = 400
-MAX_COMMIT_RETRIES = 5
-INITIAL_BACKOFF_SECONDS = 2
 
 
 def _collect_docs_for_month_by_string_date(year: int, month: int, field: str) -> List[firestore.DocumentSnapshot]:
@@ -90,40 +87,34 @@ def _find_docs_to_delete(year: int, month: int) -> Tuple[List[firestore.Document
     return [], ""
 
 
-def _commit_with_retry(batch: firestore.WriteBatch) -> None:
-    delay = INITIAL_BACKOFF_SECONDS
-    for attempt in range(1, MAX_COMMIT_RETRIES + 1):
-        try:
-            batch.commit()
-            return
-        except ResourceExhausted:
-            if attempt == MAX_COMMIT_RETRIES:
-                raise
-            time.sleep(delay)
-            delay *= 2
-
-
-def delete_invoices_by_month(year: int, month: int) -> dict:
+def delete_invoices_by_month(year: int, month: int, invoice_cache=None) -> dict:
     """
     Delete all invoices in [YYYY-MM-01, YYYY-MM-last] from Firestore.
-    Returns summary dict.
+    `invoice_cache` is the invoice service's cache; its invoice views are
+    dropped once the deletes have gone out. Returns summary dict.
     """
     docs, field_used = _find_docs_to_delete(year, month)
     total = len(docs)
-    deleted = 0
 
     if total == 0:
         return {"deleted": 0, "total_matched": 0, "field": field_used}
 
-    for i in range(0, total, BATCH_LIMIT):
-        batch = DB.batch()
-        chunk = docs[i : i + BATCH_LIMIT]
-        for snap in chunk:
-            batch.delete(snap.reference)
-        _commit_with_retry(batch)
-        deleted += len(chunk)
+    # Quota errors (ResourceExhausted) are retried per document by the bulk writer
+    with BulkWrites(DB, "delete_invoices_by_month") as writes:
+        for snap in docs:
+            writes.delete(snap.reference, key=snap.id)
 
-    return {"deleted": deleted, "total_matched": total, "field": field_used}
+    if invoice_cache is not None:
+        # Every by-date / per-invoice view may list a deleted invoice
+        for snap in docs:
+            if snap.id not in writes.failed:
+                invoice_cache.invalidate(snap.id)
+        invoice_cache.invalidate_tag(INVOICES_TAG)
+
+    summary = {"deleted": writes.succeeded, "total_matched": total, "field": field_used}
+    if writes.failed:
+        summary["failed"] = {doc_id: str(exc) for doc_id, exc in writes.failed.items()}
+    return summary
 
 
 if __name__ == "__main__":
@@ -133,5 +124,8 @@ if __name__ == "__main__":
     parser.add_argument("--month", type=int, required=True, help="Month 1-12")
     args = parser.parse_args()
 
-    summary = delete_invoices_by_month(args.year, args.month)
+    from firebase.firebase_service.cache_backends import create_cache
+
+    # With a shared cache backend the invalidation reaches the running workers too
+    summary = delete_invoices_by_month(args.year, args.month, invoice_cache=create_cache("invoices"))
     print(summary)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 from firebase.init_firebase import init_firestore
+from firebase.firebase_service.bulk_writes import BulkWrites
 
 load_dotenv()
 
@@ -38,28 +39,17 @@ def migrate_collection_between_projects(source_account_env, target_account_env,
     except Exception as exc:
         return {"error": f"Không đọc được dữ liệu từ nguồn: {exc}"}
 
-    batch = target_db.batch()
-    batch_size = 0
-    total_copied = 0
+    with BulkWrites(target_db, f"migrate {collection_name}") as writes:
+        for snapshot in documents:
+            writes.set(target_ref.document(snapshot.id), snapshot.to_dict() or {}, key=snapshot.id)
 
-    for snapshot in documents:
-        data = snapshot.to_dict() or {}
-        doc_ref = target_ref.document(snapshot.id)
-        batch.set(doc_ref, data)
-        batch_size += 1
-        total_copied += 1
-        if batch_size == 500:
-            batch.commit()
-            batch = target_db.batch()
-            batch_size = 0
-
-    if batch_size:
-        batch.commit()
-
-    return {
+    result = {
         "collection": collection_name,
-        "copied": total_copied,
+        "copied": writes.succeeded,
         "source_account": source_account_env,
         "target_account": target_account_env,
     }
+    if writes.failed:
+        result["failed"] = {doc_id: str(exc) for doc_id, exc in writes.failed.items()}
+    return result
 # migrate_collection_between_projects("FIREBASE_SERVICE_ACCOUNT_HOADON", "FIREBASE_SERVICE_ACCOUNT_HOADON2")
\ No newline at end of file
@@ -3,7 +3,6 @@ import firebase_admin
 import requests
 from firebase_admin import credentials, firestore
 from FromKiotViet.get_all_customer import get_entire_customer
-from FromKiotViet.get_authorization import auth_token
 from Utility.get_env import LatestBranchId, retailer
 import requests
 import hashlib
@@ -11,6 +10,7 @@ import os
 from dotenv import load_dotenv
 
 from firebase.init_firebase import init_firestore
+from firebase.firebase_service.bulk_writes import BulkWrites
 
 load_dotenv()
 
@@ -78,31 +78,35 @@ def update_changed_customer(api_items, firestore_items):
     print(f"Phát hiện {len(changed_items)} khách hàng thay đổi. Đang cập nhật...")
     print(f"Phát hiện {len(deleted_items)} khách hàng cần xóa khỏi Firestore.")
 
-    # Ghi theo batch (500 item mỗi batch)
-    BATCH_SIZE = 500
-    for i in range(0, len(changed_items), BATCH_SIZE):
-        batch = db.batch()
-        for item in changed_items[i:i + BATCH_SIZE]:
-            doc_ref = db.collection(COLLECTION_NAME).document(str(item['Id']))
-            batch.set(doc_ref, item)
-        batch.commit()
-        print(f"Đã cập nhật batch {i // BATCH_SIZE + 1}")
-
-    # Xóa theo batch (500 item mỗi batch)
-    for i in range(0, len(deleted_items), BATCH_SIZE):
-        batch = db.batch()
-        for item_id in deleted_items[i:i + BATCH_SIZE]:
-            doc_ref = db.collection(COLLECTION_NAME).document(str(item_id))
-            batch.delete(doc_ref)
-        batch.commit()
-        print(f"Đã xóa batch {i // BATCH_SIZE + 1}")
+    customers_ref = db.collection(COLLECTION_NAME)
+    with BulkWrites(db, "update_changed_customer") as writes:
+        for item in changed_items:
+            writes.set(customers_ref.document(str(item['Id'])), item)
+    print(f"Đã cập nhật {writes.succeeded} khách hàng")
+
+    with BulkWrites(db, "delete_changed_customer") as deletes:
+        for item_id in deleted_items:
+            deletes.delete(customers_ref.document(str(item_id)))
+    print(f"Đã xóa {deletes.succeeded} khách hàng")
+
+    # Một ghi lỗi làm cả lần đồng bộ lỗi (như commit() của batch trước đây)
+    failed = len(writes.failed) + len(deletes.failed)
+    if failed:
+        print(f"❌ {failed} khách hàng không ghi được vào Firestore")
+        writes.raise_first_error()
+        deletes.raise_first_error()
 
     print("Đã hoàn tất cập nhật và xóa.")
 
 
-def update_customer_from_kiotviet_to_firestore():
+def update_customer_from_kiotviet_to_firestore(progress=None):
+    # progress: callback(**fields) tùy chọn, dùng bởi sync job chạy nền
+    report = progress or (lambda **fields: None)
+    report(stage="firestore")
     firestore_customers = fetch_firestore_customers()
+    report(stage="kiotviet", firestore_customers=len(firestore_customers))
     api_customers = fetch_api_customers()
+    report(stage="writing", api_customers=len(api_customers))
     update_changed_customer(api_customers, firestore_customers)
     return {"message": "All customers have already been updated from kiotviet to firestore"}
 
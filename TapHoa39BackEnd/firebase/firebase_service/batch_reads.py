@@ -0,0 +1,45 @@
+from typing import Callable, Iterable, List, Optional
+
+# Documents per get_all call; one call is a single round trip regardless of size
+GET_ALL_CHUNK_SIZE = 300
+
+
+def read_documents(
+    client,
+    collection_ref,
+    ids: Iterable,
+    cache=None,
+    ttl: int = 300,
+    tags=(),
+    shape: Optional[Callable[[str, dict], dict]] = None,
+) -> List[Optional[dict]]:
+    """
+    Read documents by id, in request order (None where a document does not exist).
+
+    Ids already in `cache` are served from it; the misses are fetched together
+    with `client.get_all` and cached under their document id, the same key the
+    services' single-document reads use.
+    """
+    ids = [str(doc_id) for doc_id in ids]
+    found = {}
+    missing = []
+    for doc_id in dict.fromkeys(ids):
+        cached = cache.get(doc_id) if cache else None
+        if cached is not None:
+            found[doc_id] = cached
+        else:
+            missing.append(doc_id)
+
+    for start in range(0, len(missing), GET_ALL_CHUNK_SIZE):
+        refs = [collection_ref.document(doc_id) for doc_id in missing[start:start + GET_ALL_CHUNK_SIZE]]
+        # get_all returns snapshots in arbitrary order
+        for snapshot in client.get_all(refs):
+            if not snapshot.exists:
+                continue
+            data = snapshot.to_dict() or {}
+            value = shape(snapshot.id, data) if shape else data
+            if cache:
+                cache.set(snapshot.id, value, ttl=ttl, tags=tags)
+            found[snapshot.id] = value
+
+    return [found.get(doc_id) for doc_id in ids]
@@ -0,0 +1,173 @@
+"""
+Shared bulk write engine on top of Firestore's BulkWriter.
+
+BulkWriter keeps several small batches in flight at once and ramps its rate
+up from BULK_INITIAL_OPS_PER_SECOND (the 500/50/5 rule). This wrapper adds
+the retry policy (contention, quota and transient errors only, each write
+retried on its own) and per-item results, so one failing document no longer
+fails the other 499 writes of a hand-rolled WriteBatch.
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from google.api_core.exceptions import from_grpc_status
+from google.cloud.firestore_v1.bulk_writer import BulkRetry, BulkWriterOptions, SendMode
+from google.rpc import code_pb2
+
+BULK_INITIAL_OPS_PER_SECOND = int(os.getenv("FIRESTORE_BULK_INITIAL_OPS", "500"))
+BULK_MAX_OPS_PER_SECOND = int(os.getenv("FIRESTORE_BULK_MAX_OPS", "10000"))
+# Attempts per write (first try included) for the retryable codes below
+BULK_MAX_ATTEMPTS = int(os.getenv("FIRESTORE_BULK_MAX_ATTEMPTS", "8"))
+
+RETRYABLE_CODES = frozenset({
+    code_pb2.ABORTED,             # contention
+    code_pb2.RESOURCE_EXHAUSTED,  # quota
+    code_pb2.UNAVAILABLE,
+    code_pb2.DEADLINE_EXCEEDED,
+    code_pb2.INTERNAL,
+})
+
+
+class BulkWrites:
+    """
+    Queue Firestore writes and wait for all of them with `close()`.
+
+    Every write has a `key` (the document path by default) and an optional
+    `on_success` callback, called from a writer thread once the write is
+    acknowledged. After `close()`, `failed` maps key -> exception for the
+    writes that did not succeed and `succeeded` counts the others.
+
+    Writes to one document keep their order: a second write to a document
+    already queued waits for a later pass, sent by a fresh writer once the
+    current one has finished (BulkWriter does not order writes to one document
+    across its parallel batches, and `flush()` would stop it).
+
+        with BulkWrites(db, "products") as writes:
+            writes.set(ref, data, key=product_id, on_success=...)
+        writes.failed  # {} when everything was written
+    """
+
+    def __init__(self, client, label: str = "bulk"):
+        self.label = label
+        self.succeeded = 0
+        self.failed: Dict[Any, Exception] = {}
+        self._pending: Dict[str, tuple] = {}
+        # Paths written in the current pass, and writes held for the next one
+        self._queued = set()
+        self._deferred: List[tuple] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._client = client
+        self._writer = self._new_writer()
+
+    def _new_writer(self):
+        writer = self._client.bulk_writer(options=BulkWriterOptions(
+            initial_ops_per_second=BULK_INITIAL_OPS_PER_SECOND,
+            max_ops_per_second=max(BULK_INITIAL_OPS_PER_SECOND, BULK_MAX_OPS_PER_SECOND),
+            mode=SendMode.parallel,
+            retry=BulkRetry.exponential,
+        ))
+        writer.on_write_result(self._on_result)
+        writer.on_write_error(self._on_error)
+        return writer
+
+    # ------------------------------------------------------------------ #
+    # Queueing
+    # ------------------------------------------------------------------ #
+
+    def set(self, reference, data: Dict, merge: bool = False, key=None, on_success: Optional[Callable] = None) -> None:
+        self._queue("set", reference, (data,), {"merge": merge}, key, on_success)
+
+    def create(self, reference, data: Dict, key=None, on_success: Optional[Callable] = None) -> None:
+        self._queue("create", reference, (data,), {}, key, on_success)
+
+    def update(self, reference, fields: Dict, key=None, on_success: Optional[Callable] = None) -> None:
+        self._queue("update", reference, (fields,), {}, key, on_success)
+
+    def delete(self, reference, key=None, on_success: Optional[Callable] = None) -> None:
+        self._queue("delete", reference, (), {}, key, on_success)
+
+    def _queue(self, method: str, reference, args: tuple, kwargs: Dict, key, on_success) -> None:
+        if self._closed:
+            raise RuntimeError(f"{self.label}: bulk writer already closed")
+        self._send(method, reference, args, kwargs, key, on_success)
+
+    def _send(self, method: str, reference, args: tuple, kwargs: Dict, key, on_success) -> None:
+        path = reference.path
+        with self._lock:
+            if path in self._queued:
+                self._deferred.append((method, reference, args, kwargs, key, on_success))
+                return
+            self._queued.add(path)
+            self._pending[path] = (path if key is None else key, on_success)
+        getattr(self._writer, method)(reference, *args, **kwargs)
+
+    # ------------------------------------------------------------------ #
+    # Results
+    # ------------------------------------------------------------------ #
+
+    def _on_result(self, reference, write_result, bulk_writer) -> None:
+        with self._lock:
+            key, on_success = self._pending.pop(reference.path, (reference.path, None))
+            self.succeeded += 1
+        if on_success is not None:
+            try:
+                on_success()
+            except Exception as exc:
+                print(f"⚠️ {self.label}: callback lỗi cho {key}: {exc}")
+
+    def _on_error(self, failure, bulk_writer) -> bool:
+        if failure.code in RETRYABLE_CODES and failure.attempts + 1 < BULK_MAX_ATTEMPTS:
+            return True
+        reference = failure.operation.reference
+        with self._lock:
+            key, _ = self._pending.pop(reference.path, (reference.path, None))
+            self.failed[key] = from_grpc_status(failure.code, failure.message)
+        return False
+
+    def close(self) -> "BulkWrites":
+        """Wait for every queued write (retries included)."""
+        if self._closed:
+            return self
+        self._closed = True
+        while True:
+            try:
+                self._writer.close()
+            except Exception as exc:
+                with self._lock:
+                    for operation in self._deferred:
+                        key = operation[4]
+                        self.failed[operation[1].path if key is None else key] = exc
+                    self._deferred = []
+                raise
+            finally:
+                with self._lock:
+                    # A batch whose RPC itself failed never reports its writes
+                    for key, _ in self._pending.values():
+                        self.failed[key] = RuntimeError("write was not acknowledged")
+                    self._pending.clear()
+                    self._queued = set()
+            with self._lock:
+                deferred, self._deferred = self._deferred, []
+            if not deferred:
+                break
+            # Next pass: documents written more than once, in their original order
+            self._writer = self._new_writer()
+            for operation in deferred:
+                self._send(*operation)
+        if self.failed:
+            print(f"⚠️ {self.label}: {len(self.failed)} lượt ghi lỗi, {self.succeeded} thành công")
+        return self
+
+    def raise_first_error(self) -> None:
+        """For callers that used to fail as a whole: raise the first failure, if any."""
+        for error in self.failed.values():
+            raise error
+
+    def __enter__(self) -> "BulkWrites":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
@@ -1,21 +1,657 @@
+import itertools
+import os
+import sys
+import threading
 import time
+import weakref
+from collections import OrderedDict
+
+from firebase.firebase_service.frozen import freeze
+
+# Ngân sách mặc định cho mỗi Cache (có thể chỉnh qua biến môi trường)
+DEFAULT_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "20000"))
+DEFAULT_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DEFAULT_SHARDS = 16
+DEFAULT_SWEEP_INTERVAL = 30
+
+# Large lists (the whole catalog) are sized from a sample instead of walking 20k dicts
+_SIZE_SAMPLE = 32
+
+
+def _estimate_size(value, depth=0):
+    """Rough, cheap estimate of the memory held by a cached value."""
+    size = sys.getsizeof(value)
+    if depth > 3:
+        return size
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sys.getsizeof(key) + _estimate_size(item, depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        count = len(value)
+        if count == 0:
+            return size
+        if count <= _SIZE_SAMPLE:
+            size += sum(_estimate_size(item, depth + 1) for item in value)
+        else:
+            sample = list(value)[:_SIZE_SAMPLE] if isinstance(value, (set, frozenset)) else value[:_SIZE_SAMPLE]
+            sampled = sum(_estimate_size(item, depth + 1) for item in sample)
+            size += int(sampled * count / len(sample))
+    return size
+
+
+def key_prefix(key):
+    """Group keys for stats: "all_products:inactive=..." -> "all_products", "12345" -> "<id>"."""
+    head = key.split(":", 1)[0]
+    return "<id>" if head.isdigit() else head
+
+
+# Every live Cache, so the admin endpoint can report on all of them
+_registry = weakref.WeakSet()
+_registry_counter = 0
+_registry_lock = threading.Lock()
+
+
+def registered_caches():
+    return sorted(list(_registry), key=lambda cache: cache.name)
+
+
+# One sweeper thread for every Cache. It reaches them through the WeakSet only,
+# so a cache nobody references any more is still collected.
+_SWEEPER_TICK = 1.0
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def _start_sweeper():
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_loop, name="cache-sweeper", daemon=True)
+            _sweeper.start()
+
+
+def _sweep_loop():
+    while True:
+        time.sleep(_SWEEPER_TICK)
+        now = time.time()
+        for cache in list(_registry):
+            try:
+                cache._sweep_if_due(now)
+            except Exception as exc:  # pragma: no cover - sweeper must never die
+                print(f"⚠️ Cache sweeper error: {exc}")
+        # Don't keep the last cache alive while sleeping
+        cache = None
+
+
+# Cached lists are frozen to tuples, which cannot be weakly referenced. While a
+# Cache holds one it has a version, so data derived from it (encoded responses)
+# can be tied to the snapshot without keeping it alive: id(value) -> [version, holders]
+_snapshot_versions = {}
+_live_versions = set()
+_snapshot_lock = threading.Lock()
+_snapshot_counter = itertools.count(1)
+
+
+def snapshot_version(value):
+    """Version of a tuple snapshot currently held by a Cache, else None."""
+    with _snapshot_lock:
+        row = _snapshot_versions.get(id(value))
+        return row[0] if row is not None else None
+
+
+def snapshot_alive(version) -> bool:
+    """Whether the snapshot that had `version` is still held by a Cache."""
+    with _snapshot_lock:
+        return version in _live_versions
+
+
+def _hold_snapshot(value):
+    if type(value) is tuple:
+        with _snapshot_lock:
+            row = _snapshot_versions.get(id(value))
+            if row is None:
+                version = next(_snapshot_counter)
+                _snapshot_versions[id(value)] = [version, 1]
+                _live_versions.add(version)
+            else:
+                row[1] += 1
+
+
+def _release_snapshot(value):
+    if type(value) is tuple:
+        with _snapshot_lock:
+            row = _snapshot_versions.get(id(value))
+            if row is not None:
+                row[1] -= 1
+                if not row[1]:
+                    del _snapshot_versions[id(value)]
+                    _live_versions.discard(row[0])
+
+
+class CacheStats:
+    """
+    Hit/miss/eviction counters and size gauges per key prefix.
+
+    `remote_hits` counts the subset of hits served from a shared backend
+    after a local miss (see cache_backends.SharedCache).
+    """
+
+    COUNTERS = (
+        "hits",
+        "stale_hits",
+        "remote_hits",
+        "misses",
+        "expirations",
+        "evictions",
+        "invalidations",
+        "loads",
+        "load_errors",
+        "load_seconds",
+        "load_seconds_max",
+    )
+    GAUGES = ("entries", "bytes")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prefixes = {}
+
+    def _row(self, prefix):
+        row = self._prefixes.get(prefix)
+        if row is None:
+            row = dict.fromkeys(self.COUNTERS + self.GAUGES, 0)
+            self._prefixes[prefix] = row
+        return row
+
+    def incr(self, key, field, amount=1):
+        with self._lock:
+            self._row(key_prefix(key))[field] += amount
+
+    def stored(self, key, size, replaced_size=None):
+        with self._lock:
+            row = self._row(key_prefix(key))
+            if replaced_size is None:
+                row["entries"] += 1
+                row["bytes"] += size
+            else:
+                row["bytes"] += size - replaced_size
+
+    def removed(self, key, size, reason):
+        with self._lock:
+            row = self._row(key_prefix(key))
+            row["entries"] -= 1
+            row["bytes"] -= size
+            row[reason] += 1
+
+    def loaded(self, key, seconds, ok=True):
+        with self._lock:
+            row = self._row(key_prefix(key))
+            row["loads" if ok else "load_errors"] += 1
+            row["load_seconds"] += seconds
+            row["load_seconds_max"] = max(row["load_seconds_max"], seconds)
+
+    def reset_gauges(self):
+        with self._lock:
+            for row in self._prefixes.values():
+                row["entries"] = 0
+                row["bytes"] = 0
+
+    def snapshot(self):
+        with self._lock:
+            prefixes = {prefix: dict(row) for prefix, row in self._prefixes.items()}
+        totals = dict.fromkeys(self.COUNTERS + self.GAUGES, 0)
+        for row in prefixes.values():
+            for field, value in row.items():
+                totals[field] = max(totals[field], value) if field == "load_seconds_max" else totals[field] + value
+        for row in (totals, *prefixes.values()):
+            lookups = row["hits"] + row["stale_hits"] + row["misses"]
+            row["hit_ratio"] = round((row["hits"] + row["stale_hits"]) / lookups, 4) if lookups else None
+            row["load_seconds"] = round(row["load_seconds"], 6)
+            row["load_seconds_max"] = round(row["load_seconds_max"], 6)
+        return {"totals": totals, "prefixes": prefixes}
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "stale_until", "size", "tags")
+
+    def __init__(self, value, expires, stale_until, size, tags):
+        self.value = value
+        # Fresh until `expires`; may still be served by get_or_load until `stale_until`
+        self.expires = expires
+        self.stale_until = stale_until
+        self.size = size
+        self.tags = tags
+
+
+class _Shard:
+    __slots__ = ("lock", "entries", "bytes")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+
+class _Call:
+    __slots__ = ("event", "value", "error", "stale")
 
-class Cache:
     def __init__(self):
-        self.store = {}
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.stale = False
 
-    def set(self, key, value, ttl=300):
-        self.store[key] = {"data": value, "expires": time.time() + ttl}
 
-    def get(self, key):
-        item = self.store.get(key)
-        if item and time.time() < item["expires"]:
-            return item["data"]
-        self.store.pop(key, None)
-        return None
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one execution.
+
+    The first caller runs the function; callers arriving while it is in
+    flight block and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Run `fn` for `key` unless it is already running. Returns (value, leader)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, False
+
+        try:
+            call.value = fn()
+            return call.value, True
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def forget(self, key):
+        """Mark an in-flight call as stale so its result is not cached by the leader."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.stale = True
+
+    def is_stale(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            return call is not None and call.stale
+
+
+class Cache:
+    """
+    Thread-safe in-memory cache with TTL, LRU eviction and a memory/entry budget.
+
+    Keys are spread over several shards, each with its own lock and LRU order,
+    so concurrent requests touching different keys do not contend. Expired
+    entries are dropped on read and by a background sweeper thread.
+
+    Each key has a soft `ttl` and an optional `hard_ttl`. Past the soft TTL
+    `get()` treats the key as missing, but `get_or_load()` keeps serving the
+    old value until the hard TTL while one background thread reloads it.
+
+    Keys may carry tags (e.g. "products", "customer:123"); `invalidate_tag()`
+    drops every key stored under a tag in O(tagged keys).
+
+    Hits, misses, evictions, load times and sizes are counted per key prefix
+    (see `stats()`), and every instance is listed by `registered_caches()`.
+
+    Values are stored as read-only snapshots (see frozen.freeze): every reader
+    shares the same objects, so nothing may modify what the cache returns.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        shards: int = DEFAULT_SHARDS,
+        sweep_interval: float = DEFAULT_SWEEP_INTERVAL,
+        name: str = None,
+    ):
+        global _registry_counter
+        with _registry_lock:
+            _registry_counter += 1
+            self.name = name or f"cache-{_registry_counter}"
+            _registry.add(self)
+        shards = max(1, int(shards))
+        self._shards = [_Shard() for _ in range(shards)]
+        self._max_entries_per_shard = max(1, int(max_entries) // shards)
+        self._max_bytes = max(1, int(max_bytes))
+        self._bytes = 0
+        self._bytes_lock = threading.Lock()
+        self._evict_cursor = 0
+        self._flights = SingleFlight()
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        # tag -> keys currently stored with that tag; versions bump on invalidate_tag
+        self._tag_index = {}
+        self._tag_versions = {}
+        self._tags_lock = threading.Lock()
+        self._stats = CacheStats()
+        self._closed = threading.Event()
+        self._sweep_interval = sweep_interval if sweep_interval and sweep_interval > 0 else None
+        self._swept_at = time.time()
+        if self._sweep_interval:
+            _start_sweeper()
+
+    @staticmethod
+    def _normalize_key(key):
+        # Services mix int and str ids for the same document; store them under one key
+        return key if isinstance(key, str) else str(key)
+
+    def _shard_for(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def set(self, key, value, ttl=300, hard_ttl=None, tags=()):
+        self._store(key, value, ttl, hard_ttl, tags)
+
+    def _store(self, key, value, ttl, hard_ttl, tags, versions=None) -> bool:
+        """
+        Store `value`. With `versions` (a _tag_snapshot from before a load),
+        nothing is stored if the key or one of the tags was invalidated since;
+        the check and the insert happen under the same locks as invalidation.
+        """
+        key = self._normalize_key(key)
+        now = time.time()
+        hard_ttl = max(ttl, hard_ttl) if hard_ttl is not None else ttl
+        tags = tuple(tags) if tags else ()
+        value = freeze(value)
+        entry = _Entry(value, now + ttl, now + hard_ttl, _estimate_size(value), tags)
+        shard = self._shard_for(key)
+        with shard.lock:
+            # invalidate() marks the flight before taking the shard lock to drop the key
+            if versions is not None and self._flights.is_stale(key):
+                return False
+            previous = shard.entries.get(key)
+            if not self._retag(key, previous.tags if previous is not None else (), tags, versions):
+                return False
+            if previous is not None:
+                del shard.entries[key]
+                _release_snapshot(previous.value)
+            delta = entry.size - (previous.size if previous is not None else 0)
+            shard.entries[key] = entry
+            _hold_snapshot(value)
+            shard.bytes += delta
+            self._stats.stored(key, entry.size, previous.size if previous is not None else None)
+            delta -= self._evict_over_count_locked(shard)
+        self._add_bytes(delta)
+        if self._bytes > self._max_bytes:
+            self._evict_over_budget(protect_key=key)
+        return True
+
+    def get(self, key, default=None):
+        """Return the live value for `key` (refreshing its LRU position) or `default`."""
+        key = self._normalize_key(key)
+        value, fresh = self._lookup(key)
+        if value is not None and fresh:
+            self._stats.incr(key, "hits")
+            return value
+        self._stats.incr(key, "misses")
+        return default
+
+    def _lookup(self, key):
+        """Return (value, fresh). Stale-but-servable entries come back with fresh=False."""
+        shard = self._shard_for(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None:
+                return None, False
+            now = time.time()
+            if now >= entry.stale_until:
+                del shard.entries[key]
+                shard.bytes -= entry.size
+                self._add_bytes(-entry.size)
+                self._forget(key, entry, "expirations")
+                return None, False
+            shard.entries.move_to_end(key)
+            return entry.value, now < entry.expires
 
     def has(self, key):
         return self.get(key) is not None
 
+    def get_or_load(self, key, loader, ttl=300, hard_ttl=None, tags=()):
+        """
+        Return the cached value for `key`, calling `loader()` on a miss.
+
+        Concurrent misses on the same key share a single `loader()` call, so an
+        expiring catalog key triggers one Firestore scan instead of one per
+        polling terminal. With `hard_ttl` > `ttl`, a value past its soft TTL is
+        returned immediately and refreshed in the background
+        (stale-while-revalidate).
+        """
+        key = self._normalize_key(key)
+        value, fresh = self._lookup(key)
+        if value is not None:
+            if fresh:
+                self._stats.incr(key, "hits")
+            else:
+                self._stats.incr(key, "stale_hits")
+                self._refresh_in_background(key, loader, ttl, hard_ttl, tags)
+            return value
+
+        self._stats.incr(key, "misses")
+        value, _ = self._flights.do(key, lambda: self._load_and_store(key, loader, ttl, hard_ttl, tags))
+        return value
+
+    def _load_and_store(self, key, loader, ttl, hard_ttl, tags, force=False):
+        if not force:
+            # Another leader may have filled the key between our miss and taking the flight
+            current, fresh = self._lookup(key)
+            if current is not None and fresh:
+                return current
+        versions = self._tag_snapshot(tags)
+        started = time.perf_counter()
+        try:
+            loaded = freeze(loader())
+        except BaseException:
+            self._stats.loaded(key, time.perf_counter() - started, ok=False)
+            raise
+        self._stats.loaded(key, time.perf_counter() - started)
+        if loaded is not None:
+            self._store_loaded(key, loaded, ttl, hard_ttl, tags, versions)
+        return loaded
+
+    def _store_loaded(self, key, value, ttl, hard_ttl, tags, versions) -> bool:
+        """Store a loaded value unless the key or its tags were invalidated during the load."""
+        return self._store(key, value, ttl, hard_ttl, tags, versions=versions)
+
+    def _refresh_in_background(self, key, loader, ttl, hard_ttl, tags):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def _run():
+            try:
+                self._flights.do(key, lambda: self._load_and_store(key, loader, ttl, hard_ttl, tags, force=True))
+            except Exception as exc:
+                # Keep serving the stale value; the next request past the soft TTL retries
+                print(f"⚠️ Background refresh failed for cache key {key}: {exc}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=_run, name=f"cache-refresh:{key}", daemon=True).start()
+
     def invalidate(self, key):
-        self.store.pop(key, None)
+        self._drop(self._normalize_key(key))
+
+    def _drop(self, key):
+        # A load already in flight read data from before this write; don't let it repopulate the key
+        self._flights.forget(key)
+        shard = self._shard_for(key)
+        with shard.lock:
+            entry = shard.entries.pop(key, None)
+            if entry is not None:
+                shard.bytes -= entry.size
+                self._forget(key, entry, "invalidations")
+        if entry is not None:
+            self._add_bytes(-entry.size)
+
+    def invalidate_tag(self, tag):
+        """Drop every key stored with `tag`. Returns the number of keys removed."""
+        with self._tags_lock:
+            keys = self._tag_index.pop(tag, None) or set()
+            # Loads started before this call must not store what they read
+            self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+        for key in keys:
+            self._drop(key)
+        return len(keys)
+
+    def invalidate_tags(self, tags):
+        return sum(self.invalidate_tag(tag) for tag in tags)
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                freed = shard.bytes
+                for entry in shard.entries.values():
+                    _release_snapshot(entry.value)
+                shard.entries.clear()
+                shard.bytes = 0
+            self._add_bytes(-freed)
+        with self._tags_lock:
+            self._tag_index.clear()
+        self._stats.reset_gauges()
+
+    def purge_expired(self):
+        """Drop every expired entry. Returns the number of entries removed."""
+        removed = 0
+        now = time.time()
+        for shard in self._shards:
+            freed = 0
+            with shard.lock:
+                expired = [key for key, entry in shard.entries.items() if now >= entry.stale_until]
+                for key in expired:
+                    entry = shard.entries.pop(key)
+                    freed += entry.size
+                    self._forget(key, entry, "expirations")
+                shard.bytes -= freed
+                removed += len(expired)
+            self._add_bytes(-freed)
+        return removed
+
+    def entry_count(self):
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def memory_usage(self):
+        return self._bytes
+
+    def stats(self):
+        """Counters per key prefix plus totals, for the admin/metrics endpoints."""
+        snapshot = self._stats.snapshot()
+        snapshot.update({
+            "name": self.name,
+            "entries": self.entry_count(),
+            "bytes": self._bytes,
+            "max_bytes": self._max_bytes,
+            "max_entries": self._max_entries_per_shard * len(self._shards),
+        })
+        return snapshot
+
+    def close(self):
+        self._closed.set()
+
+    def _retag(self, key, old_tags, new_tags, versions=None) -> bool:
+        """
+        Move `key` from `old_tags` to `new_tags`. With `versions`, only if no
+        tag was invalidated since that snapshot; checked in the same critical
+        section as invalidate_tag() bumps the version and collects its keys.
+        """
+        with self._tags_lock:
+            if versions is not None and tuple(self._tag_versions.get(tag, 0) for tag in new_tags) != versions:
+                return False
+            self._untag_locked(key, old_tags)
+            for tag in new_tags:
+                self._tag_index.setdefault(tag, set()).add(key)
+        return True
+
+    def _untag(self, key, tags):
+        if not tags:
+            return
+        with self._tags_lock:
+            self._untag_locked(key, tags)
+
+    def _untag_locked(self, key, tags):
+        for tag in tags:
+            keys = self._tag_index.get(tag)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self._tag_index[tag]
+
+    def _forget(self, key, entry, reason):
+        """Bookkeeping for an entry leaving the cache (caller holds the shard lock)."""
+        self._untag(key, entry.tags)
+        _release_snapshot(entry.value)
+        self._stats.removed(key, entry.size, reason)
+
+    def _tag_snapshot(self, tags):
+        if not tags:
+            return ()
+        with self._tags_lock:
+            return tuple(self._tag_versions.get(tag, 0) for tag in tags)
+
+    def _add_bytes(self, delta):
+        if delta:
+            with self._bytes_lock:
+                self._bytes += delta
+
+    def _evict_over_count_locked(self, shard):
+        """Trim the shard to its entry budget. Caller holds shard.lock; returns bytes freed."""
+        freed = 0
+        # Oldest entries sit at the front of the OrderedDict
+        while len(shard.entries) > self._max_entries_per_shard:
+            key, entry = shard.entries.popitem(last=False)
+            shard.bytes -= entry.size
+            freed += entry.size
+            self._forget(key, entry, "evictions")
+        return freed
+
+    def _evict_over_budget(self, protect_key=None):
+        """Evict LRU entries shard by shard until the byte budget is met."""
+        shard_count = len(self._shards)
+        idle_rounds = 0
+        while self._bytes > self._max_bytes and idle_rounds < shard_count:
+            with self._bytes_lock:
+                self._evict_cursor = (self._evict_cursor + 1) % shard_count
+                shard = self._shards[self._evict_cursor]
+            freed = 0
+            with shard.lock:
+                victim = None
+                for key in shard.entries:
+                    if key != protect_key:
+                        victim = key
+                        break
+                if victim is not None:
+                    entry = shard.entries.pop(victim)
+                    shard.bytes -= entry.size
+                    freed = entry.size
+                    self._forget(victim, entry, "evictions")
+            if freed:
+                idle_rounds = 0
+                self._add_bytes(-freed)
+            else:
+                idle_rounds += 1
+
+    def _sweep_if_due(self, now):
+        if self._sweep_interval is None or self._closed.is_set():
+            return
+        if now - self._swept_at >= self._sweep_interval:
+            self._swept_at = now
+            self.purge_expired()
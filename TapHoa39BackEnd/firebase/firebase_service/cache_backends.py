@@ -0,0 +1,344 @@
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+
+from firebase.firebase_service.cache import Cache
+from firebase.firebase_service.frozen import freeze
+
+# CACHE_BACKEND=memory (mặc định) hoặc redis; REDIS_URL dùng cho backend redis
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").strip().lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_NAMESPACE = os.getenv("CACHE_NAMESPACE", "taphoa39")
+RECONNECT_DELAY = 5
+
+
+class CacheBackend:
+    """
+    Shared store + message bus used by SharedCache.
+
+    Values are opaque bytes; keys, set members and messages are str.
+    Implementations must be safe to call from several threads.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, data, ttl):
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def add_to_set(self, key, member, ttl):
+        raise NotImplementedError
+
+    def pop_set(self, key):
+        """Return every member of the set at `key` and delete it."""
+        raise NotImplementedError
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel, callback):
+        """
+        Call `callback(message)` for every message published on `channel`.
+
+        `callback(None)` signals that messages may have been missed (the
+        subscription was re-established), so local state should be dropped.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LocalBackend(CacheBackend):
+    """
+    In-process stand-in for Redis.
+
+    Several SharedCache instances built on one LocalBackend behave like
+    workers sharing a Redis server, which is enough to exercise cross-process
+    invalidation without running one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._sets = {}
+        self._subscribers = {}
+
+    def get(self, key):
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                return None
+            data, expires = item
+            if time.time() >= expires:
+                del self._values[key]
+                return None
+            return data
+
+    def set(self, key, data, ttl):
+        with self._lock:
+            self._values[key] = (data, time.time() + ttl)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+                self._sets.pop(key, None)
+
+    def add_to_set(self, key, member, ttl):
+        with self._lock:
+            self._sets.setdefault(key, set()).add(member)
+
+    def pop_set(self, key):
+        with self._lock:
+            return list(self._sets.pop(key, ()))
+
+    def publish(self, channel, message):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, ()))
+        for callback in callbacks:
+            callback(message)
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+
+class RedisBackend(CacheBackend):
+    """
+    CacheBackend on any redis-py compatible client (redis.Redis, fakeredis...).
+
+    Only GET/SET PX/DEL/SADD/PEXPIRE/SMEMBERS/PUBLISH/SUBSCRIBE are used, so
+    Redis-protocol servers such as KeyDB or Valkey work as well.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._closed = threading.Event()
+
+    @classmethod
+    def from_url(cls, url):
+        import redis  # Optional dependency, only needed when CACHE_BACKEND=redis
+
+        client = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=5, health_check_interval=30)
+        client.ping()
+        return cls(client)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, data, ttl):
+        self._client.set(key, data, px=max(1, int(ttl * 1000)))
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*keys)
+
+    def add_to_set(self, key, member, ttl):
+        pipe = self._client.pipeline()
+        pipe.sadd(key, member)
+        pipe.pexpire(key, max(1, int(ttl * 1000)))
+        pipe.execute()
+
+    def pop_set(self, key):
+        pipe = self._client.pipeline()
+        pipe.smembers(key)
+        pipe.delete(key)
+        members, _ = pipe.execute()
+        return [m.decode() if isinstance(m, bytes) else m for m in members or ()]
+
+    def publish(self, channel, message):
+        self._client.publish(channel, message)
+
+    def subscribe(self, channel, callback):
+        threading.Thread(
+            target=self._listen,
+            args=(channel, callback),
+            name=f"cache-subscriber:{channel}",
+            daemon=True,
+        ).start()
+
+    def _listen(self, channel, callback):
+        first = True
+        while not self._closed.is_set():
+            pubsub = None
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                if not first:
+                    # Invalidations sent while we were disconnected are lost
+                    callback(None)
+                first = False
+                while not self._closed.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        data = message.get("data")
+                        callback(data.decode() if isinstance(data, bytes) else data)
+            except Exception as exc:
+                first = False
+                print(f"⚠️ Cache subscriber lost connection on {channel}: {exc}")
+                self._closed.wait(RECONNECT_DELAY)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def close(self):
+        self._closed.set()
+
+
+class SharedCache(Cache):
+    """
+    Two-level cache: the in-memory Cache in front of a shared CacheBackend.
+
+    A local miss is filled from the shared store before calling the loader,
+    so N workers scan Firestore once instead of N times. Invalidations are
+    applied to the shared store and broadcast, and every other worker drops
+    its local copy right away. Backend errors are logged and the cache keeps
+    working as a local-only Cache.
+    """
+
+    def __init__(self, backend: CacheBackend, namespace: str = CACHE_NAMESPACE, **kwargs):
+        super().__init__(**kwargs)
+        self._backend = backend
+        self._prefix = f"{namespace}:cache:{self.name}:"
+        self._channel = f"{namespace}:cache-invalidate:{self.name}"
+        # Lets us ignore our own broadcasts
+        self._origin = uuid.uuid4().hex
+        try:
+            backend.subscribe(self._channel, self._on_message)
+        except Exception as exc:
+            print(f"⚠️ Cache {self.name}: could not subscribe to invalidations: {exc}")
+
+    def _remote_key(self, key):
+        return self._prefix + key
+
+    def _tag_key(self, tag):
+        return f"{self._prefix}tag:{tag}"
+
+    def set(self, key, value, ttl=300, hard_ttl=None, tags=()):
+        value = freeze(value)
+        super().set(key, value, ttl=ttl, hard_ttl=hard_ttl, tags=tags)
+        self._share(key, value, ttl, hard_ttl, tags)
+
+    def _store_loaded(self, key, value, ttl, hard_ttl, tags, versions):
+        stored = super()._store_loaded(key, value, ttl, hard_ttl, tags, versions)
+        if stored:
+            self._share(key, value, ttl, hard_ttl, tags)
+        return stored
+
+    def _share(self, key, value, ttl, hard_ttl, tags):
+        key = self._normalize_key(key)
+        now = time.time()
+        hard_ttl = max(ttl, hard_ttl) if hard_ttl is not None else ttl
+        tags = tuple(tags) if tags else ()
+        try:
+            data = pickle.dumps((value, now + ttl, now + hard_ttl, tags), protocol=pickle.HIGHEST_PROTOCOL)
+            remote_key = self._remote_key(key)
+            self._backend.set(remote_key, data, hard_ttl)
+            for tag in tags:
+                self._backend.add_to_set(self._tag_key(tag), remote_key, hard_ttl)
+        except Exception as exc:
+            print(f"⚠️ Cache {self.name}: shared set failed for {key}: {exc}")
+
+    def _lookup(self, key):
+        value, fresh = super()._lookup(key)
+        if value is not None:
+            return value, fresh
+        try:
+            data = self._backend.get(self._remote_key(key))
+            if data is None:
+                return None, False
+            value, expires, stale_until, tags = pickle.loads(data)
+        except Exception as exc:
+            print(f"⚠️ Cache {self.name}: shared get failed for {key}: {exc}")
+            return None, False
+        now = time.time()
+        if value is None or now >= stale_until:
+            return None, False
+        # Keep the remote deadlines so every worker expires the value at the same time
+        Cache.set(self, key, value, ttl=max(0.0, expires - now), hard_ttl=stale_until - now, tags=tags)
+        self._stats.incr(key, "remote_hits")
+        return value, now < expires
+
+    def invalidate(self, key):
+        key = self._normalize_key(key)
+        self._drop(key)
+        try:
+            self._backend.delete(self._remote_key(key))
+        except Exception as exc:
+            print(f"⚠️ Cache {self.name}: shared delete failed for {key}: {exc}")
+        self._broadcast("key", key)
+
+    def invalidate_tag(self, tag):
+        removed = super().invalidate_tag(tag)
+        try:
+            tag_key = self._tag_key(tag)
+            members = self._backend.pop_set(tag_key)
+            self._backend.delete(tag_key, *members)
+        except Exception as exc:
+            print(f"⚠️ Cache {self.name}: shared tag invalidation failed for {tag}: {exc}")
+        self._broadcast("tag", tag)
+        return removed
+
+    def close(self):
+        super().close()
+        self._backend.close()
+
+    def _broadcast(self, op, target):
+        try:
+            self._backend.publish(self._channel, json.dumps({"origin": self._origin, "op": op, "target": target}))
+        except Exception as exc:
+            print(f"⚠️ Cache {self.name}: invalidation broadcast failed: {exc}")
+
+    def _on_message(self, message):
+        if message is None:
+            # Possibly missed invalidations: the local copy can no longer be trusted
+            self.clear()
+            return
+        try:
+            payload = json.loads(message)
+        except (TypeError, ValueError):
+            return
+        if payload.get("origin") == self._origin:
+            return
+        op, target = payload.get("op"), payload.get("target")
+        if op == "key":
+            self._drop(target)
+        elif op == "tag":
+            Cache.invalidate_tag(self, target)
+
+
+_shared_backend = None
+_shared_backend_lock = threading.Lock()
+
+
+def _get_shared_backend():
+    global _shared_backend
+    with _shared_backend_lock:
+        if _shared_backend is None:
+            _shared_backend = RedisBackend.from_url(REDIS_URL)
+        return _shared_backend
+
+
+def create_cache(name: str, **kwargs) -> Cache:
+    """
+    Build the cache for one service according to CACHE_BACKEND.
+
+    Falls back to the in-memory Cache when the shared backend is not
+    configured, the redis package is missing or the server is unreachable.
+    """
+    if CACHE_BACKEND == "redis":
+        try:
+            return SharedCache(_get_shared_backend(), name=name, **kwargs)
+        except Exception as exc:
+            print(f"⚠️ Không kết nối được cache dùng chung ({exc}), dùng cache in-memory cho {name}")
+    return Cache(name=name, **kwargs)
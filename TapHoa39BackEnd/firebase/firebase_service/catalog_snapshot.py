@@ -0,0 +1,116 @@
+"""
+Compact on-disk snapshot of the product catalog.
+
+Layout (little endian):
+    magic "TH39CAT1" | count u32 | saved_at f64 | offsets u64[count + 1] | records
+
+Each record is one product as compact UTF-8 JSON, and the offset table lets
+a reader memory-map the file and decode records individually. Datetimes
+(Firestore timestamps) are tagged so they come back as datetimes.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime
+
+MAGIC = b"TH39CAT1"
+_HEADER = struct.Struct("<8sId")
+_DATETIME_TAG = "$dt"
+
+
+def _encode_default(value):
+    if isinstance(value, datetime):
+        return {_DATETIME_TAG: value.isoformat()}
+    return str(value)
+
+
+def _decode_hook(obj):
+    if len(obj) == 1 and _DATETIME_TAG in obj:
+        return datetime.fromisoformat(obj[_DATETIME_TAG])
+    return obj
+
+
+def write_snapshot(path, records):
+    """Atomically write `records` (a list of dicts) to `path`. Returns the record count."""
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_encode_default)
+    payloads = [encoder.encode(record).encode("utf-8") for record in records]
+    offsets = array("Q", [0])
+    for payload in payloads:
+        offsets.append(offsets[-1] + len(payload))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".catalog-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(_HEADER.pack(MAGIC, len(payloads), time.time()))
+            handle.write(offsets.tobytes())
+            for payload in payloads:
+                handle.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(payloads)
+
+
+class CatalogSnapshot:
+    """Read-only, memory-mapped view of a snapshot file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.count, self.saved_at = _HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a catalog snapshot")
+            self._index_start = _HEADER.size
+            self._data_start = self._index_start + 8 * (self.count + 1)
+            end = self._offset(self.count)
+            if self._data_start + end > len(self._mmap):
+                raise ValueError(f"{path} is truncated")
+        except BaseException:
+            self._mmap.close()
+            raise
+
+    def _offset(self, index):
+        return struct.unpack_from("<Q", self._mmap, self._index_start + 8 * index)[0]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        start = self._data_start + self._offset(index)
+        end = self._data_start + self._offset(index + 1)
+        return json.loads(self._mmap[start:end].decode("utf-8"), object_hook=_decode_hook)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    @property
+    def age(self):
+        return time.time() - self.saved_at
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
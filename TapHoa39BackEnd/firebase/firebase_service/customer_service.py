@@ -1,3 +1,5 @@
+import os
+
 from google.api_core.exceptions import ResourceExhausted
 from dotenv import load_dotenv
 
@@ -8,11 +10,24 @@ try:
 except ImportError:  # pragma: no cover
     from google.cloud.firestore_v1.base_query import FieldFilter  # type: ignore
 
+from firebase.firebase_service.batch_reads import read_documents
+from firebase.firebase_service.bulk_writes import BulkWrites
 from firebase.init_firebase import init_firestore
 
 COLLECTION_NAME = "customers"
 INVOICE_COLLECTION_NAME = "invoices"
 
+# all_customers: tươi 5 phút, sau đó trả bản cũ và làm mới nền tối đa CUSTOMERS_CACHE_HARD_TTL
+CUSTOMERS_CACHE_TTL = int(os.getenv("CUSTOMERS_CACHE_TTL", "300"))
+CUSTOMERS_CACHE_HARD_TTL = int(os.getenv("CUSTOMERS_CACHE_HARD_TTL", "1800"))
+
+# Cache tags: CUSTOMERS_TAG covers collection-wide views, "customer:<id>" the per-customer views
+CUSTOMERS_TAG = "customers"
+
+
+def customer_tag(customer_id) -> str:
+    return f"customer:{customer_id}"
+
 db = init_firestore("FIREBASE_SERVICE_ACCOUNT_CUSTOMER")
 customers_ref = db.collection(COLLECTION_NAME)
 invoice_db = init_firestore("FIREBASE_SERVICE_ACCOUNT_HOADON")
@@ -170,15 +185,19 @@ class FirestoreCustomerService:
     def add_customer(self, customer):
         doc_ref = self.customers_ref.document(str(customer["id"]))
         doc_ref.set(customer)
-        self.cache.invalidate("all_customers")
+        self.cache.invalidate_tag(CUSTOMERS_TAG)
         return {"message": "customer added"} 
     
     def add_customers(self, customers):
-        for customer in customers:
-            doc_ref = self.customers_ref.document(str(customer["id"]))
-            doc_ref.set(customer)
-        self.cache.invalidate("all_customers")
-        return {"message": f"{len(customers)} customers added"}
+        with BulkWrites(db, "add_customers") as writes:
+            for customer in customers:
+                doc_id = str(customer["id"])
+                writes.set(self.customers_ref.document(doc_id), customer, key=doc_id)
+        self.cache.invalidate_tag(CUSTOMERS_TAG)
+        result = {"message": f"{writes.succeeded} customers added"}
+        if writes.failed:
+            result["failed"] = {doc_id: str(exc) for doc_id, exc in writes.failed.items()}
+        return result
 
     def update_customer(self, customer_id: str, updates: dict) -> dict:
         if customer_id is None:
@@ -202,7 +221,7 @@ class FirestoreCustomerService:
 
         try:
             doc_ref.update(sanitized_updates)
-            self.cache.invalidate("all_customers")
+            self.cache.invalidate_tag(CUSTOMERS_TAG)
             self.cache.invalidate(doc_id)
             return {
                 "message": "customer updated",
@@ -269,7 +288,7 @@ class FirestoreCustomerService:
         try:
             doc_ref.update(updates)
             if self.cache:
-                self.cache.invalidate("all_customers")
+                self.cache.invalidate_tag(CUSTOMERS_TAG)
                 self.cache.invalidate(customer_id)
             self.invalidate_invoices_cache(customer_id)
             updated_data = dict(data)
@@ -340,7 +359,7 @@ class FirestoreCustomerService:
         data["id"] = normalized_id
 
         if self.cache:
-            self.cache.invalidate("all_customers")
+            self.cache.invalidate_tag(CUSTOMERS_TAG)
             self.cache.invalidate(normalized_id)
 
         return {
@@ -427,9 +446,10 @@ class FirestoreCustomerService:
             errors["update_failures"] = failures
 
         if self.cache:
-            self.cache.invalidate("all_customers")
+            self.cache.invalidate_tag(CUSTOMERS_TAG)
             if updated_customers:
-                self.cache.set("all_customers", updated_customers, ttl=300)
+                snapshot = [self._shape_customer(customer["id"], customer) for customer in updated_customers]
+                self.cache.set("all_customers", snapshot, ttl=300, tags=(CUSTOMERS_TAG,))
 
         return updated_customers, errors
 
@@ -468,20 +488,17 @@ class FirestoreCustomerService:
                 "invalid": invalid_inputs,
             }
 
-        deleted = []
-        failed = {}
+        with BulkWrites(db, "delete_customers") as writes:
+            for doc_id in unique_ids:
+                writes.delete(self.customers_ref.document(doc_id), key=doc_id)
 
-        for doc_id in unique_ids:
-            doc_ref = self.customers_ref.document(doc_id)
-            try:
-                doc_ref.delete()
-                deleted.append(doc_id)
-                self.cache.invalidate(doc_id)
-            except Exception as exc:
-                failed[doc_id] = str(exc)
+        failed = {doc_id: str(exc) for doc_id, exc in writes.failed.items()}
+        deleted = [doc_id for doc_id in unique_ids if doc_id not in failed]
+        for doc_id in deleted:
+            self.cache.invalidate(doc_id)
 
         if deleted:
-            self.cache.invalidate("all_customers")
+            self.cache.invalidate_tag(CUSTOMERS_TAG)
 
         return {
             "message": f"deleted {len(deleted)} of {len(unique_ids)} customers",
@@ -495,17 +512,43 @@ class FirestoreCustomerService:
 
     def read_all_customers(self):
         cache_key = "all_customers"
-        if self.cache and self.cache.has(cache_key):
-            cached = self.cache.get(cache_key)
-            if cached is not None:
-                return cached
+        if not self.cache:
+            return self._load_all_customers()
+        return self.cache.get_or_load(
+            cache_key,
+            self._load_all_customers,
+            ttl=CUSTOMERS_CACHE_TTL,
+            hard_ttl=CUSTOMERS_CACHE_HARD_TTL,
+            tags=(CUSTOMERS_TAG,),
+        )
+
+    def read_customers(self, customer_ids):
+        """
+        Customers for `customer_ids` in request order, shaped like GET /get/customers.
+
+        Cache misses are read with one get_all. Entries carry CUSTOMERS_TAG so
+        any customer write drops them together with the list.
+        """
+        customers = read_documents(
+            db,
+            self.customers_ref,
+            customer_ids,
+            cache=self.cache,
+            ttl=CUSTOMERS_CACHE_TTL,
+            tags=(CUSTOMERS_TAG,),
+            shape=self._shape_customer,
+        )
+        return [customer for customer in customers if customer is not None]
 
+    def _load_all_customers(self):
         docs = self.customers_ref.stream()
-        result = [doc.to_dict() | {"Id": doc.id} for doc in docs]
+        return [self._shape_customer(doc.id, doc.to_dict()) for doc in docs]
 
-        if self.cache:
-            self.cache.set(cache_key, result, ttl=300)
-        return result
+    @staticmethod
+    def _shape_customer(doc_id, data):
+        """Shape a customer document the way GET /get/customers returns it (numeric Id)."""
+        doc_id = str(doc_id)
+        return (data or {}) | {"Id": int(doc_id) if doc_id.isdigit() else doc_id}
 
     def get_invoices_by_customer_id(self, customer_id):
         if customer_id is None:
@@ -516,8 +559,9 @@ class FirestoreCustomerService:
             return []
 
         cache_key = f"invoices_by_customer_id:{normalized_id}"
-        if self.cache and self.cache.has(cache_key):
-            return self.cache.get(cache_key)
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached is not None:
+            return cached
 
         candidate_ids = {normalized_id}
         try:
@@ -583,7 +627,7 @@ class FirestoreCustomerService:
             raise
 
         if self.cache:
-            self.cache.set(cache_key, invoices, ttl=120)
+            self.cache.set(cache_key, invoices, ttl=120, tags=(customer_tag(normalized_id),))
         return invoices
 
     def invalidate_invoices_cache(self, customer_ids):
@@ -602,5 +646,5 @@ class FirestoreCustomerService:
             normalized = str(raw_id).strip()
             if not normalized:
                 continue
-            cache_key = f"invoices_by_customer_id:{normalized}"
-            self.cache.invalidate(cache_key)
\ No newline at end of file
+            # Drops invoices_by_customer_id:<id> and any other view derived from this customer
+            self.cache.invalidate_tag(customer_tag(normalized))
\ No newline at end of file
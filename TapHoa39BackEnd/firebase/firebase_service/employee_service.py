@@ -8,6 +8,7 @@ except ImportError:
     from google.cloud.firestore_v1.base_query import FieldFilter
 
 from firebase.init_firebase import init_firestore
+from firebase.firebase_service.bulk_writes import BulkWrites
 
 # Collection names
 EMPLOYEE_LIST_COLLECTION = "employeeList"
@@ -41,20 +42,17 @@ class FirestoreEmployeeService:
     def get_all_employees(self):
         """Get all employees from employeeList collection"""
         cache_key = "all_employees"
-        if self.cache and self.cache.has(cache_key):
-            cached = self.cache.get(cache_key)
-            if cached is not None:
-                return cached
+        if not self.cache:
+            return self._load_all_employees()
+        return self.cache.get_or_load(cache_key, self._load_all_employees, ttl=300)
 
+    def _load_all_employees(self):
         docs = self.employee_list_ref.stream()
         result = []
         for doc in docs:
             data = doc.to_dict()
             data["id"] = doc.id
             result.append(data)
-
-        if self.cache:
-            self.cache.set(cache_key, result, ttl=300)
         return result
 
     def get_employee_by_id(self, employee_id: str):
@@ -65,8 +63,9 @@ class FirestoreEmployeeService:
         doc_id = str(employee_id).strip()
         cache_key = f"employee:{doc_id}"
 
-        if self.cache and self.cache.has(cache_key):
-            return self.cache.get(cache_key)
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached is not None:
+            return cached
 
         doc = self.employee_list_ref.document(doc_id).get()
         if not doc.exists:
@@ -206,10 +205,9 @@ class FirestoreEmployeeService:
     def get_all_work_schedules(self):
         """Get all work schedules"""
         cache_key = "all_work_schedules"
-        if self.cache and self.cache.has(cache_key):
-            cached = self.cache.get(cache_key)
-            if cached is not None:
-                return cached
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached is not None:
+            return cached
 
         docs = self.work_schedule_ref.stream()
         result = []
@@ -324,10 +322,9 @@ class FirestoreEmployeeService:
     def get_all_time_sheets(self):
         """Get all time sheets"""
         cache_key = "all_time_sheets"
-        if self.cache and self.cache.has(cache_key):
-            cached = self.cache.get(cache_key)
-            if cached is not None:
-                return cached
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached is not None:
+            return cached
 
         docs = self.time_sheet_ref.stream()
         result = []
@@ -364,10 +361,9 @@ class FirestoreEmployeeService:
     def get_all_payrolls(self):
         """Get all payrolls"""
         cache_key = "all_payrolls"
-        if self.cache and self.cache.has(cache_key):
-            cached = self.cache.get(cache_key)
-            if cached is not None:
-                return cached
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached is not None:
+            return cached
 
         docs = self.payroll_ref.stream()
         result = []
@@ -409,15 +405,7 @@ class FirestoreEmployeeService:
             return {"success": False, "message": "maNhanVien is required"}
 
         try:
-            # Create document ID from maNhanVien and period
-            ma_nv = payroll_data["maNhanVien"]
-            period = payroll_data.get("period", datetime.now().strftime("%Y-%m"))
-            doc_id = f"{ma_nv}_{period}"
-
-            payroll_data["updatedAt"] = datetime.now()
-            if "createdAt" not in payroll_data:
-                payroll_data["createdAt"] = datetime.now()
-
+            doc_id = self._stamp_payroll(payroll_data)
             doc_ref = self.payroll_ref.document(doc_id)
             doc_ref.set(payroll_data, merge=True)
 
@@ -432,6 +420,17 @@ class FirestoreEmployeeService:
         except Exception as exc:
             return {"success": False, "message": str(exc)}
 
+    @staticmethod
+    def _stamp_payroll(payroll_data: dict) -> str:
+        """Add updatedAt/createdAt and return the maNhanVien + period document ID"""
+        ma_nv = payroll_data["maNhanVien"]
+        period = payroll_data.get("period", datetime.now().strftime("%Y-%m"))
+
+        payroll_data["updatedAt"] = datetime.now()
+        if "createdAt" not in payroll_data:
+            payroll_data["createdAt"] = datetime.now()
+        return f"{ma_nv}_{period}"
+
     def save_payrolls_batch(self, payrolls: list):
         """
         Save multiple payroll records in batch
@@ -440,16 +439,21 @@ class FirestoreEmployeeService:
             return {"success": False, "message": "payrolls must be a non-empty list"}
 
         try:
-            saved_count = 0
             errors = []
 
-            for payroll_data in payrolls:
-                result = self.save_payroll(payroll_data)
-                if result.get("success"):
-                    saved_count += 1
-                else:
-                    errors.append(result.get("message"))
-
+            with BulkWrites(db, "save_payrolls_batch") as writes:
+                for payroll_data in payrolls:
+                    if not payroll_data:
+                        errors.append("payroll_data is required")
+                        continue
+                    if "maNhanVien" not in payroll_data or not payroll_data["maNhanVien"]:
+                        errors.append("maNhanVien is required")
+                        continue
+                    doc_id = self._stamp_payroll(payroll_data)
+                    writes.set(self.payroll_ref.document(doc_id), payroll_data, merge=True, key=doc_id)
+
+            saved_count = writes.succeeded
+            errors.extend(f"{doc_id}: {exc}" for doc_id, exc in writes.failed.items())
             self.cache.invalidate("all_payrolls")
 
             return {
@@ -519,10 +523,9 @@ class FirestoreEmployeeService:
     def get_all_attendance(self):
         """Get all attendance records"""
         cache_key = "all_attendance"
-        if self.cache and self.cache.has(cache_key):
-            cached = self.cache.get(cache_key)
-            if cached is not None:
-                return cached
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached is not None:
+            return cached
 
         docs = self.attendance_ref.stream()
         result = []
@@ -704,37 +707,38 @@ class FirestoreEmployeeService:
             return {"success": False, "message": "records must be a non-empty list"}
 
         try:
-            saved_count = 0
             errors = []
 
-            for attendance_data in records:
-                # Validate required fields
-                if "workerId" not in attendance_data or not attendance_data["workerId"]:
-                    errors.append("Missing workerId in record")
-                    continue
-                if "date" not in attendance_data or not attendance_data["date"]:
-                    errors.append("Missing date in record")
-                    continue
-
-                try:
-                    # Process the data
-                    processed_data = self._process_attendance_data(attendance_data)
-                    processed_data["updatedAt"] = datetime.now()
-                    if "createdAt" not in processed_data:
-                        processed_data["createdAt"] = datetime.now()
-
-                    # Create a unique document ID based on workerId and date
-                    date_str = attendance_data["date"]
-                    if isinstance(date_str, datetime):
-                        date_str = date_str.strftime("%Y-%m-%d")
-                    doc_id = f"{attendance_data['workerId']}_{date_str}"
-
-                    doc_ref = self.attendance_ref.document(doc_id)
-                    doc_ref.set(processed_data, merge=True)
-                    saved_count += 1
-                except Exception as e:
-                    errors.append(str(e))
+            with BulkWrites(db, "save_attendance_batch") as writes:
+                for attendance_data in records:
+                    # Validate required fields
+                    if "workerId" not in attendance_data or not attendance_data["workerId"]:
+                        errors.append("Missing workerId in record")
+                        continue
+                    if "date" not in attendance_data or not attendance_data["date"]:
+                        errors.append("Missing date in record")
+                        continue
 
+                    try:
+                        # Process the data
+                        processed_data = self._process_attendance_data(attendance_data)
+                        processed_data["updatedAt"] = datetime.now()
+                        if "createdAt" not in processed_data:
+                            processed_data["createdAt"] = datetime.now()
+
+                        # Create a unique document ID based on workerId and date
+                        date_str = attendance_data["date"]
+                        if isinstance(date_str, datetime):
+                            date_str = date_str.strftime("%Y-%m-%d")
+                        doc_id = f"{attendance_data['workerId']}_{date_str}"
+
+                        doc_ref = self.attendance_ref.document(doc_id)
+                        writes.set(doc_ref, processed_data, merge=True, key=doc_id)
+                    except Exception as e:
+                        errors.append(str(e))
+
+            saved_count = writes.succeeded
+            errors.extend(f"{doc_id}: {exc}" for doc_id, exc in writes.failed.items())
             self.cache.invalidate("all_attendance")
 
             return {
@@ -0,0 +1,80 @@
+"""
+Per-field fingerprints for the KiotViet -> Firestore product sync.
+
+A fingerprint is cheap to build for the common case: scalars are used as-is
+(tagged so True and 1 differ), datetimes are normalized to naive UTC (Firestore
+hands back aware UTC datetimes for the naive ones we wrote), and only lists /
+dicts are canonically encoded and hashed. The document checksum is derived
+from the field fingerprints, so no full-document JSON encoding is needed.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Dict, Iterable
+
+# Bookkeeping fields written by the sync itself; never part of the comparison
+SYNC_META_FIELDS = frozenset({"SyncChecksum", "SyncTimestamp"})
+# Bumped whenever `checksum()` changes; stored SyncChecksums of another
+# version never match, so the next full sync rewrites them (checksum only)
+CHECKSUM_VERSION = 2
+
+
+def _encode_default(value):
+    if isinstance(value, datetime):
+        return _normalize_datetime(value).isoformat()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _normalize_datetime(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    # DatetimeWithNanoseconds -> plain datetime so equal instants compare equal
+    return datetime(
+        value.year, value.month, value.day, value.hour, value.minute, value.second, value.microsecond
+    )
+
+
+def field_fingerprint(value):
+    """Hashable value that is equal for two field values Firestore would store identically."""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return ("b", value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        return ("t", _normalize_datetime(value).isoformat())
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), default=_encode_default)
+    return ("h", hashlib.blake2b(encoded.encode("utf-8"), digest_size=8).hexdigest())
+
+
+def fingerprints(item: Dict, skip: Iterable[str] = SYNC_META_FIELDS) -> Dict[str, object]:
+    return {field: field_fingerprint(value) for field, value in item.items() if field not in skip}
+
+
+def checksum(field_prints: Dict[str, object]) -> str:
+    """Document checksum from field fingerprints (order independent)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for field in sorted(field_prints):
+        digest.update(repr((field, field_prints[field])).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def changed_fields(new_prints: Dict[str, object], stored: Dict) -> list:
+    """Fields of the new item whose value differs from (or is missing in) the stored document."""
+    changed = []
+    for field, fingerprint in new_prints.items():
+        if field not in stored:
+            changed.append(field)
+            continue
+        stored_value = stored[field]
+        # Fast path: identical scalars need no fingerprinting
+        if fingerprint == stored_value and type(fingerprint) is type(stored_value):
+            continue
+        if field_fingerprint(stored_value) != fingerprint:
+            changed.append(field)
+    return changed
@@ -0,0 +1,51 @@
+"""Read-only snapshots for values shared through the cache."""
+
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError("cached snapshot is read-only; copy it with dict(...) before modifying")
+
+
+class FrozenDict(dict):
+    """
+    dict that refuses mutation.
+
+    Still a real dict, so jsonify, json.dumps, `.get()` and isinstance checks
+    work unchanged; `dict(snapshot)` gives a mutable shallow copy.
+    """
+
+    __slots__ = ()
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __ior__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+
+    def __reduce__(self):
+        # Default dict pickling rebuilds through __setitem__; pass the items to the constructor instead
+        return (FrozenDict, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return f"FrozenDict({dict.__repr__(self)})"
+
+
+def freeze(value):
+    """Recursively turn dicts into FrozenDict, lists into tuples and sets into frozensets."""
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
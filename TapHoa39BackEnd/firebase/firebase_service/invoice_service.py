@@ -5,6 +5,7 @@ from google.api_core.exceptions import DeadlineExceeded
 
 from dotenv import load_dotenv
 
+from firebase.firebase_service.batch_reads import read_documents
 from firebase.init_firebase import init_firestore
 
 load_dotenv()
@@ -12,6 +13,14 @@ load_dotenv()
 # Khởi tạo Firebase
 COLLECTION_NAME = "invoices"
 
+# Cache tags: INVOICES_TAG covers every invoice view, "invoices:<YYYY-MM-DD>" a single day
+INVOICES_TAG = "invoices"
+INVOICES_BY_DATE_TTL = 60
+
+
+def invoices_date_tag(date) -> str:
+    return f"invoices:{date}"
+
 # Đặt tên app duy nhất cho mỗi service account
 db = init_firestore("FIREBASE_SERVICE_ACCOUNT_HOADON")
 # Chuyển chuỗi JSON thành dict và tạo credential
@@ -48,8 +57,9 @@ class FirestoreInvoiceService:
             yield data | {"id": doc.id}
 
     def read_invoice(self, invoice_id):
-        if self.cache.has(invoice_id):
-            return self.cache.get(invoice_id)
+        cached = self.cache.get(invoice_id)
+        if cached is not None:
+            return cached
 
         doc = self.invoices_ref.document(invoice_id).get()
         if doc.exists:
@@ -58,25 +68,38 @@ class FirestoreInvoiceService:
             return invoice
         return None
 
+    def read_invoices(self, invoice_ids):
+        """Invoices for `invoice_ids` in request order; cache misses are read with one get_all."""
+        invoices = read_documents(db, self.invoices_ref, invoice_ids, cache=self.cache, ttl=300)
+        return [invoice for invoice in invoices if invoice is not None]
+
     def get_invoices_by_date(self, date):
         """
         Get invoices for a specific date (full day)
         Expected date format: YYYY-MM-DD (e.g., "2025-06-17")
         """
         try:
-            # Create string for comparison in ISO format for start and end of day
-            start_str = f"{date}T00:00:00.000Z"
-            end_str = f"{date}T23:59:59.999Z"
-
-            # Query Firestore with string
-            query = self.invoices_ref \
-                .where('createdDate', '>=', start_str) \
-                .where('createdDate', '<=', end_str)
-            invoices = query.stream()
-            return [invoice.to_dict() for invoice in invoices]
+            return self.cache.get_or_load(
+                f"invoices_by_date:{date}",
+                lambda: self._load_invoices_by_date(date),
+                ttl=INVOICES_BY_DATE_TTL,
+                tags=(INVOICES_TAG, invoices_date_tag(date)),
+            )
         except Exception as e:
             raise Exception(f"Error getting invoices by date: {str(e)}")
 
+    def _load_invoices_by_date(self, date):
+        # Create string for comparison in ISO format for start and end of day
+        start_str = f"{date}T00:00:00.000Z"
+        end_str = f"{date}T23:59:59.999Z"
+
+        # Query Firestore with string
+        query = self.invoices_ref \
+            .where('createdDate', '>=', start_str) \
+            .where('createdDate', '<=', end_str)
+        invoices = query.stream()
+        return [invoice.to_dict() for invoice in invoices]
+
     def get_invoices_by_status(self, status: str):
         """
         Get invoices by status
@@ -105,7 +128,9 @@ class FirestoreInvoiceService:
 
         def _add_operation():
             doc_ref.set(invoice, timeout=30.0)
-            self.cache.invalidate("all_invoices")
+            # A new invoice only changes the views of its own day
+            invoice_date = self._extract_summary_keys(invoice)["date"]
+            self.cache.invalidate_tag(invoices_date_tag(invoice_date) if invoice_date else INVOICES_TAG)
             self.cache.invalidate(str(invoice["id"]))
             return {"message": "invoice added"}
 
@@ -117,7 +142,7 @@ class FirestoreInvoiceService:
         def _update_operation():
             doc_ref.update(updates, timeout=30.0)
             self.cache.invalidate(invoice_id)
-            self.cache.invalidate("all_invoices")
+            self.cache.invalidate_tag(INVOICES_TAG)
             return {"message": "invoice updated"}
 
         return _retry_on_deadline(_update_operation, operation_name=f"Update invoice {invoice_id}")
@@ -126,7 +151,7 @@ class FirestoreInvoiceService:
         def _delete_operation():
             self.invoices_ref.document(invoice_id).delete(timeout=30.0)
             self.cache.invalidate(invoice_id)
-            self.cache.invalidate("all_invoices")
+            self.cache.invalidate_tag(INVOICES_TAG)
             return {"message": "invoice deleted"}
 
         return _retry_on_deadline(_delete_operation, operation_name=f"Delete invoice {invoice_id}")
@@ -1,5 +1,8 @@
+import os
+
 from dotenv import load_dotenv
 
+from firebase.firebase_service.batch_reads import read_documents
 from firebase.init_firebase import init_firestore
 
 load_dotenv()
@@ -7,6 +10,11 @@ load_dotenv()
 # Khởi tạo Firebase
 COLLECTION_NAME = "orders"
 
+# all_orders: tươi 5 phút, sau đó trả bản cũ và làm mới nền tối đa ORDERS_CACHE_HARD_TTL
+ORDERS_CACHE_TTL = int(os.getenv("ORDERS_CACHE_TTL", "300"))
+ORDERS_CACHE_HARD_TTL = int(os.getenv("ORDERS_CACHE_HARD_TTL", "900"))
+ORDERS_TAG = "orders"
+
 # Đặt tên app duy nhất cho mỗi service account
 db = init_firestore("FIREBASE_SERVICE_ACCOUNT_HOADON")
 # Chuyển chuỗi JSON thành dict và tạo credential
@@ -19,18 +27,23 @@ class FirestoreorderService:
         self.orders_ref = db.collection(COLLECTION_NAME)
 
     def read_all_orders(self):
-        # Kiểm tra cache
-        if self.cache.has("all_orders"):
-            return self.cache.get("all_orders")
-
+        # Các request trùng lúc cache hết hạn chỉ đọc Firestore một lần; hết hạn mềm thì làm mới nền
+        return self.cache.get_or_load(
+            "all_orders",
+            self._load_all_orders,
+            ttl=ORDERS_CACHE_TTL,
+            hard_ttl=ORDERS_CACHE_HARD_TTL,
+            tags=(ORDERS_TAG,),
+        )
+
+    def _load_all_orders(self):
         docs = self.orders_ref.stream()
-        result = [doc.to_dict() | {"id": doc.id} for doc in docs]
-        self.cache.set("all_orders", result, ttl=300)  # Cache 5 phút
-        return result
+        return [doc.to_dict() | {"id": doc.id} for doc in docs]
 
     def read_order(self, order_id):
-        if self.cache.has(order_id):
-            return self.cache.get(order_id)
+        cached = self.cache.get(order_id)
+        if cached is not None:
+            return cached
 
         doc = self.orders_ref.document(order_id).get()
         if doc.exists:
@@ -39,6 +52,11 @@ class FirestoreorderService:
             return order
         return None
 
+    def read_orders(self, order_ids):
+        """Orders for `order_ids` in request order; cache misses are read with one get_all."""
+        orders = read_documents(db, self.orders_ref, order_ids, cache=self.cache, ttl=300)
+        return [order for order in orders if order is not None]
+
     def get_orders_by_date(self, date):
         """
         Get orders for a specific date (full day)
@@ -84,20 +102,20 @@ class FirestoreorderService:
     def add_order(self, order):
         doc_ref = self.orders_ref.document(str(order["id"]))
         doc_ref.set(order)
-        self.cache.invalidate("all_orders")
+        self.cache.invalidate_tag(ORDERS_TAG)
         return {"message": "order added"}
 
     def update_order(self, order_id, updates):
         doc_ref = self.orders_ref.document(order_id)
         doc_ref.update(updates)
         self.cache.invalidate(order_id)
-        self.cache.invalidate("all_orders")
+        self.cache.invalidate_tag(ORDERS_TAG)
         return {"message": "order updated"}
 
     def delete_order(self, order_id):
         self.orders_ref.document(order_id).delete()
         self.cache.invalidate(order_id)
-        self.cache.invalidate("all_orders")
+        self.cache.invalidate_tag(ORDERS_TAG)
         return {"message": "order deleted"}
 
     
\ No newline at end of file
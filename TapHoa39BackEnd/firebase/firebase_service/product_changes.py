@@ -0,0 +1,68 @@
+"""
+Helpers for the product change feed (GET /products/changes?since=<watermark>).
+
+Every product write stamps `SyncTimestamp` (see `sync_timestamp()`) and every
+delete leaves a tombstone document, so "what changed after W" is two range
+queries instead of a full catalog scan. Watermarks are SyncTimestamp strings:
+fixed-width ISO-8601 UTC, so they compare correctly as strings.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+TOMBSTONES_COLLECTION = "product_tombstones"
+# Tombstones older than this are purged; clients further behind get a full reset
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("PRODUCT_TOMBSTONE_RETENTION_DAYS", "30"))
+# Writes can commit slightly after they are stamped; don't advance the watermark into that window
+CHANGES_SAFETY_LAG_SECONDS = float(os.getenv("PRODUCT_CHANGES_SAFETY_LAG", "2"))
+CHANGES_DEFAULT_LIMIT = 2000
+CHANGES_MAX_LIMIT = 10000
+
+_last_stamp = None
+_stamp_lock = threading.Lock()
+
+
+def format_timestamp(moment: datetime) -> str:
+    return moment.isoformat(timespec="microseconds")
+
+
+def sync_timestamp() -> str:
+    """
+    Current UTC time as a SyncTimestamp string.
+
+    Strictly increasing within the process, so a bulk write of thousands of
+    products never produces two equal stamps and paging by `> watermark`
+    cannot skip one.
+    """
+    global _last_stamp
+    with _stamp_lock:
+        now = datetime.utcnow()
+        if _last_stamp is not None and now <= _last_stamp:
+            now = _last_stamp + timedelta(microseconds=1)
+        _last_stamp = now
+        return format_timestamp(now)
+
+
+def parse_watermark(value: str) -> str:
+    """Validate a client watermark and return it in canonical SyncTimestamp form."""
+    try:
+        moment = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid watermark: {value!r}")
+    if moment.tzinfo is not None:
+        moment = moment.replace(tzinfo=None) - (moment.utcoffset() or timedelta(0))
+    return format_timestamp(moment)
+
+
+def retention_horizon() -> str:
+    return format_timestamp(datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS))
+
+
+def safe_watermark_cap() -> str:
+    return format_timestamp(datetime.utcnow() - timedelta(seconds=CHANGES_SAFETY_LAG_SECONDS))
+
+
+def tombstone(product_id, deleted_at: str = None) -> dict:
+    deleted_at = deleted_at or sync_timestamp()
+    return {"Id": str(product_id), "DeletedAt": deleted_at, "SyncTimestamp": deleted_at}
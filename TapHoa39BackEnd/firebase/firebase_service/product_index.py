@@ -0,0 +1,735 @@
+"""
+In-memory product index kept in step with Firestore.
+
+The index holds every product document (active, inactive and deleted flags
+included) and answers lookups without touching the catalog list. It is built
+from one catalog read and then maintained incrementally: local writes are
+applied immediately, writes from other workers / KiotViet sync arrive through
+the change feed (see product_changes.py).
+
+The documents themselves live in a ColumnarCatalog (the same columns the
+catalog cache serves, see `catalog()`) plus the rows changed since it was
+built; only those and the rows being returned exist as dicts.
+"""
+
+import base64
+import heapq
+import json
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional
+
+from unidecode import unidecode
+
+from firebase.firebase_service.frozen import FrozenDict, freeze
+from firebase.firebase_service.product_replica import CatalogView, ColumnarCatalog, coerce_flag
+
+SEARCH_FIELDS = ("FullName", "Name", "NormalizedName", "Code")
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 200
+
+# Listing order for cursor pagination (GET /get/products?page_size=...)
+PAGE_ORDER_FIELDS = ("Id", "SyncTimestamp")
+PAGE_DEFAULT_SIZE = 500
+PAGE_MAX_SIZE = 5000
+
+# Changed rows kept as dicts before they are folded into new columns (catalog() folds them too)
+ROWS_COMPACT_MIN = 1000
+ROWS_COMPACT_SHARE = 0.5
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_UNSET = object()
+
+
+def fold_text(value) -> str:
+    """Lowercase, strip Vietnamese diacritics (đ -> d) and collapse punctuation to spaces."""
+    if not value:
+        return ""
+    return _NON_ALNUM.sub(" ", unidecode(str(value)).lower()).strip()
+
+
+def normalize_code(value) -> str:
+    """Barcode/Code key: scanners and manual entry differ only in whitespace and case."""
+    return str(value).strip().upper() if value is not None else ""
+
+
+def order_key(value) -> tuple:
+    """Sort key matching Firestore's order_by across types (numbers before strings)."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value, "")
+    return (1, 0, str(value))
+
+
+# Past every Id key: a cursor without an Id skips all products sharing its value
+_AFTER_ALL_IDS = (2,)
+
+
+def encode_cursor(order_by: str, value, product_id=None) -> str:
+    """Cursor after (value, Id): pages are ordered by the field, then by Id, so equal values are not skipped."""
+    raw = json.dumps([order_by, value, product_id], separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, order_by: str) -> tuple:
+    """Return (value, Id) of the last product of the previous page; ValueError for a foreign or broken cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        decoded = json.loads(raw.decode("utf-8"))
+        # Cursors issued before the Id tie-break hold no Id
+        cursor_order, value, product_id = decoded if len(decoded) == 3 else (*decoded, None)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if cursor_order != order_by:
+        raise ValueError(f"Cursor was issued for order_by={cursor_order}")
+    return value, product_id
+
+
+def project(product, fields) -> dict:
+    """Only `fields` of a product (Id is always kept so clients can key the rows)."""
+    projected = {"Id": product.get("Id")}
+    for field in fields:
+        if field in product:
+            projected[field] = product[field]
+    return projected
+
+
+def _master_key(value) -> Optional[str]:
+    """Master id as an index key; None/0 mean the product is itself a master."""
+    if value is None or value == 0 or value == "" or value == "0":
+        return None
+    return str(value)
+
+
+# Fields that decide which group a product is in, whether it shows and its place in the group
+_GROUP_FIELDS = ("MasterUnitId", "MasterProductId", "isActive", "isDeleted", "ConversionValue")
+
+
+def _unit_order(product):
+    return (order_key(product.get("ConversionValue") or 0), order_key(product.get("Id")))
+
+
+def _record_id(product) -> Optional[str]:
+    pid = product.get("Id") if product.get("Id") is not None else product.get("id")
+    return str(pid) if pid is not None else None
+
+
+class GroupedProducts(dict):
+    """Result of ProductIndex.grouped(); a dict that can be weakly referenced (see response_cache)."""
+
+
+class _ProductRows:
+    """
+    Mapping pid -> FrozenDict over a ColumnarCatalog plus the rows written
+    since it was built (None marks a removed product). Unchanged rows are
+    rebuilt from the columns on access. Callers hold the index lock.
+    """
+
+    def __init__(self):
+        self.reset(ColumnarCatalog(()))
+
+    def reset(self, base: ColumnarCatalog, changed: Optional[Dict[str, Optional[FrozenDict]]] = None) -> None:
+        self._base = base
+        self._slots: Dict[str, int] = {}
+        for position in range(base.count):
+            pid = base.value(position, "Id")
+            if pid is None:
+                pid = base.value(position, "id")
+            if pid is not None:
+                self._slots[str(pid)] = position
+        self._changed: Dict[str, Optional[FrozenDict]] = {}
+        self._count = len(self._slots)
+        for pid, product in (changed or {}).items():
+            if product is None:
+                self.pop(pid)
+            else:
+                self[pid] = product
+
+    def clear(self) -> None:
+        self.reset(ColumnarCatalog(()))
+
+    def __len__(self):
+        return self._count
+
+    def get(self, pid, default=None):
+        if pid in self._changed:
+            product = self._changed[pid]
+            return default if product is None else product
+        position = self._slots.get(pid)
+        if position is None:
+            return default
+        return FrozenDict(self._base.row(position))
+
+    def __getitem__(self, pid):
+        product = self.get(pid)
+        if product is None:
+            raise KeyError(pid)
+        return product
+
+    def __contains__(self, pid):
+        if pid in self._changed:
+            return self._changed[pid] is not None
+        return pid in self._slots
+
+    def __setitem__(self, pid, product: FrozenDict) -> None:
+        if pid not in self:
+            self._count += 1
+        self._changed[pid] = product
+        self._maybe_compact()
+
+    def pop(self, pid, default=None):
+        product = self.get(pid)
+        if product is None:
+            return default
+        self._changed[pid] = None
+        self._count -= 1
+        self._maybe_compact()
+        return product
+
+    def value(self, pid, field, default=None):
+        """One field of a product, without rebuilding the row."""
+        if pid in self._changed:
+            product = self._changed[pid]
+            return default if product is None else product.get(field, default)
+        position = self._slots.get(pid)
+        return default if position is None else self._base.value(position, field, default)
+
+    def ids(self):
+        """Product ids in insertion order (like a dict: an update keeps the product's place)."""
+        changed = self._changed
+        for pid in self._slots:
+            if changed.get(pid, True) is not None:
+                yield pid
+        for pid, product in changed.items():
+            if product is not None and pid not in self._slots:
+                yield pid
+
+    def items(self):
+        for pid in self.ids():
+            yield pid, self.get(pid)
+
+    @property
+    def base(self) -> ColumnarCatalog:
+        return self._base
+
+    @property
+    def changed(self) -> Dict[str, Optional[FrozenDict]]:
+        return self._changed
+
+    def compact(self) -> ColumnarCatalog:
+        """Fold the changed rows into new columns; returns the (possibly new) base."""
+        if self._changed:
+            self.reset(ColumnarCatalog([product for _, product in self.items()]))
+        return self._base
+
+    def rebase(self, base: ColumnarCatalog, built_from: ColumnarCatalog, folded: Dict) -> bool:
+        """
+        Adopt `base`, built from `built_from` plus the `folded` changes, keeping
+        the changes made since. False if the rows were compacted meanwhile.
+        """
+        if self._base is not built_from:
+            return False
+        later = {pid: product for pid, product in self._changed.items() if folded.get(pid, _UNSET) is not product}
+        self.reset(base, later)
+        return True
+
+    def _maybe_compact(self) -> None:
+        if len(self._changed) >= max(ROWS_COMPACT_MIN, ROWS_COMPACT_SHARE * self._base.count):
+            self.compact()
+
+
+class ProductIndex:
+    """
+    Products by id plus derived facets: Code (barcode) lookup, master/variant
+    links, ordered views for paging and a diacritic-insensitive search index.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._products = _ProductRows()
+        # Code facet: normalized Code -> ids (a deleted product may share its Code with the replacement)
+        self._codes: Dict[str, set] = {}
+        self._doc_code: Dict[str, str] = {}
+        # Variant facet: master id -> unit products (MasterUnitId) / variants (MasterProductId)
+        self._unit_children: Dict[str, set] = {}
+        self._variant_children: Dict[str, set] = {}
+        self._doc_parents: Dict[str, tuple] = {}
+        # flags -> [grouped result, ids whose row changed since]; dropped when the grouping changes
+        self._grouped_memo: Dict[tuple, list] = {}
+        # Bumped on every change; lets derived results be reused until the next write
+        self.version = 0
+        # Search facet
+        self._doc_tokens: Dict[str, tuple] = {}
+        # pid -> (folded Code, first folded name token, FullName length) for ranking
+        self._doc_meta: Dict[str, tuple] = {}
+        # Visibility facet: ids hidden unless include_inactive / include_deleted
+        self._inactive: set = set()
+        self._deleted: set = set()
+        self._postings: Dict[str, set] = {}
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self._prefix_memo: Dict[str, frozenset] = {}
+        self._haystack = ""
+        self._haystack_offsets: List[int] = []
+        self._haystack_ids: List[str] = []
+        self._haystack_dirty = False
+        # Ordered views for paging: field -> (sort keys, ids), rebuilt lazily after writes
+        self._orders: Dict[str, tuple] = {}
+        # Sync state
+        self.loaded = False
+        self.watermark: Optional[str] = None
+        self.synced_at = 0.0
+
+    # ------------------------------------------------------------------ #
+    # Maintenance
+    # ------------------------------------------------------------------ #
+
+    product_id = staticmethod(_record_id)
+
+    def rebuild(self, products: Iterable[dict], watermark: Optional[str]) -> None:
+        # A view over a whole catalog is adopted as is: the index shares its columns
+        if isinstance(products, CatalogView) and len(products) == products.catalog.count:
+            base = products.catalog
+        else:
+            base = ColumnarCatalog(products)
+        with self._lock:
+            self._products.reset(base)
+            self._codes.clear()
+            self._doc_code.clear()
+            self._unit_children.clear()
+            self._variant_children.clear()
+            self._doc_parents.clear()
+            self._doc_tokens.clear()
+            self._doc_meta.clear()
+            self._inactive.clear()
+            self._deleted.clear()
+            self._postings.clear()
+            self._prefix_memo.clear()
+            self._changed()
+            for pid, product in self._products.items():
+                self._index_facets(pid, product)
+            self._vocabulary_dirty = True
+            self._haystack_dirty = True
+            self.loaded = True
+            self._mark_synced(watermark)
+
+    def apply_changes(self, products: Iterable[dict], deleted: Iterable, watermark: Optional[str]) -> None:
+        with self._lock:
+            for product in products:
+                self._upsert_locked(product)
+            for pid in deleted:
+                self._remove_locked(str(pid))
+            self._mark_synced(watermark)
+
+    def upsert(self, product: dict) -> None:
+        with self._lock:
+            self._upsert_locked(product)
+
+    def patch(self, product_id, fields: dict) -> None:
+        """Merge `fields` into the indexed product (like Firestore set(merge=True) / update)."""
+        with self._lock:
+            pid = str(product_id)
+            current = self._products.get(pid)
+            merged = dict(current) if current is not None else {"Id": product_id}
+            merged.update(fields)
+            self._upsert_locked(merged, pid)
+
+    def remove(self, product_id) -> None:
+        with self._lock:
+            self._remove_locked(str(product_id))
+
+    def _mark_synced(self, watermark):
+        if watermark:
+            self.watermark = watermark
+        self.synced_at = time.monotonic()
+
+    def _upsert_locked(self, product: dict, pid: Optional[str] = None) -> None:
+        pid = pid or self.product_id(product)
+        if not pid:
+            return
+        product = freeze(product)
+        previous = self._products.get(pid)
+        self._products[pid] = product
+        self._changed(pid, previous, product)
+        self._index_facets(pid, product)
+
+    def _index_facets(self, pid, product):
+        if coerce_flag(product.get("isActive"), True):
+            self._inactive.discard(pid)
+        else:
+            self._inactive.add(pid)
+        if coerce_flag(product.get("isDeleted"), False):
+            self._deleted.add(pid)
+        else:
+            self._deleted.discard(pid)
+        self._index_code(pid, product)
+        self._index_parents(pid, product)
+        self._index_text(pid, product)
+
+    def _remove_locked(self, pid: str) -> None:
+        if self._products.pop(pid, None) is None:
+            return
+        self._changed()
+        self._unindex_code(pid)
+        self._unindex_parents(pid)
+        self._unindex_text(pid)
+        self._inactive.discard(pid)
+        self._deleted.discard(pid)
+
+    def _changed(self, pid=None, previous=None, product=None):
+        """Drop derived results; an update that leaves the grouping alone (a stock change) only marks its row."""
+        self.version += 1
+        if previous is None or product is None:
+            self._orders.clear()
+            self._grouped_memo.clear()
+            return
+        for field in [field for field in self._orders if previous.get(field) != product.get(field)]:
+            del self._orders[field]
+        if any(previous.get(field) != product.get(field) for field in _GROUP_FIELDS):
+            self._grouped_memo.clear()
+        else:
+            for memo in self._grouped_memo.values():
+                memo[1].add(pid)
+
+    def _index_parents(self, pid, product):
+        parents = (_master_key(product.get("MasterUnitId")), _master_key(product.get("MasterProductId")))
+        if self._doc_parents.get(pid) == parents:
+            return
+        self._unindex_parents(pid)
+        self._doc_parents[pid] = parents
+        unit_master, variant_master = parents
+        if unit_master:
+            self._unit_children.setdefault(unit_master, set()).add(pid)
+        if variant_master:
+            self._variant_children.setdefault(variant_master, set()).add(pid)
+
+    def _unindex_parents(self, pid):
+        parents = self._doc_parents.pop(pid, None)
+        if parents is None:
+            return
+        for master, children in zip(parents, (self._unit_children, self._variant_children)):
+            if master and master in children:
+                children[master].discard(pid)
+                if not children[master]:
+                    del children[master]
+
+    def _index_code(self, pid, product):
+        code = normalize_code(product.get("Code"))
+        if self._doc_code.get(pid) == code:
+            return
+        self._unindex_code(pid)
+        if code:
+            self._doc_code[pid] = code
+            self._codes.setdefault(code, set()).add(pid)
+
+    def _unindex_code(self, pid):
+        code = self._doc_code.pop(pid, None)
+        if code is None:
+            return
+        ids = self._codes.get(code)
+        if ids is not None:
+            ids.discard(pid)
+            if not ids:
+                del self._codes[code]
+
+    def _index_text(self, pid, product):
+        tokens = tuple(dict.fromkeys(
+            token for field in SEARCH_FIELDS for token in fold_text(product.get(field)).split()
+        ))
+        name_tokens = fold_text(product.get("FullName") or product.get("Name")).split()
+        previous = self._doc_tokens.get(pid)
+        if previous is not None and previous != tokens:
+            self._unindex_text(pid)
+        self._doc_meta[pid] = (
+            fold_text(product.get("Code")),
+            name_tokens[0] if name_tokens else "",
+            len(product.get("FullName") or ""),
+        )
+        if previous == tokens:
+            # OnHand/price updates don't touch the search structures
+            return
+        self._doc_tokens[pid] = tokens
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                self._postings[token] = {pid}
+                self._vocabulary_dirty = True
+            else:
+                postings.add(pid)
+        self._prefix_memo.clear()
+        self._haystack_dirty = True
+
+    def _unindex_text(self, pid):
+        tokens = self._doc_tokens.pop(pid, ())
+        self._doc_meta.pop(pid, None)
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(pid)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+        if tokens:
+            self._prefix_memo.clear()
+            self._haystack_dirty = True
+
+    # ------------------------------------------------------------------ #
+    # Lookups
+    # ------------------------------------------------------------------ #
+
+    def __len__(self):
+        return len(self._products)
+
+    def catalog(self) -> ColumnarCatalog:
+        """The indexed products as a ColumnarCatalog (the index keeps using the same columns)."""
+        with self._lock:
+            rows = self._products
+            base, folded = rows.base, dict(rows.changed)
+            if not folded:
+                return base
+            records = [product for _, product in rows.items()]
+        # Encoding the columns takes a while; lookups and writes go on meanwhile
+        catalog = ColumnarCatalog(records)
+        with self._lock:
+            self._products.rebase(catalog, base, folded)
+        return catalog
+
+    def get(self, product_id) -> Optional[FrozenDict]:
+        with self._lock:
+            return self._products.get(str(product_id))
+
+    def find_by_code(self, code, include_inactive: bool = False) -> Optional[FrozenDict]:
+        """
+        Product whose Code matches a scanned barcode, in O(1).
+
+        Unit products (MasterUnitId set) carry their own Code, so a scan
+        resolves straight to the unit that was scanned.
+        """
+        key = normalize_code(code)
+        if not key:
+            return None
+        with self._lock:
+            matches = [self._products[pid] for pid in self._codes.get(key, ())]
+        visible = [p for p in matches if self.is_visible(p, include_inactive)]
+        if not visible:
+            return None
+        # Prefer the active product if an old one with the same Code is still around
+        return max(visible, key=lambda p: (coerce_flag(p.get("isActive"), True), str(p.get("SyncTimestamp") or "")))
+
+    def variants_of(self, master_id, include_inactive: bool = True, include_deleted: bool = True) -> List[FrozenDict]:
+        """Unit products and variants whose MasterUnitId or MasterProductId is `master_id`, smallest unit first."""
+        key = _master_key(master_id)
+        if key is None:
+            return []
+        with self._lock:
+            ids = self._unit_children.get(key, set()) | self._variant_children.get(key, set())
+            products = [self._products[pid] for pid in ids]
+        return sorted(
+            (p for p in products if self.is_visible(p, include_inactive, include_deleted)),
+            key=_unit_order,
+        )
+
+    def grouped(self, include_inactive: bool = False, include_deleted: bool = False) -> Dict[str, dict]:
+        """
+        { master id: {"master": product, "children": [unit products]} }.
+
+        The result is reused until the index changes, so repeated calls return
+        the same object. After updates that keep the grouping (stock changes)
+        only the groups of the changed products are rebuilt, in a copy.
+        """
+        flags = (include_inactive, include_deleted)
+        with self._lock:
+            memo = self._grouped_memo.get(flags)
+            if memo is None:
+                grouped = GroupedProducts()
+                for pid in self._products.ids():
+                    if self._doc_parents.get(pid, (None, None))[0] is None and self._visible_id(pid, *flags):
+                        grouped[pid] = self._group(pid, flags)
+                self._grouped_memo[flags] = [grouped, set()]
+                return grouped
+            grouped, changed = memo
+            if changed:
+                grouped = GroupedProducts(grouped)
+                for pid in changed:
+                    master = self._doc_parents.get(pid, (None, None))[0] or pid
+                    if master in grouped:
+                        grouped[master] = self._group(master, flags)
+                memo[0] = grouped
+                changed.clear()
+            return grouped
+
+    def _group(self, master, flags) -> dict:
+        children = [
+            self._products[child]
+            for child in self._unit_children.get(master, ())
+            if self._visible_id(child, *flags)
+        ]
+        children.sort(key=_unit_order)
+        return {"master": self._products[master], "children": children}
+
+    @staticmethod
+    def is_visible(product, include_inactive: bool = False, include_deleted: bool = False) -> bool:
+        if not include_inactive and not coerce_flag(product.get("isActive"), True):
+            return False
+        if not include_deleted and coerce_flag(product.get("isDeleted"), False):
+            return False
+        return True
+
+    def _visible_id(self, pid, include_inactive: bool = False, include_deleted: bool = False) -> bool:
+        """is_visible() from the visibility facet, without rebuilding the product."""
+        if not include_inactive and pid in self._inactive:
+            return False
+        if not include_deleted and pid in self._deleted:
+            return False
+        return True
+
+    def page(
+        self,
+        order_by: str,
+        after=None,
+        limit: int = PAGE_DEFAULT_SIZE,
+        include_inactive: bool = False,
+        include_deleted: bool = False,
+    ):
+        """
+        Products ordered by (`order_by`, Id), starting after the (value, Id) pair `after`.
+
+        Same semantics as the Firestore query used on a cold read: products
+        without the field are not listed. Returns (products, has_more).
+        """
+        with self._lock:
+            keys, ids = self._ordered(order_by)
+            if after is None:
+                start = 0
+            else:
+                value, product_id = after
+                id_key = _AFTER_ALL_IDS if product_id is None else order_key(product_id)
+                start = bisect_right(keys, (order_key(value), id_key))
+            products = []
+            for pid in ids[start:]:
+                if not self._visible_id(pid, include_inactive, include_deleted):
+                    continue
+                products.append(self._products[pid])
+                if len(products) > limit:
+                    break
+        return products[:limit], len(products) > limit
+
+    def _ordered(self, field):
+        view = self._orders.get(field)
+        if view is None:
+            value = self._products.value
+            rows = sorted(
+                ((order_key(field_value), order_key(value(pid, "Id", pid))), pid)
+                for pid, field_value in ((pid, value(pid, field)) for pid in self._products.ids())
+                if field_value is not None
+            )
+            view = ([key for key, _ in rows], [pid for _, pid in rows])
+            self._orders[field] = view
+        return view
+
+    def search(
+        self,
+        query: str,
+        limit: int = SEARCH_DEFAULT_LIMIT,
+        include_inactive: bool = False,
+        include_deleted: bool = False,
+    ) -> List[FrozenDict]:
+        """
+        Ranked search over folded FullName/Name/NormalizedName/Code.
+
+        Every query term must match the start of some token (AND semantics);
+        exact Code hits rank first, then exact token matches, then prefixes.
+        When prefix matching finds fewer than `limit` products, substrings
+        inside names/codes are matched as a fallback.
+        """
+        terms = fold_text(query).split()
+        if not terms:
+            return []
+        limit = max(1, min(int(limit or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT))
+        folded_query = " ".join(terms)
+
+        with self._lock:
+            candidates = None
+            for term in sorted(set(terms), key=len, reverse=True):
+                ids = self._prefix_ids(term)
+                candidates = set(ids) if candidates is None else candidates & ids
+                if not candidates:
+                    break
+            candidates = candidates or set()
+
+            scored = []
+            for pid in candidates:
+                if not self._visible_id(pid, include_inactive, include_deleted):
+                    continue
+                scored.append((self._score(pid, terms, folded_query), pid))
+
+            if len(scored) < limit and len(folded_query) >= 3:
+                seen = set(candidates)
+                for pid in self._substring_ids(folded_query):
+                    if pid in seen:
+                        continue
+                    seen.add(pid)
+                    if pid in self._products and self._visible_id(pid, include_inactive, include_deleted):
+                        scored.append((1.0, pid))
+
+            best = heapq.nsmallest(
+                limit,
+                scored,
+                key=lambda item: (-item[0], self._doc_meta[item[1]][2], item[1]),
+            )
+            return [self._products[pid] for _, pid in best]
+
+    def _score(self, pid, terms, folded_query) -> float:
+        tokens = self._doc_tokens.get(pid, ())
+        code, first_name_token, _ = self._doc_meta.get(pid, ("", "", 0))
+        score = 10.0
+        if code == folded_query:
+            score += 100
+        for term in terms:
+            score += 3 if term in tokens else 1
+        if first_name_token.startswith(terms[0]):
+            score += 2
+        return score
+
+    def _prefix_ids(self, term: str) -> frozenset:
+        ids = self._prefix_memo.get(term)
+        if ids is not None:
+            return ids
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect_left(self._vocabulary, term)
+        end = bisect_right(self._vocabulary, term + "\uffff", lo=start)
+        if end - start == 1:
+            ids = frozenset(self._postings[self._vocabulary[start]])
+        else:
+            ids = frozenset().union(*(self._postings[token] for token in self._vocabulary[start:end]))
+        self._prefix_memo[term] = ids
+        return ids
+
+    def _substring_ids(self, needle: str) -> List[str]:
+        if self._haystack_dirty:
+            parts, offsets, ids, position = [], [], [], 0
+            for pid, tokens in self._doc_tokens.items():
+                text = " ".join(tokens)
+                offsets.append(position)
+                ids.append(pid)
+                parts.append(text)
+                position += len(text) + 1
+            self._haystack = "\n".join(parts)
+            self._haystack_offsets = offsets
+            self._haystack_ids = ids
+            self._haystack_dirty = False
+
+        found = []
+        haystack, offsets, ids = self._haystack, self._haystack_offsets, self._haystack_ids
+        position = haystack.find(needle)
+        while position != -1:
+            slot = bisect_right(offsets, position) - 1
+            found.append(ids[slot])
+            # Skip to the next document so one product is reported once
+            next_start = offsets[slot + 1] if slot + 1 < len(offsets) else len(haystack)
+            position = haystack.find(needle, next_start)
+        return found
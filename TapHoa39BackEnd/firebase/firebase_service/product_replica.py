@@ -0,0 +1,302 @@
+"""
+Compact columnar copy of the product catalog.
+
+Instead of ~20k Firestore dicts (and one filtered copy per include_inactive /
+include_deleted combination), the catalog is stored column by column:
+
+- hot numeric fields in typed arrays (float64 values + one kind byte per cell,
+  so ints come back as ints),
+- flags in byte arrays, from which the visibility masks are computed once,
+- other common fields in per-field lists with interned strings,
+- rare fields (and values of an unexpected type) in a per-row overflow map.
+
+Rows are rebuilt as plain dicts only when a view is iterated, with their keys
+in the original document order (one shared key-order tuple per distinct
+layout). Views are position arrays over the masks, so the four filtered
+"lists" share storage.
+"""
+
+import sys
+import threading
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterable, List
+
+from firebase.firebase_service.frozen import freeze
+
+NUMERIC_FIELDS = ("Id", "OnHand", "OnHandNV", "BasePrice", "Cost", "ConversionValue", "MasterUnitId", "MasterProductId")
+FLAG_FIELDS = ("isActive", "isDeleted", "IsRewardPoint")
+# A field present in at least this share of rows gets its own column; rarer ones go to overflow
+COLUMN_MIN_SHARE = 0.05
+
+# Cell kinds for numeric columns
+_ABSENT, _INT, _FLOAT, _OTHER = 0, 1, 2, 3
+# Cell values for flag columns (_ABSENT / _OTHER as above)
+_FALSE, _TRUE = 1, 2
+# Where row() finds a field of a layout
+_NUMBER_COLUMN, _FLAG_COLUMN, _OBJECT_COLUMN, _OVERFLOW = range(4)
+_MAX_EXACT_INT = 2 ** 53
+
+
+class _Missing:
+    """Marks an absent cell in an object column; pickles as the module singleton."""
+
+    def __reduce__(self):
+        return "_MISSING"
+
+
+_MISSING = _Missing()
+
+
+def coerce_flag(value, default: bool) -> bool:
+    """isActive / isDeleted as stored by the various writers ("true", 1, True...) -> bool."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    if isinstance(value, str):
+        normalized = value.strip().lower()
+        if normalized in {"true", "1", "yes", "y"}:
+            return True
+        if normalized in {"false", "0", "no", "n"}:
+            return False
+    return default
+
+
+def _intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return freeze(value)
+
+
+class ColumnarCatalog:
+    """Immutable columnar catalog; build a new one to reflect changes."""
+
+    def __init__(self, records: Iterable[dict]):
+        records = [record for record in records if isinstance(record, dict)]
+        self.count = len(records)
+
+        counts: Dict[str, int] = {}
+        for record in records:
+            for field in record:
+                counts[field] = counts.get(field, 0) + 1
+        threshold = max(1, int(self.count * COLUMN_MIN_SHARE))
+        typed = set(NUMERIC_FIELDS) | set(FLAG_FIELDS)
+        self.object_fields = tuple(
+            field for field, seen in counts.items() if field not in typed and seen >= threshold
+        )
+
+        self._numbers = {field: array("d", bytes(8 * self.count)) for field in NUMERIC_FIELDS}
+        self._number_kinds = {field: bytearray(self.count) for field in NUMERIC_FIELDS}
+        self._flags = {field: bytearray(self.count) for field in FLAG_FIELDS}
+        self._objects = {field: [_MISSING] * self.count for field in self.object_fields}
+        self._overflow: Dict[int, dict] = {}
+        self._active = bytearray(self.count)
+        self._live = bytearray(self.count)
+        # Key order of each row: index into the distinct layouts
+        self._layouts: List[tuple] = []
+        self._row_layouts = array("I", bytes(4 * self.count))
+
+        columns = set(self.object_fields)
+        layout_ids: Dict[tuple, int] = {}
+        for row, record in enumerate(records):
+            layout = tuple(record)
+            layout_id = layout_ids.get(layout)
+            if layout_id is None:
+                layout_id = layout_ids[layout] = len(self._layouts)
+                self._layouts.append(tuple(sys.intern(field) if isinstance(field, str) else field for field in layout))
+            self._row_layouts[row] = layout_id
+            extra = {}
+            for field, value in record.items():
+                if field in self._numbers:
+                    if not self._store_number(field, row, value):
+                        extra[field] = value
+                elif field in self._flags:
+                    if isinstance(value, bool):
+                        self._flags[field][row] = _TRUE if value else _FALSE
+                    else:
+                        self._flags[field][row] = _OTHER
+                        extra[field] = value
+                elif field in columns:
+                    self._objects[field][row] = _intern(value)
+                else:
+                    extra[field] = value
+            if extra:
+                self._overflow[row] = freeze({field: _intern(value) for field, value in extra.items()})
+            self._active[row] = coerce_flag(record.get("isActive"), True)
+            self._live[row] = not coerce_flag(record.get("isDeleted"), False)
+
+        self._plans = [self._plan(layout) for layout in self._layouts]
+        self._views: Dict[tuple, "CatalogView"] = {}
+        self._views_lock = threading.Lock()
+
+    def _plan(self, layout: tuple) -> tuple:
+        """(field, source, cells, values) per field of a layout, in key order, for row()."""
+        plan = []
+        for field in layout:
+            if field in self._numbers:
+                plan.append((field, _NUMBER_COLUMN, self._number_kinds[field], self._numbers[field]))
+            elif field in self._flags:
+                plan.append((field, _FLAG_COLUMN, self._flags[field], None))
+            elif field in self._objects:
+                plan.append((field, _OBJECT_COLUMN, self._objects[field], None))
+            else:
+                plan.append((field, _OVERFLOW, None, None))
+        return tuple(plan)
+
+    def _store_number(self, field, row, value) -> bool:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        if isinstance(value, int):
+            if abs(value) >= _MAX_EXACT_INT:
+                return False
+            self._number_kinds[field][row] = _INT
+        else:
+            self._number_kinds[field][row] = _FLOAT
+        self._numbers[field][row] = value
+        return True
+
+    # ------------------------------------------------------------------ #
+    # Rows and views
+    # ------------------------------------------------------------------ #
+
+    def row(self, position: int) -> dict:
+        """Rebuild product `position` as a dict equal to the stored record (same key order)."""
+        extra = self._overflow.get(position)
+        record = {}
+        for field, source, cells, values in self._plans[self._row_layouts[position]]:
+            if source == _OBJECT_COLUMN:
+                record[field] = cells[position]
+                continue
+            cell = cells[position] if cells is not None else _OTHER
+            if source == _NUMBER_COLUMN and cell == _INT:
+                record[field] = int(values[position])
+            elif source == _NUMBER_COLUMN and cell == _FLOAT:
+                record[field] = values[position]
+            elif source == _FLAG_COLUMN and (cell == _TRUE or cell == _FALSE):
+                record[field] = cell == _TRUE
+            else:
+                record[field] = extra[field]
+        return record
+
+    def value(self, position: int, field: str, default=None):
+        """One field of product `position`, without rebuilding the row."""
+        kinds = self._number_kinds.get(field)
+        if kinds is not None:
+            kind = kinds[position]
+            if kind == _INT:
+                return int(self._numbers[field][position])
+            if kind == _FLOAT:
+                return self._numbers[field][position]
+        else:
+            flags = self._flags.get(field)
+            if flags is not None:
+                flag = flags[position]
+                if flag == _TRUE or flag == _FALSE:
+                    return flag == _TRUE
+                if flag == _ABSENT:
+                    return default
+            else:
+                column = self._objects.get(field)
+                if column is not None:
+                    cell = column[position]
+                    return default if cell is _MISSING else cell
+        # Rare fields, and typed fields holding a value of another type
+        extra = self._overflow.get(position)
+        return extra.get(field, default) if extra else default
+
+    def view(self, include_inactive: bool = False, include_deleted: bool = False) -> "CatalogView":
+        """Products passing the filter; the same view object is returned for the same flags."""
+        flags = (bool(include_inactive), bool(include_deleted))
+        view = self._views.get(flags)
+        if view is None:
+            with self._views_lock:
+                view = self._views.get(flags)
+                if view is None:
+                    positions = array("I", (
+                        position
+                        for position in range(self.count)
+                        if (include_inactive or self._active[position]) and (include_deleted or self._live[position])
+                    ))
+                    view = CatalogView(self, positions)
+                    self._views[flags] = view
+        return view
+
+    # ------------------------------------------------------------------ #
+    # Aggregates (column loops, no dicts are built)
+    # ------------------------------------------------------------------ #
+
+    def stock_value(self, view: "CatalogView") -> Dict[str, float]:
+        """Sum of OnHand * Cost and OnHand * BasePrice over a view."""
+        onhand, onhand_kinds = self._numbers["OnHand"], self._number_kinds["OnHand"]
+        cost = self._numbers["Cost"]
+        price = self._numbers["BasePrice"]
+        at_cost = at_price = units = 0.0
+        for position in view.positions:
+            if not onhand_kinds[position]:
+                continue
+            quantity = onhand[position]
+            units += quantity
+            at_cost += quantity * cost[position]
+            at_price += quantity * price[position]
+        return {"units": units, "value_at_cost": at_cost, "value_at_price": at_price}
+
+    def low_stock(self, view: "CatalogView", threshold: float = 0) -> List[dict]:
+        """Products in a view with OnHand <= threshold (products without OnHand are skipped)."""
+        onhand, kinds = self._numbers["OnHand"], self._number_kinds["OnHand"]
+        return [
+            self.row(position)
+            for position in view.positions
+            if kinds[position] and onhand[position] <= threshold
+        ]
+
+    def __sizeof__(self):
+        size = object.__sizeof__(self)
+        size += sum(values.buffer_info()[1] * values.itemsize for values in self._numbers.values())
+        size += sum(len(kinds) for kinds in self._number_kinds.values())
+        size += sum(len(flags) for flags in self._flags.values()) + len(self._active) + len(self._live)
+        # Column lists hold pointers to shared (interned) values
+        size += 8 * self.count * len(self.object_fields)
+        size += sum(sys.getsizeof(extra) for extra in self._overflow.values())
+        size += len(self._row_layouts) * self._row_layouts.itemsize
+        size += sum(sys.getsizeof(layout) for layout in self._layouts)
+        return size
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_views"] = {}
+        del state["_views_lock"]
+        del state["_plans"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._plans = [self._plan(layout) for layout in self._layouts]
+        self._views_lock = threading.Lock()
+
+
+class CatalogView(Sequence):
+    """Read-only sequence of products over a ColumnarCatalog; rows are built on access."""
+
+    # Weakly referenceable, so encoded responses can be tied to a view without holding it
+    __slots__ = ("catalog", "positions", "__weakref__")
+
+    def __init__(self, catalog: ColumnarCatalog, positions: array):
+        self.catalog = catalog
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.catalog.row(position) for position in self.positions[index]]
+        return self.catalog.row(self.positions[index])
+
+    def __iter__(self):
+        row = self.catalog.row
+        for position in self.positions:
+            yield row(position)
+
@@ -4,14 +4,46 @@ import os
 from dotenv import load_dotenv
 import json
 import requests
-from FromKiotViet.get_authorization import auth_token
+from FromKiotViet.get_authorization import get_auth_token
 from Utility.get_env import LatestBranchId, retailer
+from Utility.json_stream import JsonArrayStream
 import hashlib
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from firebase.firebase_hanghoa.product_class import Product
 from dateutil.parser import parse as parse_date
-from typing import Any, Dict, List, Optional, Set
-from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+from datetime import datetime, timedelta, timezone
+from google.api_core.exceptions import NotFound
 from firebase.init_firebase import init_firestore
+from firebase.firebase_service.catalog_snapshot import CatalogSnapshot, write_snapshot
+from firebase.firebase_service.batch_reads import read_documents
+from firebase.firebase_service.bulk_writes import BulkWrites
+from firebase.firebase_service.field_diff import CHECKSUM_VERSION, changed_fields, checksum, fingerprints
+from firebase.firebase_service.product_replica import ColumnarCatalog, coerce_flag
+from firebase.firebase_service.product_index import (
+    PAGE_DEFAULT_SIZE,
+    PAGE_MAX_SIZE,
+    PAGE_ORDER_FIELDS,
+    SEARCH_DEFAULT_LIMIT,
+    ProductIndex,
+    decode_cursor,
+    encode_cursor,
+    project,
+)
+from firebase.firebase_service.product_changes import (
+    CHANGES_DEFAULT_LIMIT,
+    CHANGES_MAX_LIMIT,
+    TOMBSTONES_COLLECTION,
+    parse_watermark,
+    retention_horizon,
+    safe_watermark_cap,
+    sync_timestamp,
+    tombstone,
+)
 
 load_dotenv()
 
@@ -21,17 +53,67 @@ API_CLIENT_ID = "WebAppWN-3e31c9b0-cd4a-43e6-be25-a5d1330372fd-500111210-878979"
 API_RESOURCE = "Products"
 API_PAGE_SIZE = 500
 API_SINGLE_FETCH_LIMIT = 20000
-API_HEADERS = {
-    "Authorization": auth_token,
-    "retailer": retailer,
-    "branchid": LatestBranchId,
-}
+API_STREAM_CHUNK_SIZE = 64 * 1024
+# Số trang KiotViet tải song song khi phải phân trang
+KIOTVIET_FETCH_WORKERS = max(1, int(os.getenv("KIOTVIET_FETCH_WORKERS", "4")))
+# Sync "auto" chạy incremental, nhưng đối chiếu toàn bộ (full) sau mỗi khoảng này
+PRODUCT_FULL_SYNC_INTERVAL = int(os.getenv("PRODUCT_FULL_SYNC_INTERVAL", str(24 * 3600)))
+# Incremental xét lại cả sản phẩm sửa trước watermark một khoảng này (ghi trễ / lệch giờ)
+SYNC_WATERMARK_OVERLAP_SECONDS = int(os.getenv("SYNC_WATERMARK_OVERLAP_SECONDS", "600"))
+# Báo tiến độ sync (progress callback) sau mỗi chừng này sản phẩm
+SYNC_PROGRESS_EVERY = 500
+# Tên tham số lọc ModifiedDate phía KiotViet (endpoint resource/fetch không công bố, mặc định tắt:
+# khi trống, sản phẩm cũ vẫn được tải nhưng bị loại ngay đầu stream)
+KIOTVIET_MODIFIED_SINCE_PARAM = os.getenv("KIOTVIET_MODIFIED_SINCE_PARAM", "").strip()
+
 COLLECTION_NAME = "products"
+# Trạng thái đồng bộ KiotViet (watermark ModifiedDate, lần full sync cuối)
+SYNC_STATE_COLLECTION = "sync_state"
+PRODUCT_SYNC_STATE_DOC = "kiotviet_products"
+SYNC_MODES = ("auto", "incremental", "full")
+
+# Catalog cache: tươi trong PRODUCTS_CACHE_TTL giây, sau đó vẫn trả bản cũ (và làm mới nền)
+# cho tới PRODUCTS_CACHE_HARD_TTL. Ghi qua service luôn invalidate nên không bị trễ.
+PRODUCTS_CACHE_TTL = int(os.getenv("PRODUCTS_CACHE_TTL", "300"))
+PRODUCTS_CACHE_HARD_TTL = int(os.getenv("PRODUCTS_CACHE_HARD_TTL", "1800"))
+
+# Tag gắn cho mọi view dẫn xuất từ toàn bộ catalog (danh sách, grouped, variants...)
+PRODUCTS_TAG = "products"
+
+# Snapshot catalog trên đĩa để restart phục vụ ngay, sau đó đối chiếu lại với Firestore
+CATALOG_SNAPSHOT_PATH = os.getenv(
+    "CATALOG_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "taphoa39", "catalog.snap")
+)
+CATALOG_SNAPSHOT_MAX_AGE = int(os.getenv("CATALOG_SNAPSHOT_MAX_AGE", str(7 * 24 * 3600)))
+CATALOG_SNAPSHOT_MIN_INTERVAL = int(os.getenv("CATALOG_SNAPSHOT_MIN_INTERVAL", "60"))
+
+# Index sản phẩm in-memory (search, ...) kéo thay đổi từ change feed sau mỗi khoảng này
+PRODUCT_INDEX_SYNC_INTERVAL = float(os.getenv("PRODUCT_INDEX_SYNC_INTERVAL", "5"))
 
 # Sử dụng init_firestore thay vì khởi tạo trực tiếp
 db = init_firestore("FIREBASE_SERVICE_ACCOUNT_HANGHOA", app_name="hanghoa_app")
 
 
+def _api_headers() -> Dict[str, Any]:
+    # Token is resolved lazily: importing the service must not log in to KiotViet
+    return {
+        "Authorization": get_auth_token(),
+        "retailer": retailer,
+        "branchid": LatestBranchId,
+    }
+
+
+def _as_naive_datetime(value) -> Optional[datetime]:
+    """ModifiedDate / watermark (datetime or ISO string) -> naive datetime, aware values in UTC."""
+    if not value:
+        return None
+    if not isinstance(value, datetime):
+        value = parse_date(str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
 
 class FirestoreProductService:
     def __init__(self, cache):
@@ -43,20 +125,16 @@ class FirestoreProductService:
         """
         self.cache = cache
         self.products_ref = db.collection(COLLECTION_NAME)
+        self.tombstones_ref = db.collection(TOMBSTONES_COLLECTION)
+        self.sync_state_ref = db.collection(SYNC_STATE_COLLECTION).document(PRODUCT_SYNC_STATE_DOC)
+        self._tombstones_purged_at = 0.0
+        self._purge_lock = threading.Lock()
+        self._index = ProductIndex()
+        self._index_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_saved_at = 0.0
 
-    @staticmethod
-    def _coerce_bool(value, default: bool) -> bool:
-        if isinstance(value, bool):
-            return value
-        if isinstance(value, (int, float)):
-            return bool(value)
-        if isinstance(value, str):
-            normalized = value.strip().lower()
-            if normalized in {"true", "1", "yes", "y"}:
-                return True
-            if normalized in {"false", "0", "no", "n"}:
-                return False
-        return default
+    _coerce_bool = staticmethod(coerce_flag)
 
     @classmethod
     def _should_store_product(cls, record: Any) -> bool:
@@ -70,33 +148,178 @@ class FirestoreProductService:
         return not is_deleted
 
     def read_all_products(self, include_inactive: bool = False, include_deleted: bool = False):
-        """Read products from Firestore."""
-        cache_key = f"all_products:inactive={include_inactive}:deleted={include_deleted}"
-        if self.cache.has(cache_key):
-            return self.cache.get(cache_key)
+        """
+        Read products from Firestore.
 
-        docs = self.products_ref.stream()
-        result = []
-        for doc in docs:
-            data = doc.to_dict() or {}
+        Returns a read-only sequence over the cached columnar catalog; every
+        filter combination is a view of the same copy. The same view object is
+        returned until the catalog is reloaded.
+        """
+        return self.read_catalog().view(include_inactive, include_deleted)
+
+    def read_catalog(self) -> ColumnarCatalog:
+        # Concurrent misses share one stream(); once warm, expiry is refreshed in the background
+        return self.cache.get_or_load(
+            "catalog",
+            self._load_catalog,
+            ttl=PRODUCTS_CACHE_TTL,
+            hard_ttl=PRODUCTS_CACHE_HARD_TTL,
+            tags=(PRODUCTS_TAG,),
+        )
+
+    def _load_catalog(self) -> ColumnarCatalog:
+        if self._index.loaded:
+            # The index is kept current (local writes + change feed) and stores its
+            # products in these columns, so the catalog and the index share one copy
+            catalog = self._get_product_index().catalog()
+        else:
+            catalog = self._stream_catalog()
+        # Each load also refreshes the disk snapshot
+        self._schedule_catalog_snapshot(catalog.view(include_inactive=True, include_deleted=True))
+        return catalog
+
+    def _stream_catalog(self) -> ColumnarCatalog:
+        return ColumnarCatalog(doc.to_dict() or {} for doc in self.products_ref.stream())
+
+    def catalog_summary(self, low_stock_threshold: float = 0, include_inactive: bool = False) -> Dict:
+        """Stock value and low-stock products, computed over the catalog columns."""
+        catalog = self.read_catalog()
+        view = catalog.view(include_inactive, False)
+        low_stock = catalog.low_stock(view, low_stock_threshold)
+        return {
+            "products": len(view),
+            **catalog.stock_value(view),
+            "low_stock_threshold": low_stock_threshold,
+            "low_stock_count": len(low_stock),
+            "low_stock": low_stock,
+        }
 
-            is_active = self._coerce_bool(data.get("isActive"), True)
-            is_deleted = self._coerce_bool(data.get("isDeleted"), False)
+    def list_products_page(
+        self,
+        order_by: str = "Id",
+        cursor: Optional[str] = None,
+        page_size: int = PAGE_DEFAULT_SIZE,
+        fields: Optional[List[str]] = None,
+        include_inactive: bool = False,
+        include_deleted: bool = False,
+    ) -> Dict:
+        """
+        One page of products ordered by Id or SyncTimestamp.
 
-            if (not include_inactive) and (not is_active):
-                continue
-            if (not include_deleted) and is_deleted:
-                continue
+        Pass the returned `next_cursor` to get the following page. `fields`
+        limits each product to those fields (plus Id). Served from the
+        in-memory index when it is loaded; otherwise a Firestore query with
+        select(), so a cold read does not pull whole documents either.
+        """
+        if order_by not in PAGE_ORDER_FIELDS:
+            raise ValueError(f"order_by must be one of {', '.join(PAGE_ORDER_FIELDS)}")
+        page_size = max(1, min(int(page_size or PAGE_DEFAULT_SIZE), PAGE_MAX_SIZE))
+        after = decode_cursor(cursor, order_by) if cursor else None
+
+        if self._index.loaded:
+            products, has_more = self._get_product_index().page(
+                order_by, after, page_size, include_inactive, include_deleted
+            )
+        else:
+            products, has_more = self._query_products_page(
+                order_by, after, page_size, fields, include_inactive, include_deleted
+            )
+
+        last = products[-1] if has_more else None
+        next_cursor = encode_cursor(order_by, last.get(order_by), last.get("Id")) if last is not None else None
+        if fields:
+            products = [project(product, fields) for product in products]
+        return {
+            "products": products,
+            "count": len(products),
+            "order_by": order_by,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        }
+
+    def _query_products_page(self, order_by, after, page_size, fields, include_inactive, include_deleted):
+        # Id breaks ties, so products sharing the last value of a page are not skipped
+        order = [order_by] if order_by == "Id" else [order_by, "Id"]
+        query = self.products_ref
+        for field in order:
+            query = query.order_by(field)
+        if fields:
+            # Flags are needed to filter, the order field to build the cursor
+            query = query.select(sorted(set(fields) | {"Id", order_by, "isActive", "isDeleted"}))
+
+        if after is not None:
+            value, product_id = after
+            # Cursor values follow the orderings; one without an Id resumes after the value only
+            after = [value] if product_id is None or order_by == "Id" else [value, product_id]
+
+        products = []
+        while True:
+            page_query = query.start_after(after) if after is not None else query
+            docs = list(page_query.limit(page_size + 1).stream())
+            for doc in docs:
+                data = doc.to_dict() or {}
+                after = [data.get(field) for field in order]
+                if ProductIndex.is_visible(data, include_inactive, include_deleted):
+                    products.append(data)
+                    if len(products) > page_size:
+                        return products[:page_size], True
+            # Hidden products can leave a page short; keep reading until it is full or the end
+            if len(docs) <= page_size:
+                return products, False
+
+    def _schedule_catalog_snapshot(self, records: Sequence[Dict]) -> None:
+        if not CATALOG_SNAPSHOT_PATH or not records:
+            return
+        now = time.time()
+        with self._snapshot_lock:
+            if now - self._snapshot_saved_at < CATALOG_SNAPSHOT_MIN_INTERVAL:
+                return
+            self._snapshot_saved_at = now
+
+        def _write():
+            try:
+                count = write_snapshot(CATALOG_SNAPSHOT_PATH, records)
+                print(f"💾 Đã lưu snapshot catalog ({count} sản phẩm) vào {CATALOG_SNAPSHOT_PATH}")
+            except Exception as exc:
+                print(f"⚠️ Không lưu được snapshot catalog: {exc}")
 
-            enriched = dict(data)
-            result.append(enriched)
+        threading.Thread(target=_write, name="catalog-snapshot", daemon=True).start()
 
-        self.cache.set(cache_key, result, ttl=300)
-        return result
+    def restore_catalog_snapshot(self) -> int:
+        """
+        Seed the catalog cache from the last snapshot on disk.
+
+        Entries are stored already past their soft TTL: they are served right
+        away and the first read reloads them from Firestore in the background.
+        Returns the number of products restored (0 if there is no usable snapshot).
+        """
+        if not CATALOG_SNAPSHOT_PATH or not os.path.exists(CATALOG_SNAPSHOT_PATH):
+            return 0
+        try:
+            with CatalogSnapshot(CATALOG_SNAPSHOT_PATH) as snapshot:
+                if snapshot.age > CATALOG_SNAPSHOT_MAX_AGE:
+                    print(f"⚠️ Snapshot catalog quá cũ ({int(snapshot.age)}s), bỏ qua")
+                    return 0
+                records = list(snapshot)
+        except Exception as exc:
+            print(f"⚠️ Không đọc được snapshot catalog: {exc}")
+            return 0
+
+        if self.cache.get("catalog") is None:
+            self.cache.set(
+                "catalog",
+                ColumnarCatalog(records),
+                ttl=0,
+                hard_ttl=PRODUCTS_CACHE_HARD_TTL,
+                tags=(PRODUCTS_TAG,),
+            )
+        print(f"📦 Khôi phục {len(records)} sản phẩm từ snapshot catalog")
+        return len(records)
 
     def read_product(self, product_id):
-        if self.cache.has(product_id):
-            return self.cache.get(product_id)
+        cached = self.cache.get(product_id)
+        if cached is not None:
+            return cached
 
         doc = self.products_ref.document(str(product_id)).get()
         if doc.exists:
@@ -105,6 +328,11 @@ class FirestoreProductService:
             return product
         return None
 
+    def read_products(self, product_ids) -> List[Dict]:
+        """Products for `product_ids` in request order; cache misses are read with one get_all."""
+        products = read_documents(db, self.products_ref, product_ids, cache=self.cache, ttl=300)
+        return [product for product in products if product is not None]
+
     def add_product(self, product):
         """Add a single product to Firestore."""
         if not isinstance(product, dict):
@@ -117,16 +345,18 @@ class FirestoreProductService:
         doc_ref = self.products_ref.document(str(product_id))
 
         if not self._should_store_product(product):
-            doc_ref.delete()
+            self._delete_products([product_id])
             self.cache.invalidate(str(product_id))
             self.invalidate_all_product_caches()
             return {"message": "Product skipped because inactive or deleted", "skipped": True}
 
         # Add sync metadata
         product["SyncChecksum"] = self.hash_item(product)
-        product["SyncTimestamp"] = datetime.utcnow().isoformat()
+        product["SyncTimestamp"] = sync_timestamp()
 
         doc_ref.set(product)
+        # The catalog is rebuilt from the index: patch it before dropping the caches
+        self._index_upsert(product)
         self.cache.invalidate(str(product_id))
         self.invalidate_all_product_caches()
         return {"message": "Product added", "product_id": str(product_id)}
@@ -134,7 +364,7 @@ class FirestoreProductService:
     def add_products_batch(self, products: List[Dict]) -> Dict:
         """
         Add multiple products to Firestore in batch.
-        Uses Firestore batch writes for efficiency (max 500 per batch).
+        Uses the shared bulk writer; a product that fails is reported in `errors`.
         """
         if not products:
             return {"status": "error", "message": "No products provided"}
@@ -143,10 +373,9 @@ class FirestoreProductService:
             return {"status": "error", "message": "Products must be a list"}
 
         try:
-            batch = db.batch()
-            added_count = 0
             skipped_count = 0
             errors = []
+            writes = BulkWrites(db, "add_products_batch")
 
             for idx, product_data in enumerate(products):
                 if not isinstance(product_data, dict):
@@ -165,22 +394,18 @@ class FirestoreProductService:
 
                 # Add sync metadata
                 product_data["SyncChecksum"] = self.hash_item(product_data)
-                product_data["SyncTimestamp"] = datetime.utcnow().isoformat()
+                product_data["SyncTimestamp"] = sync_timestamp()
 
-                # Add to batch
                 doc_ref = self.products_ref.document(str(product_id))
-                batch.set(doc_ref, product_data)
-                added_count += 1
-
-                # Firestore batch limit is 500 operations
-                if added_count % 500 == 0:
-                    batch.commit()
-                    batch = db.batch()
-                    print(f"📦 Committed batch of 500 products...")
+                writes.set(
+                    doc_ref, product_data, key=idx,
+                    on_success=lambda data=product_data: self._index_upsert(data),
+                )
 
-            # Commit remaining
-            if added_count % 500 != 0:
-                batch.commit()
+            writes.close()
+            added_count = writes.succeeded
+            for idx, exc in sorted(writes.failed.items()):
+                errors.append({"index": idx, "error": str(exc)})
 
             # Invalidate cache
             self.invalidate_all_product_caches()
@@ -209,19 +434,103 @@ class FirestoreProductService:
 
     def update_product(self, product_id, updates):
         doc_ref = self.products_ref.document(str(product_id))
-        doc_ref.update(updates)
-        self.cache.invalidate(product_id)
-        self.invalidate_all_product_caches()
+        doc_ref.update({**updates, "SyncTimestamp": sync_timestamp()})
 
+        # The catalog is rebuilt from the index: patch it before dropping the caches
         current_doc = doc_ref.get()
-        if current_doc.exists and not self._should_store_product(current_doc.to_dict()):
-            doc_ref.delete()
+        removed = current_doc.exists and not self._should_store_product(current_doc.to_dict())
+        try:
+            if removed:
+                self._delete_products([product_id])
+            elif current_doc.exists:
+                self._index_upsert(current_doc.to_dict())
+        finally:
             self.cache.invalidate(product_id)
             self.invalidate_all_product_caches()
+        if removed:
             return {"message": "Product removed because inactive or deleted"}
-
         return {"message": "Product updated"}
     
+    def update_products_bulk(self, items) -> List[Any]:
+        """
+        Apply many `(product_id, updates)` pairs through the shared bulk writer.
+
+        Returns one entry per item, in order: the same result dict
+        `update_product` would return, or the exception that item failed with.
+        The current documents come from the in-memory index (one get_all for
+        ids it doesn't hold), so the deletion check needs no read per item.
+        Catalog caches are invalidated once at the end.
+        """
+        items = [(str(pid), updates) for pid, updates in items]
+        results: List[Any] = [None] * len(items)
+        current = self._current_products(list(dict.fromkeys(pid for pid, _ in items)))
+
+        written = []
+        with BulkWrites(db, "update_products_bulk") as writes:
+            for position, (pid, updates) in enumerate(items):
+                doc_ref = self.products_ref.document(pid)
+                existing = current.get(pid)
+                if existing is None:
+                    # What doc_ref.update() raises for a missing document
+                    results[position] = NotFound(
+                        f"No document to update: projects/{db.project}/databases/(default)/documents/{doc_ref.path}"
+                    )
+                    continue
+                stamped = {**updates, "SyncTimestamp": sync_timestamp()}
+                writes.update(doc_ref, stamped, key=position)
+                # A later update of the same product builds on this one
+                current[pid] = {**existing, **stamped}
+                written.append((position, pid, current[pid]))
+
+        removed = []
+        for position, pid, merged in written:
+            if position in writes.failed:
+                results[position] = writes.failed[position]
+            elif not self._should_store_product(merged):
+                removed.append(pid)
+                results[position] = {"message": "Product removed because inactive or deleted"}
+            else:
+                self._index_upsert(merged)
+                results[position] = {"message": "Product updated"}
+        self._delete_products(list(dict.fromkeys(removed)))
+
+        for pid in dict.fromkeys(pid for pid, _ in items):
+            self.cache.invalidate(pid)
+        self.invalidate_all_product_caches()
+        updated = sum(1 for result in results if isinstance(result, dict))
+        print(f"✅ Bulk update: {updated}/{len(items)} sản phẩm")
+        return results
+
+    def _current_products(self, product_ids) -> Dict[str, Dict]:
+        current = {}
+        missing = []
+        for pid in product_ids:
+            product = self._index.get(pid) if self._index.loaded else None
+            if product is not None:
+                current[pid] = product
+            else:
+                missing.append(pid)
+        if missing:
+            for pid, product in zip(missing, read_documents(db, self.products_ref, missing)):
+                if product is not None:
+                    current[pid] = product
+        return current
+
+    def note_stock_updates(self, updated_products) -> None:
+        """
+        Reflect OnHand changes written outside the service (invoice checkout).
+
+        Only the per-product cache entries and the in-memory index are updated;
+        the catalog lists are not reloaded on every sale (clients get OnHand
+        through the websocket broadcast).
+        """
+        for item in updated_products or []:
+            pid = item.get("Id")
+            if pid is None:
+                continue
+            self.cache.invalidate(str(pid))
+            self._index_patch(pid, {"OnHand": item.get("new_OnHand")})
+
     def update_products(self, products_dict):
         updated = []
         removed = []
@@ -229,60 +538,246 @@ class FirestoreProductService:
         for group in products_dict.values():
             if isinstance(group, list):
                 all_products.extend(group)
-        for prod in all_products:
-            if not isinstance(prod, dict):
-                continue
-            product_id = str(prod.get("Id") or prod.get("id"))
-            if not product_id:
-                continue
-            doc_ref = self.products_ref.document(product_id)
-            if not self._should_store_product(prod):
-                doc_ref.delete()
-                removed.append(product_id)
+        with BulkWrites(db, "update_products") as writes:
+            for prod in all_products:
+                if not isinstance(prod, dict):
+                    continue
+                product_id = str(prod.get("Id") or prod.get("id"))
+                if not product_id:
+                    continue
+                doc_ref = self.products_ref.document(product_id)
+                if not self._should_store_product(prod):
+                    removed.append(product_id)
+                    self.cache.invalidate(product_id)
+                    continue
+                stored = {**prod, "SyncTimestamp": sync_timestamp()}
+                writes.set(
+                    doc_ref, stored, merge=True, key=product_id,
+                    on_success=lambda pid=product_id, data=stored: self._index_patch(pid, data),
+                )
+                updated.append(product_id)
                 self.cache.invalidate(product_id)
-                continue
-            doc_ref.set(prod, merge=True)
-            updated.append(product_id)
-            self.cache.invalidate(product_id)
+        # A product listed in several groups is written in order and reported once
+        updated = [pid for pid in dict.fromkeys(updated) if pid not in writes.failed]
+        removed = list(dict.fromkeys(removed))
+        self._delete_products(removed)
         self.invalidate_all_product_caches()
         response = {"message": f"Updated {len(updated)} products", "updated": updated}
         if removed:
             response["removed"] = removed
             response["message"] += f", removed {len(removed)} products"
+        if writes.failed:
+            response["failed"] = {pid: str(exc) for pid, exc in writes.failed.items()}
         return response
 
     def delete_product(self, product_id):
-        self.products_ref.document(str(product_id)).delete()
+        self._delete_products([product_id])
         self.cache.invalidate(product_id)
         self.invalidate_all_product_caches()
         return {"message": "Product deleted"}
+
+    def _delete_products(self, product_ids) -> None:
+        """Delete products and leave a tombstone for each, so the change feed can report the deletion."""
+        ids = list(dict.fromkeys(str(pid) for pid in product_ids if pid is not None and str(pid)))
+        if not ids:
+            return
+        with BulkWrites(db, "delete_products") as deletes:
+            for pid in ids:
+                deletes.delete(self.products_ref.document(pid), key=pid)
+        deleted = [pid for pid in ids if pid not in deletes.failed]
+        # Tombstones only for products that are really gone, stamped after the deletes
+        deleted_at = sync_timestamp()
+        with BulkWrites(db, "product_tombstones") as tombstones:
+            for pid in deleted:
+                tombstones.set(self.tombstones_ref.document(pid), tombstone(pid, deleted_at))
+        for pid in deleted:
+            self._index_remove(pid)
+        deletes.raise_first_error()
+
+    def get_product_changes(self, since: Optional[str] = None, limit: int = CHANGES_DEFAULT_LIMIT) -> Dict:
+        """
+        Products created/updated and ids deleted after the `since` watermark.
+
+        Without a watermark, or one older than the tombstone retention, the
+        whole catalog is returned with `reset=True`. `has_more=True` means the
+        page was cut at `limit`; call again with the returned watermark.
+        """
+        limit = max(1, min(int(limit or CHANGES_DEFAULT_LIMIT), CHANGES_MAX_LIMIT))
+        since = parse_watermark(since) if since else None
+        self._maybe_purge_tombstones()
+
+        if since is None or since < retention_horizon():
+            # Taken before the read: a write stamped earlier but committed later is still re-sent
+            cap = safe_watermark_cap()
+            # From Firestore: a cached catalog may predate writes stamped after its read
+            products = list(self._stream_catalog().view(include_inactive=True, include_deleted=True))
+            stamps = [p.get("SyncTimestamp") for p in products if isinstance(p.get("SyncTimestamp"), str)]
+            return {
+                "reset": True,
+                "since": since,
+                "watermark": min(max(stamps), cap) if stamps else cap,
+                "products": products,
+                "deleted": [],
+                "has_more": False,
+            }
+
+        changed = [
+            doc.to_dict() or {}
+            for doc in self.products_ref.where("SyncTimestamp", ">", since).order_by("SyncTimestamp").limit(limit).stream()
+        ]
+        tombstones = [
+            doc.to_dict() or {}
+            for doc in self.tombstones_ref.where("SyncTimestamp", ">", since).order_by("SyncTimestamp").limit(limit).stream()
+        ]
+
+        # A full page from either query cuts both at the same point so nothing is skipped
+        boundary = None
+        for page in (changed, tombstones):
+            if len(page) == limit:
+                last = page[-1]["SyncTimestamp"]
+                boundary = last if boundary is None else min(boundary, last)
+        if boundary is not None:
+            changed = [p for p in changed if p["SyncTimestamp"] <= boundary]
+            tombstones = [t for t in tombstones if t["SyncTimestamp"] <= boundary]
+            watermark = boundary
+        else:
+            latest = max([since] + [p["SyncTimestamp"] for p in changed] + [t["SyncTimestamp"] for t in tombstones])
+            watermark = max(since, min(latest, safe_watermark_cap()))
+
+        # Keep only the latest event per product (re-added after delete, or deleted after update)
+        events = {}
+        for product in changed:
+            events[str(product.get("Id") or product.get("id"))] = product
+        for tomb in tombstones:
+            pid = tomb["Id"]
+            current = events.get(pid)
+            if current is not None and current["SyncTimestamp"] >= tomb["SyncTimestamp"]:
+                continue
+            events[pid] = tomb
+
+        return {
+            "reset": False,
+            "since": since,
+            "watermark": watermark,
+            "products": [event for event in events.values() if "DeletedAt" not in event],
+            "deleted": [event["Id"] for event in events.values() if "DeletedAt" in event],
+            "has_more": boundary is not None,
+        }
+
+    # ------------------------------------------------------------------ #
+    # In-memory product index
+    # ------------------------------------------------------------------ #
+
+    def search_products(self, query: str, limit: int = SEARCH_DEFAULT_LIMIT, include_inactive: bool = False) -> List[Dict]:
+        """Diacritic-insensitive ranked search over name/Code (see ProductIndex.search)."""
+        return self._get_product_index().search(query, limit=limit, include_inactive=include_inactive)
+
+    def lookup_product_by_code(self, code: str, include_inactive: bool = False) -> Optional[Dict]:
+        """
+        Resolve a scanned barcode/Code from the in-memory index (no Firestore or KiotViet call).
+
+        For unit products the master (base unit) product is returned alongside.
+        """
+        index = self._get_product_index()
+        product = index.find_by_code(code, include_inactive=include_inactive)
+        if product is None:
+            return None
+        master_id = product.get("MasterUnitId")
+        master = index.get(master_id) if master_id not in (None, 0, "0") else None
+        return {"product": product, "master": master}
+
+    def warm_product_index(self) -> int:
+        return len(self._get_product_index())
+
+    def _get_product_index(self) -> ProductIndex:
+        index = self._index
+        if not index.loaded:
+            with self._index_lock:
+                if not index.loaded:
+                    self._sync_product_index()
+        elif time.monotonic() - index.synced_at >= PRODUCT_INDEX_SYNC_INTERVAL and self._index_lock.acquire(blocking=False):
+            # Serve the current index; pull changes from other workers/sync in the background
+            def _refresh():
+                try:
+                    self._sync_product_index()
+                except Exception as exc:
+                    print(f"⚠️ Không đồng bộ được product index: {exc}")
+                finally:
+                    self._index_lock.release()
+
+            threading.Thread(target=_refresh, name="product-index-sync", daemon=True).start()
+        return index
+
+    def _sync_product_index(self) -> None:
+        index = self._index
+        while True:
+            changes = self.get_product_changes(since=index.watermark, limit=CHANGES_MAX_LIMIT)
+            if changes["reset"]:
+                watermark = changes["watermark"]
+                if index.loaded:
+                    # The catalog is served from the index itself by now: read Firestore again
+                    catalog = self._stream_catalog()
+                    stamps = [catalog.value(position, "SyncTimestamp") for position in range(catalog.count)]
+                    stamps = [stamp for stamp in stamps if isinstance(stamp, str)]
+                    watermark = max(stamps) if stamps else watermark
+                else:
+                    # The reset came from the cached catalog; share its columns instead of copying the rows
+                    catalog = self.read_catalog()
+                index.rebuild(catalog.view(include_inactive=True, include_deleted=True), watermark)
+            else:
+                index.apply_changes(changes["products"], changes["deleted"], changes["watermark"])
+            if not changes["has_more"]:
+                break
+
+    def _index_upsert(self, product: Dict) -> None:
+        # Until the first build the index is empty; the build reads the current state anyway
+        if self._index.loaded:
+            self._index.upsert(product)
+
+    def _index_patch(self, product_id, fields: Dict) -> None:
+        if self._index.loaded:
+            self._index.patch(product_id, fields)
+
+    def _index_remove(self, product_id) -> None:
+        if self._index.loaded:
+            self._index.remove(product_id)
+
+    def _maybe_purge_tombstones(self) -> None:
+        now = time.time()
+        with self._purge_lock:
+            if now - self._tombstones_purged_at < 24 * 3600:
+                return
+            self._tombstones_purged_at = now
+
+        def _purge():
+            try:
+                horizon = retention_horizon()
+                removed = 0
+                while True:
+                    docs = list(self.tombstones_ref.where("SyncTimestamp", "<", horizon).limit(500).stream())
+                    if not docs:
+                        break
+                    with BulkWrites(db, "tombstone_purge") as writes:
+                        for doc in docs:
+                            writes.delete(doc.reference)
+                    writes.raise_first_error()
+                    removed += len(docs)
+                if removed:
+                    print(f"🧹 Đã xóa {removed} tombstone sản phẩm cũ")
+            except Exception as exc:
+                print(f"⚠️ Không dọn được tombstone sản phẩm: {exc}")
+
+        threading.Thread(target=_purge, name="tombstone-purge", daemon=True).start()
     
     def group_product(self):
         """
         Group products by Master Item (MasterUnitId=None or 0) and their Child Items.
         """
-        all_products = self.read_all_products()
-        masters = {}
-        children = []
-        for prod in all_products:
-            master_unit_id = prod.get("MasterUnitId")
-            if master_unit_id is None or master_unit_id == 0:
-                masters[str(prod.get("Id") or prod.get("id"))] = {"master": prod, "children": []}
-            else:
-                children.append(prod)
-        for child in children:
-            master_id = str(child.get("MasterUnitId"))
-            if master_id in masters:
-                masters[master_id]["children"].append(child)
-        return masters
-    
+        return self._get_product_index().grouped()
+
     def get_products_by_master(self, master_id: int) -> List[Dict]:
         """Get all products that have the given master product ID."""
-        all_products = self.read_all_products(include_inactive=True, include_deleted=True)
-        return [
-            p for p in all_products 
-            if p.get("MasterProductId") == master_id or p.get("MasterUnitId") == master_id
-        ]
+        return self._get_product_index().variants_of(master_id)
 
     def get_product_variants(self, product_id: int) -> Dict:
         """Get a product and all its variants (by unit and attributes)."""
@@ -298,59 +793,137 @@ class FirestoreProductService:
             "total": 1 + len(variants)
         }
     
-    def update_products_from_kiotviet_to_firestore(self):
+    def update_products_from_kiotviet_to_firestore(self, mode: str = "auto", progress: Optional[Callable] = None):
         """Backwards-compatible wrapper for legacy callers."""
-        return self.sync_products_from_kiotviet()
+        return self.sync_products_from_kiotviet(mode=mode, progress=progress)
 
-    def sync_products_from_kiotviet(self):
+    def get_product_sync_state(self) -> Dict:
+        snapshot = self.sync_state_ref.get()
+        return (snapshot.to_dict() or {}) if snapshot.exists else {}
+
+    @staticmethod
+    def _resolve_sync_mode(mode: str, state: Dict) -> str:
+        """
+        auto -> incremental while a watermark exists and the last full sync is
+        recent enough. Any mode runs full until the stored checksums are of the
+        current CHECKSUM_VERSION (incremental runs skip unmodified products and
+        would never migrate them).
+        """
+        if mode == "full" or not state.get("ModifiedWatermark"):
+            return "full"
+        if state.get("ChecksumVersion") != CHECKSUM_VERSION:
+            return "full"
+        if mode == "incremental":
+            return "incremental"
+        last_full = _as_naive_datetime(state.get("LastFullSyncAt"))
+        if last_full is None or datetime.utcnow() - last_full >= timedelta(seconds=PRODUCT_FULL_SYNC_INTERVAL):
+            return "full"
+        return "incremental"
+
+    @staticmethod
+    def _same_stock(product: Dict, stored: Dict) -> bool:
+        # OnHand moves with every sale without necessarily bumping ModifiedDate
+        return product.get("OnHand") == stored.get("OnHand") and product.get("OnHandNV") == stored.get("OnHandNV")
+
+    def sync_products_from_kiotviet(self, mode: str = "auto", progress: Optional[Callable] = None):
         """
         Optimized sync that:
-        1. Fetches checksums from Firestore in one go
-        2. Fetches products from KiotViet with timeout
-        3. Compares and updates only changed products
-        4.Returns stats without re-fetching all data
+        1. Fetches the stored products: every document from Firestore for a
+           full sync, the in-memory index (brought up to date) for an
+           incremental one
+        2. Fetches products from KiotViet with timeout; in incremental mode
+           products not modified since the ModifiedDate watermark (and with
+           the same stock) are dropped before any comparison
+        3. Compares and updates only changed products, writing only the changed
+           fields (diffed against the stored document from step 1) when it exists
+        4. Stores the new watermark and returns stats without re-fetching all data
+
+        mode: "full" (reconcile everything), "incremental", or "auto" (incremental,
+        with a full sync every PRODUCT_FULL_SYNC_INTERVAL seconds).
+        progress: optional `progress(**fields)` callback (stage and counters),
+        used by the background sync jobs.
         """
         import time
+        if mode not in SYNC_MODES:
+            raise ValueError(f"Invalid sync mode: {mode!r} (expected one of {', '.join(SYNC_MODES)})")
         start_time = time.time()
+        writes = None
+        report = progress or (lambda **fields: None)
 
         try:
-            print("🔄 Bắt đầu đồng bộ sản phẩm từ KiotViet (tối ưu)...")
+            report(stage="checksums")
+            state = self.get_product_sync_state()
+            mode = self._resolve_sync_mode(mode, state)
+            incremental = mode == "incremental"
+            since = None
+            if incremental:
+                since = _as_naive_datetime(state["ModifiedWatermark"]) - timedelta(seconds=SYNC_WATERMARK_OVERLAP_SECONDS)
+            print(f"🔄 Bắt đầu đồng bộ sản phẩm từ KiotViet ({mode})...")
+            report(mode=mode)
 
-            # Step 1: Fetch checksums from Firestore (fast, minimal data)
-            print("  📥 Lấy checksums từ Firestore...")
             checksum_start = time.time()
-            existing_checksums = {}
-            existing_ids = set()
-
-            for doc in self.products_ref.select(["SyncChecksum"]).stream():
-                data = doc.to_dict() or {}
-                existing_checksums[doc.id] = data.get("SyncChecksum")
-                existing_ids.add(doc.id)
+            # Full sync: the documents as read now, not the index (which may lag
+            # behind other workers or come from an old catalog snapshot)
+            existing: Dict[str, Dict] = {}
+            if incremental:
+                # Step 1: the index is the local checksum index; just bring it up to date
+                print(f"  📥 Cập nhật index sản phẩm (sửa sau {since.isoformat()})...")
+                self._get_product_index()
+                with self._index_lock:
+                    self._sync_product_index()
+            else:
+                # Step 1: Read every stored product from Firestore
+                print("  📥 Lấy sản phẩm hiện có từ Firestore...")
+                for doc in self.products_ref.stream():
+                    existing[doc.id] = doc.to_dict() or {}
 
             checksum_time = time.time() - checksum_start
-            print(f"  ✅ Đã lấy {len(existing_checksums)} checksums trong {checksum_time:.2f}s")
-
-            # Step 2: Fetch products from KiotViet API
-            print("  📥 Lấy sản phẩm từ KiotViet API...")
-            api_start = time.time()
-            api_items = self.fetch_api_items()
-            api_time = time.time() - api_start
-            print(f"  ✅ Đã lấy {len(api_items)} sản phẩm từ KiotViet trong {api_time:.2f}s")
-
-            # Step 3: Compare and prepare updates
-            print("  🔍 So sánh và chuẩn bị cập nhật...")
-            compare_start = time.time()
-            to_upsert = []
+            print(f"  ✅ Đã lấy {len(existing) if not incremental else len(self._index)} sản phẩm hiện có trong {checksum_time:.2f}s")
+
+            # Step 2-4: Stream products from KiotViet, compare each as it arrives and
+            # write changes in batches as they fill, so memory stays flat
+            print("  📥 Lấy sản phẩm từ KiotViet API và so sánh...")
+            index = self._get_product_index()
+            api_count = 0
+            upserted_count = 0
             active_ids: Set[str] = set()
             deleted_count = 0
             inactive_count = 0
             unchanged_count = 0
-
-            for item in api_items:
-                product_dict = item.__dict__ if hasattr(item, "__dict__") else dict(item)
+            fields_written = 0
+            stock_only_count = 0
+            checksum_only_count = 0
+            skipped_unmodified = 0
+            newest_modified = None
+            api_time = compare_time = update_time = 0.0
+            # Writes go out in the background while the stream is still being compared
+            writes = BulkWrites(db, "kiotviet_product_sync")
+
+            def _written(doc_id, payload):
+                self.cache.invalidate(doc_id)
+                self._index_patch(doc_id, payload)
+
+            def _write(doc_id, payload, is_update):
+                doc_ref = self.products_ref.document(doc_id)
+                on_success = lambda: _written(doc_id, payload)
+                if is_update:
+                    writes.update(doc_ref, payload, key=doc_id, on_success=on_success)
+                else:
+                    writes.set(doc_ref, payload, merge=True, key=doc_id, on_success=on_success)
+
+            report(stage="compare", processed=0, changed=0, written=0)
+            items = self.iter_api_items(modified_since=since)
+            while True:
+                fetch_start = time.time()
+                product_dict = next(items, None)
+                api_time += time.time() - fetch_start
+                if product_dict is None:
+                    break
+                api_count += 1
+                if api_count % SYNC_PROGRESS_EVERY == 0:
+                    report(processed=api_count, changed=upserted_count, written=writes.succeeded)
+                compare_start = time.time()
                 doc_id = str(product_dict.get("Id"))
-                if not doc_id:
-                    continue
 
                 # Determine flags from API
                 is_deleted = self._coerce_bool(product_dict.get("isDeleted"), False)
@@ -365,74 +938,107 @@ class FirestoreProductService:
                 # Keep track of ids present in API
                 active_ids.add(doc_id)
 
+                modified = _as_naive_datetime(product_dict.get("ModifiedDate") or product_dict.get("CreatedDate"))
+                if modified is not None and (newest_modified is None or modified > newest_modified):
+                    newest_modified = modified
+                if incremental:
+                    stored = index.get(doc_id)
+                    if stored is not None and not self.is_newer(modified, since) and self._same_stock(product_dict, stored):
+                        unchanged_count += 1
+                        skipped_unmodified += 1
+                        compare_time += time.time() - compare_start
+                        continue
+                else:
+                    stored = existing.get(doc_id)
+                stored_checksum = stored.get("SyncChecksum") if stored is not None else None
+
                 # Check if changed
-                checksum = self.hash_item(product_dict)
-                if existing_checksums.get(doc_id) == checksum:
+                self._mark_sync_flags(product_dict)
+                item_prints = fingerprints(product_dict)
+                item_checksum = checksum(item_prints)
+                if stored_checksum == item_checksum:
                     unchanged_count += 1
+                    compare_time += time.time() - compare_start
                     continue
 
-                # Prepare payload to store in Firestore
-                product_to_store = dict(product_dict)
-                product_to_store["SyncChecksum"] = checksum
-                product_to_store["SyncTimestamp"] = datetime.utcnow().isoformat()
-                if not is_active:
-                    product_to_store["StoreForIndexedDB"] = True
-                if is_deleted:
-                    product_to_store["KiotVietDeleted"] = True
-
-                to_upsert.append((doc_id, product_to_store))
-
-            compare_time = time.time() - compare_start
-            print(f"  ✅ So sánh hoàn tất trong {compare_time:.2f}s: {len(to_upsert)} cần cập nhật, {unchanged_count} không đổi")
-
-            # Step 4: Batch update to Firestore
-            update_time = 0
-            if to_upsert:
-                print(f"  📤 Cập nhật {len(to_upsert)} sản phẩm lên Firestore...")
-                update_start = time.time()
-                BATCH_SIZE = 500
-                batch_count = 0
-
-                for i in range(0, len(to_upsert), BATCH_SIZE):
-                    batch = db.batch()
-                    for doc_id, payload in to_upsert[i : i + BATCH_SIZE]:
-                        doc_ref = self.products_ref.document(doc_id)
-                        batch.set(doc_ref, payload, merge=True)
-                    batch.commit()
-                    batch_count += 1
-                    if batch_count % 5 == 0:
-                        print(f"    Đã ghi {batch_count * BATCH_SIZE} sản phẩm...")
-
-                update_time = time.time() - update_start
-                print(f"  ✅ Cập nhật hoàn tất trong {update_time:.2f}s ({batch_count} batches)")
-            else:
-                print("  ℹ️ Không có sản phẩm nào cần cập nhật")
+                if stored is None:
+                    # New product (or not in the index yet): write the whole document
+                    payload = {**product_dict, "SyncChecksum": item_checksum, "SyncTimestamp": sync_timestamp()}
+                    _write(doc_id, payload, False)
+                    fields_written += len(product_dict)
+                else:
+                    changed = changed_fields(item_prints, stored)
+                    payload = {field: product_dict[field] for field in changed}
+                    payload["SyncChecksum"] = item_checksum
+                    if changed:
+                        # Only real changes show up in the change feed
+                        payload["SyncTimestamp"] = sync_timestamp()
+                        if set(changed) <= {"OnHand", "OnHandNV", "ModifiedDate"}:
+                            stock_only_count += 1
+                    else:
+                        # Same values, checksum from an older format: store the new checksum only
+                        unchanged_count += 1
+                        checksum_only_count += 1
+                    fields_written += len(changed)
+                    _write(doc_id, payload, True)
+                upserted_count += 1
+                compare_time += time.time() - compare_start
+
+            report(stage="writing", processed=api_count, changed=upserted_count, written=writes.succeeded)
+            update_start = time.time()
+            writes.close()
+            update_time = time.time() - update_start
+            report(stage="finishing", written=writes.succeeded, write_errors=len(writes.failed))
+
+            print(f"  ✅ Đã xử lý {api_count} sản phẩm từ KiotViet ({api_time:.2f}s tải, {compare_time:.2f}s so sánh, "
+                  f"{update_time:.2f}s chờ ghi {writes.succeeded} sản phẩm)")
 
             # Step 5: Invalidate cache
             print("  🗑️ Xóa cache...")
             self.invalidate_all_product_caches()
-            for doc_id, _ in to_upsert:
-                self.cache.invalidate(doc_id)
+
+            # Step 6: Advance the watermark only when every change was written
+            watermark = state.get("ModifiedWatermark")
+            if writes.failed:
+                print("  ⚠️ Có lượt ghi lỗi, giữ nguyên watermark để lần sau đồng bộ lại")
+            else:
+                previous = _as_naive_datetime(watermark)
+                if newest_modified is not None and (previous is None or newest_modified > previous):
+                    watermark = newest_modified.isoformat()
+                now = sync_timestamp()
+                sync_state = {"ModifiedWatermark": watermark, "LastSyncAt": now, "LastMode": mode}
+                if not incremental:
+                    sync_state["LastFullSyncAt"] = now
+                    sync_state["ChecksumVersion"] = CHECKSUM_VERSION
+                self.sync_state_ref.set(sync_state, merge=True)
 
             total_time = time.time() - start_time
 
             print(f"\n✅ Đồng bộ hoàn tất trong {total_time:.2f}s:")
-            print(f"   - Tổng sản phẩm từ KiotViet: {len(api_items)}")
-            print(f"   - Cập nhật/thêm mới: {len(to_upsert)}")
-            print(f"   - Không thay đổi: {unchanged_count}")
+            print(f"   - Tổng sản phẩm từ KiotViet: {api_count}")
+            print(f"   - Cập nhật/thêm mới: {upserted_count - checksum_only_count} ({fields_written} trường, {stock_only_count} chỉ đổi tồn kho)")
+            print(f"   - Không thay đổi: {unchanged_count} ({skipped_unmodified} bỏ qua theo watermark)")
             print(f"   - Inactive: {inactive_count}")
             print(f"   - Deleted: {deleted_count}")
+            if writes.failed:
+                print(f"   - Ghi lỗi: {len(writes.failed)}")
 
             return {
                 "success": True,
                 "message": "Đồng bộ thành công",
                 "version": "optimized_v2",
+                "mode": mode,
+                "watermark": watermark,
                 "stats": {
-                    "total_api_items": len(api_items),
-                    "updated_or_created": len(to_upsert),
+                    "total_api_items": api_count,
+                    "updated_or_created": upserted_count - checksum_only_count,
+                    "fields_written": fields_written,
+                    "stock_only": stock_only_count,
                     "unchanged": unchanged_count,
+                    "skipped_unmodified": skipped_unmodified,
                     "inactive_included": inactive_count,
                     "deleted_included": deleted_count,
+                    "write_errors": len(writes.failed),
                     "total_time_seconds": round(total_time, 2),
                     "breakdown": {
                         "checksum_fetch": round(checksum_time, 2),
@@ -445,6 +1051,9 @@ class FirestoreProductService:
         except Exception as exc:
             import traceback
             error_trace = traceback.format_exc()
+            if writes is not None:
+                # Changes already compared are still written
+                writes.close()
             print(f"❌ Lỗi khi đồng bộ sản phẩm từ KiotViet: {exc}")
             print(error_trace)
             return {
@@ -469,22 +1078,57 @@ class FirestoreProductService:
         print(f"Đã tải {len(firestore_items)} sản phẩm từ Firestore.")
         return firestore_items
 
-    def fetch_api_items(self):
+    def fetch_api_items(self) -> List[Product]:
+        """All KiotViet products as Product objects (see iter_api_items for the streaming form)."""
+        return [Product(**item) for item in self.iter_api_items()]
+
+    def iter_api_items(self, modified_since: Optional[datetime] = None):
+        """
+        Yield KiotViet products one by one as Product-shaped dicts.
+
+        The single 20k request is parsed incrementally, so items are handed
+        out while the payload is still downloading. If it turns out to be
+        truncated, the remaining products come from the paginated API
+        (products already yielded are skipped).
+
+        `modified_since` is passed to KiotViet only when
+        KIOTVIET_MODIFIED_SINCE_PARAM is configured; callers filter anyway.
+        """
+        filters = {}
+        if modified_since is not None and KIOTVIET_MODIFIED_SINCE_PARAM:
+            filters[KIOTVIET_MODIFIED_SINCE_PARAM] = modified_since.isoformat()
+        seen_ids: Set[str] = set()
         print("Đang gọi API đồng bộ sản phẩm (single fetch)...")
-        single_batch = self._fetch_single_batch()
-        if single_batch is not None:
-            print(f"Đã nhận {len(single_batch)} sản phẩm từ API (single batch).")
-            return [Product.from_dict(item) for item in single_batch]
+        complete = yield from self._iter_single_batch(seen_ids, filters)
+        if complete:
+            print(f"Đã nhận {len(seen_ids)} sản phẩm từ API (single batch).")
+            return
 
         print("Single batch không đủ, chuyển sang phân trang...")
-        return self._fetch_paginated_items()
+        yield from self._iter_paginated_items(seen_ids, filters)
+
+    @staticmethod
+    def _coerce_api_item(item) -> Optional[Dict]:
+        """Raw KiotViet item -> Product-shaped dict (None if it has no Id)."""
+        if not isinstance(item, dict):
+            return None
+        try:
+            return Product.from_dict(item).__dict__
+        except KeyError:
+            return None
+
+    def _iter_single_batch(self, seen_ids: Set[str], filters: Optional[Dict] = None):
+        """
+        Stream all products in a single request with retry logic.
 
-    def _fetch_single_batch(self) -> Optional[List[dict]]:
-        """Fetch all products in a single batch with retry logic."""
+        Yields new products and returns True when the response held the whole
+        catalog, False when it was truncated.
+        """
         params = {
             "clientId": API_CLIENT_ID,
             "resourceName": API_RESOURCE,
             "pageSize": API_SINGLE_FETCH_LIMIT,
+            **(filters or {}),
         }
 
         max_retries = 3
@@ -492,99 +1136,54 @@ class FirestoreProductService:
 
         for attempt in range(max_retries):
             try:
-                response = requests.get(
+                with requests.get(
                     API_BASE_URL,
                     params=params,
-                    headers=API_HEADERS,
-                    timeout=90
-                )
-                response.raise_for_status()
-                payload = response.json() or {}
-                items = payload.get("Data", []) or []
-
-                total = payload.get("Total") or payload.get("total")
-                if total and total > len(items):
-                    return None
-                if len(items) >= API_SINGLE_FETCH_LIMIT:
-                    return None
-                return items
+                    headers=_api_headers(),
+                    timeout=90,
+                    stream=True,
+                ) as response:
+                    response.raise_for_status()
+                    stream = JsonArrayStream(response.iter_content(chunk_size=API_STREAM_CHUNK_SIZE), "Data")
+                    received = 0
+                    for item in stream:
+                        received += 1
+                        product = self._coerce_api_item(item)
+                        if product is None or str(product["Id"]) in seen_ids:
+                            continue
+                        seen_ids.add(str(product["Id"]))
+                        yield product
+
+                total = stream.meta.get("Total") or stream.meta.get("total")
+                if total and total > received:
+                    return False
+                return received < API_SINGLE_FETCH_LIMIT
 
             except requests.exceptions.Timeout:
                 print(f"⚠️ Timeout khi fetch single batch (lần {attempt + 1}/{max_retries})")
                 if attempt < max_retries - 1:
-                    import time
                     time.sleep(retry_delay)
                     continue
                 raise
 
-            except requests.exceptions.RequestException as e:
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # ValueError: the body was cut off or is not the expected JSON
                 print(f"⚠️ Lỗi khi fetch single batch (lần {attempt + 1}/{max_retries}): {e}")
                 if attempt < max_retries - 1:
-                    import time
                     time.sleep(retry_delay)
                     continue
                 raise
 
-        return None
+        return False
 
-    def _fetch_paginated_items(self) -> List[Product]:
-        """Fetch products with pagination and retry logic."""
-        import time
-        products: List[Product] = []
-        page_index = 0
+    def _iter_paginated_items(self, seen_ids: Set[str], filters: Optional[Dict] = None):
+        """Yield products page by page, skipping ids already in `seen_ids`."""
         total_returned = 0
-        seen_ids: Set[str] = set()
         duplicate_pages = 0
         MAX_DUPLICATE_PAGES = 3
-        max_retries = 3
-        retry_delay = 2
-
-        while True:
-            params = {
-                "clientId": API_CLIENT_ID,
-                "resourceName": API_RESOURCE,
-                "pageSize": API_PAGE_SIZE,
-                "pageIndex": page_index,
-            }
-
-            page_fetched = False
-            for attempt in range(max_retries):
-                try:
-                    response = requests.get(
-                        API_BASE_URL,
-                        params=params,
-                        headers=API_HEADERS,
-                        timeout=45
-                    )
-                    response.raise_for_status()
-                    payload = response.json() or {}
-                    items = payload.get("Data", [])
-                    page_fetched = True
-                    break
-
-                except requests.exceptions.Timeout:
-                    print(f"⚠️ Timeout khi fetch trang {page_index} (lần {attempt + 1}/{max_retries})")
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        continue
-                    else:
-                        print(f"❌ Không thể fetch trang {page_index} sau {max_retries} lần thử")
-                        items = []
-                        page_fetched = True
-                        break
-
-                except requests.exceptions.RequestException as e:
-                    print(f"⚠️ Lỗi khi fetch trang {page_index} (lần {attempt + 1}/{max_retries}): {e}")
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                        continue
-                    else:
-                        print(f"❌ Không thể fetch trang {page_index} sau {max_retries} lần thử")
-                        items = []
-                        page_fetched = True
-                        break
 
-            if not page_fetched or not items:
+        for page_index, items in self._iter_pages(filters):
+            if not items:
                 break
 
             unique_items = []
@@ -604,31 +1203,114 @@ class FirestoreProductService:
                 if duplicate_pages >= MAX_DUPLICATE_PAGES:
                     print("  Đã gặp quá nhiều trang trùng lặp, dừng phân trang.")
                     break
-                page_index += 1
                 continue
 
             duplicate_pages = 0
 
+            batch_products = [self._coerce_api_item(item) for item in unique_items]
+            batch_products = [product for product in batch_products if product is not None]
+            total_returned += len(batch_products)
+            print(f"  Đã nhận {len(batch_products)} sản phẩm mới ở trang {page_index} (tổng {total_returned}).")
+            yield from batch_products
+
+        print(f"Đã nhận tổng cộng {total_returned} sản phẩm từ API (phân trang).")
+
+    def _iter_pages(self, filters: Optional[Dict] = None):
+        """
+        Yield (page_index, items) in page order, stopping after the last page.
+
+        Page 0 tells the catalog size (`Total`); the remaining pages are then
+        fetched concurrently by up to KIOTVIET_FETCH_WORKERS threads, a bounded
+        window ahead of the consumer. Without a Total, or if the catalog grew
+        past it, pages are fetched one at a time.
+        """
+        items, total = self._fetch_page(0, filters)
+        yield 0, items
+        if not items or len(items) < API_PAGE_SIZE:
+            return
+
+        next_page = 1
+        try:
+            total = int(total or 0)
+        except (TypeError, ValueError):
+            total = 0
+        if total > API_PAGE_SIZE:
+            page_count = -(-total // API_PAGE_SIZE)
+            pages = iter(range(1, page_count))
+            window = deque()
+            pool = ThreadPoolExecutor(max_workers=KIOTVIET_FETCH_WORKERS, thread_name_prefix="kiotviet-page")
+
+            def _submit():
+                page = next(pages, None)
+                if page is not None:
+                    window.append((page, pool.submit(self._fetch_page, page, filters)))
+
             try:
-                batch_products = [Product.from_dict(item) for item in unique_items]
-            except KeyError as exc:
-                missing_key = str(exc)
-                print(f"Thiếu khóa {missing_key} trong dữ liệu trang {page_index}, bỏ qua")
-                page_index += 1
-                continue
+                for _ in range(KIOTVIET_FETCH_WORKERS * 2):
+                    _submit()
+                while window:
+                    page, future = window.popleft()
+                    items, _ = future.result()
+                    _submit()
+                    yield page, items
+                    next_page = page + 1
+                    if not items or len(items) < API_PAGE_SIZE:
+                        return
+            finally:
+                # The consumer may stop early (last page, duplicate guard): drop queued pages
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        page = next_page
+        while True:
+            items, _ = self._fetch_page(page, filters)
+            yield page, items
+            if not items or len(items) < API_PAGE_SIZE:
+                return
+            page += 1
 
-            products.extend(batch_products)
-            total_returned += len(batch_products)
+    def _fetch_page(self, page_index: int, filters: Optional[Dict] = None):
+        """
+        One page of the paginated API with retries: (items, Total).
 
-            print(f"  Đã nhận {len(batch_products)} sản phẩm mới ở trang {page_index} (tổng {total_returned}).")
+        Raises the last error once every attempt failed, so a sync never takes
+        a missing page for the end of the catalog.
+        """
+        params = {
+            "clientId": API_CLIENT_ID,
+            "resourceName": API_RESOURCE,
+            "pageSize": API_PAGE_SIZE,
+            "pageIndex": page_index,
+            **(filters or {}),
+        }
+        max_retries = 3
+        retry_delay = 2
 
-            if len(items) < API_PAGE_SIZE:
-                break
+        for attempt in range(max_retries):
+            try:
+                response = requests.get(
+                    API_BASE_URL,
+                    params=params,
+                    headers=_api_headers(),
+                    timeout=45
+                )
+                response.raise_for_status()
+                payload = response.json() or {}
+                return payload.get("Data", []) or [], payload.get("Total") or payload.get("total")
 
-            page_index += 1
+            except requests.exceptions.Timeout:
+                print(f"⚠️ Timeout khi fetch trang {page_index} (lần {attempt + 1}/{max_retries})")
+                if attempt < max_retries - 1:
+                    time.sleep(retry_delay)
+                    continue
+                raise
 
-        print(f"Đã nhận tổng cộng {len(products)} sản phẩm từ API (phân trang).")
-        return products
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # ValueError: the body is not the expected JSON
+                print(f"⚠️ Lỗi khi fetch trang {page_index} (lần {attempt + 1}/{max_retries}): {e}")
+                if attempt < max_retries - 1:
+                    time.sleep(retry_delay)
+                    continue
+                raise
     
     def update_changed_items(self, api_items, firestore_items):
         changed_items = []
@@ -653,34 +1335,39 @@ class FirestoreProductService:
         print(f"Phát hiện {len(changed_items)} sản phẩm thay đổi. Đang cập nhật...")
         print(f"Phát hiện {len(deleted_items)} sản phẩm cần xóa khỏi Firestore.")
     
-        BATCH_SIZE = 500
-        for i in range(0, len(changed_items), BATCH_SIZE):
-            batch = db.batch()
-            for item in changed_items[i:i + BATCH_SIZE]:
+        with BulkWrites(db, "update_changed_items") as writes:
+            for item in changed_items:
                 doc_ref = self.products_ref.document(str(item['Id']))
-                batch.set(doc_ref, item, merge=True)
-            batch.commit()
-            print(f"Đã cập nhật batch {i // BATCH_SIZE + 1}")
+                stored = {**item, "SyncTimestamp": sync_timestamp()}
+                writes.set(
+                    doc_ref, stored, merge=True,
+                    on_success=lambda pid=item['Id'], data=stored: self._index_patch(pid, data),
+                )
+        print(f"Đã cập nhật {writes.succeeded} sản phẩm")
     
-        for i in range(0, len(deleted_items), BATCH_SIZE):
-            batch = db.batch()
-            for item_id in deleted_items[i:i + BATCH_SIZE]:
-                doc_ref = self.products_ref.document(str(item_id))
-                batch.delete(doc_ref)
-            batch.commit()
-            print(f"Đã xóa batch {i // BATCH_SIZE + 1}")
+        self._delete_products(deleted_items)
+        print(f"Đã xóa {len(deleted_items)} sản phẩm")
+        # A failed write fails the sync, as the batch commit() used to
+        writes.raise_first_error()
     
         print("Đã hoàn tất cập nhật và xóa.")
 
     def hash_item(self, item):
-        def default_serializer(obj):
-            if hasattr(obj, "isoformat"):
-                return obj.isoformat()
-            raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
-        item_copy = dict(item)
-        item_copy.pop("SyncChecksum", None)
-        item_copy.pop("SyncTimestamp", None)
-        return hashlib.md5(json.dumps(item_copy, sort_keys=True, default=default_serializer).encode()).hexdigest()
+        """SyncChecksum of a product (SyncChecksum/SyncTimestamp themselves excluded)."""
+        return checksum(fingerprints(item))
+
+    @classmethod
+    def _mark_sync_flags(cls, product: Dict) -> Dict:
+        """Flags the sync stores on inactive / deleted KiotViet products."""
+        if not cls._coerce_bool(product.get("isActive"), True):
+            product["StoreForIndexedDB"] = True
+        if cls._coerce_bool(product.get("isDeleted"), False):
+            product["KiotVietDeleted"] = True
+        return product
+
+    def hash_api_item(self, item):
+        """SyncChecksum the sync would store for a KiotViet product."""
+        return self.hash_item(self._mark_sync_flags(dict(item)))
 
     @staticmethod
     def is_newer(api_mod, fs_mod):
@@ -689,7 +1376,7 @@ class FirestoreProductService:
                 return False
             if not fs_mod:
                 return True
-            return parse_date(api_mod) > parse_date(fs_mod)
+            return _as_naive_datetime(api_mod) > _as_naive_datetime(fs_mod)
         except Exception:
             return False
 
@@ -697,36 +1384,12 @@ class FirestoreProductService:
         """Đọc TẤT CẢ products trực tiếp từ Firestore, KHÔNG dùng cache."""
         print(f"🔄 read_all_products_fresh (include_inactive={include_inactive}, include_deleted={include_deleted})")
 
-        docs = self.products_ref.stream()
-        result = []
-
-        for doc in docs:
-            data = doc.to_dict() or {}
-
-            is_active = self._coerce_bool(data.get("isActive"), True)
-            is_deleted = self._coerce_bool(data.get("isDeleted"), False)
-
-            if (not include_inactive) and (not is_active):
-                continue
-            if (not include_deleted) and is_deleted:
-                continue
-
-            result.append(dict(data))
+        # Neither the cached catalog nor the index: a throwaway copy of what Firestore holds now
+        result = list(self._stream_catalog().view(include_inactive, include_deleted))
 
         print(f"✅ Fetched {len(result)} products from Firestore (fresh)")
         return result
 
     def invalidate_all_product_caches(self):
-        """Invalidate tất cả các cache keys liên quan đến products"""
-        cache_keys_to_invalidate = [
-            "all_products",
-            "all_products:inactive=False:deleted=False",
-            "all_products:inactive=True:deleted=False",
-            "all_products:inactive=False:deleted=True",
-            "all_products:inactive=True:deleted=True",
-        ]
-
-        for key in cache_keys_to_invalidate:
-            self.cache.invalidate(key)
-
-        print(f"🗑️ Invalidated {len(cache_keys_to_invalidate)} product cache keys")
\ No newline at end of file
+        """Invalidate mọi view dẫn xuất từ catalog (catalog, ...)."""
+        self.cache.invalidate_tag(PRODUCTS_TAG)
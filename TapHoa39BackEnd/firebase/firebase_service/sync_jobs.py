@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Số job đã xong giữ lại để tra cứu trạng thái
+SYNC_JOB_HISTORY = int(os.getenv("SYNC_JOB_HISTORY", "50"))
+
+
+class SyncJobRunner:
+    """
+    Run KiotViet sync jobs (products, customers...) in background threads.
+
+    `submit(kind)` returns at once with the job record. A trigger for a kind
+    that already has a job running joins that job instead of starting a second
+    sync. Each job callable receives a `progress(**fields)` callback; progress,
+    the final result (with its `stats.breakdown` timings) and errors are
+    exposed through `get()` until SYNC_JOB_HISTORY newer jobs have finished.
+    """
+
+    def __init__(self, jobs: Dict[str, Callable[..., object]]):
+        self._jobs = dict(jobs)
+        self._lock = threading.Lock()
+        self._running: Dict[str, dict] = {}
+        self._history: "OrderedDict[str, dict]" = OrderedDict()
+        self._finished: Dict[str, threading.Event] = {}
+
+    @property
+    def kinds(self) -> Tuple[str, ...]:
+        return tuple(self._jobs)
+
+    def submit(self, kind: str, **params) -> Tuple[dict, bool]:
+        """Start a `kind` job, or join the running one. Returns (job, started)."""
+        if kind not in self._jobs:
+            raise ValueError(f"Unknown sync job: {kind!r} (expected one of {', '.join(self._jobs)})")
+        with self._lock:
+            job = self._running.get(kind)
+            if job is not None:
+                job["coalesced"] += 1
+                return self._snapshot(job), False
+            job = {
+                "id": uuid.uuid4().hex,
+                "kind": kind,
+                "params": params,
+                "status": "running",
+                "created_at": time.time(),
+                "finished_at": None,
+                "progress": {},
+                "result": None,
+                "error": None,
+                "coalesced": 0,
+            }
+            self._running[kind] = job
+            self._history[job["id"]] = job
+            self._finished[job["id"]] = threading.Event()
+            self._trim_locked()
+        threading.Thread(target=self._run, args=(job,), name=f"sync-{kind}", daemon=True).start()
+        return self._snapshot(job), True
+
+    def _run(self, job: dict) -> None:
+        print(f"🔄 Sync job {job['kind']} ({job['id'][:8]}) bắt đầu")
+
+        def _progress(**fields):
+            with self._lock:
+                job["progress"].update(fields)
+
+        try:
+            result = self._jobs[job["kind"]](progress=_progress, **job["params"])
+            failed = isinstance(result, dict) and result.get("success") is False
+            outcome = {"status": "failed" if failed else "succeeded", "result": result}
+            if failed:
+                outcome["error"] = result.get("error") or result.get("message")
+        except Exception as exc:
+            outcome = {"status": "failed", "error": str(exc)}
+        with self._lock:
+            job.update(outcome)
+            job["finished_at"] = time.time()
+            self._running.pop(job["kind"], None)
+            event = self._finished.get(job["id"])
+        if event is not None:
+            event.set()
+        elapsed = job["finished_at"] - job["created_at"]
+        icon = "✅" if job["status"] == "succeeded" else "❌"
+        print(f"{icon} Sync job {job['kind']} ({job['id'][:8]}) {job['status']} sau {elapsed:.1f}s")
+
+    def _trim_locked(self) -> None:
+        finished = [job_id for job_id, job in self._history.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(0, len(finished) - SYNC_JOB_HISTORY)]:
+            del self._history[job_id]
+            self._finished.pop(job_id, None)
+
+    @staticmethod
+    def _snapshot(job: dict) -> dict:
+        snapshot = dict(job)
+        snapshot["progress"] = dict(job["progress"])
+        end = job["finished_at"] or time.time()
+        snapshot["elapsed_seconds"] = round(end - job["created_at"], 2)
+        return snapshot
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        """Block until the job finishes (or `timeout`); returns its current state."""
+        with self._lock:
+            event = self._finished.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._history.get(job_id)
+            return self._snapshot(job) if job is not None else None
+
+    def list(self, kind: Optional[str] = None) -> List[dict]:
+        """Known jobs, newest first."""
+        with self._lock:
+            jobs = [self._snapshot(job) for job in reversed(self._history.values())]
+        return [job for job in jobs if kind is None or job["kind"] == kind]
+
+    def running(self, kind: str) -> Optional[dict]:
+        with self._lock:
+            job = self._running.get(kind)
+            return self._snapshot(job) if job is not None else None
@@ -0,0 +1,223 @@
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Optional
+
+from google.cloud import firestore
+
+# Lịch đồng bộ nền (tắt bằng SYNC_SCHEDULER_ENABLED=0)
+SYNC_SCHEDULER_ENABLED = os.getenv("SYNC_SCHEDULER_ENABLED", "1") not in ("0", "false", "False")
+PRODUCT_SYNC_INTERVAL_MINUTES = float(os.getenv("PRODUCT_SYNC_INTERVAL_MINUTES", "10"))
+CUSTOMER_SYNC_INTERVAL_MINUTES = float(os.getenv("CUSTOMER_SYNC_INTERVAL_MINUTES", "60"))
+# Mỗi lần chạy lệch ngẫu nhiên thêm tối đa tỉ lệ này của chu kỳ
+SYNC_SCHEDULER_JITTER = float(os.getenv("SYNC_SCHEDULER_JITTER", "0.1"))
+SYNC_SCHEDULER_TICK_SECONDS = float(os.getenv("SYNC_SCHEDULER_TICK_SECONDS", "30"))
+# Lỗi liên tiếp nhân đôi chu kỳ, tối đa tới mức này
+SYNC_SCHEDULER_MAX_BACKOFF_MINUTES = float(os.getenv("SYNC_SCHEDULER_MAX_BACKOFF_MINUTES", "120"))
+SYNC_SCHEDULER_HISTORY = 20
+
+
+@firestore.transactional
+def _claim_lease(transaction, lease_ref, owner: str, ttl: float):
+    snapshot = lease_ref.get(transaction=transaction)
+    state = (snapshot.to_dict() or {}) if snapshot.exists else {}
+    now = time.time()
+    if state.get("owner") not in (None, owner) and (state.get("expires_at") or 0) > now:
+        return False, state
+    transaction.set(lease_ref, {"owner": owner, "expires_at": now + ttl, "renewed_at": now}, merge=True)
+    return True, state
+
+
+class FirestoreLease:
+    """
+    Leader lease in one Firestore document, so only one worker (across
+    processes and hosts) runs the scheduled syncs. The holder renews it every
+    tick; if it dies, another worker takes over once `ttl` has passed.
+    """
+
+    def __init__(self, client, lease_ref, ttl: float):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._client = client
+        self._ref = lease_ref
+        self._ttl = ttl
+
+    def claim(self):
+        """(is_leader, lease document before the claim)."""
+        return _claim_lease(self._client.transaction(), self._ref, self.owner, self._ttl)
+
+    def note_started(self, kind: str, started_at: float) -> None:
+        # Lets a worker that takes over keep the cadence instead of syncing at once
+        self._ref.set({"last_started": {kind: started_at}}, merge=True)
+
+
+class SyncScheduler:
+    """
+    Run background sync jobs on a fixed cadence (with jitter).
+
+    Jobs go through the SyncJobRunner, so a scheduled run and a manual trigger
+    never overlap: a run that comes due while the same kind is still running is
+    skipped. Failed runs push the next one back exponentially (capped at
+    SYNC_SCHEDULER_MAX_BACKOFF_MINUTES). Per-kind run history and counters are
+    reported by `status()`.
+    """
+
+    def __init__(self, sync_jobs, schedules: Dict[str, dict], lease: Optional[FirestoreLease] = None):
+        # schedules: kind -> {"interval": seconds, "params": {...}}
+        self._jobs = sync_jobs
+        self._schedules = {kind: dict(schedule) for kind, schedule in schedules.items()}
+        self._lease = lease
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._leader = False
+        self._state = {
+            kind: {
+                "interval_seconds": schedule["interval"],
+                "next_run_at": None,
+                "job_id": None,
+                "runs": 0,
+                "succeeded": 0,
+                "failed": 0,
+                "skipped": 0,
+                "consecutive_failures": 0,
+                "total_seconds": 0.0,
+                "last_status": None,
+                "last_error": None,
+                "history": deque(maxlen=SYNC_SCHEDULER_HISTORY),
+            }
+            for kind, schedule in self._schedules.items()
+        }
+
+    def start(self) -> "SyncScheduler":
+        with self._lock:
+            if self._thread is not None:
+                return self
+            self._thread = threading.Thread(target=self._loop, name="sync-scheduler", daemon=True)
+        cadence = ", ".join(f"{kind} mỗi {schedule['interval'] / 60:g} phút" for kind, schedule in self._schedules.items())
+        print(f"⏰ Lịch đồng bộ: {cadence}")
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self._tick()
+            except Exception as exc:
+                print(f"⚠️ Lịch đồng bộ lỗi: {exc}")
+            if self._stop.wait(SYNC_SCHEDULER_TICK_SECONDS):
+                return
+
+    def _next_run(self, kind: str, now: float) -> float:
+        state = self._state[kind]
+        delay = state["interval_seconds"] * (2 ** min(state["consecutive_failures"], 16))
+        delay = min(delay, max(state["interval_seconds"], SYNC_SCHEDULER_MAX_BACKOFF_MINUTES * 60))
+        return now + delay + random.uniform(0, SYNC_SCHEDULER_JITTER * state["interval_seconds"])
+
+    def _tick(self) -> None:
+        if self._lease is not None:
+            try:
+                leader, lease_state = self._lease.claim()
+            except Exception as exc:
+                print(f"⚠️ Không lấy được lease lịch đồng bộ: {exc}")
+                leader, lease_state = False, {}
+            became_leader = leader and not self._leader
+            self._leader = leader
+            if not leader:
+                return
+            if became_leader:
+                self._resume(lease_state.get("last_started") or {})
+        else:
+            self._leader = True
+
+        now = time.time()
+        for kind, schedule in self._schedules.items():
+            self._collect(kind, now)
+            with self._lock:
+                state = self._state[kind]
+                if state["job_id"] is not None:
+                    continue
+                if state["next_run_at"] is None:
+                    state["next_run_at"] = now + random.uniform(0, SYNC_SCHEDULER_JITTER * state["interval_seconds"])
+                if now < state["next_run_at"]:
+                    continue
+            if self._jobs.running(kind) is not None:
+                # A manual trigger (or another scheduled run) is still going
+                with self._lock:
+                    state["skipped"] += 1
+                    state["history"].append({"status": "skipped", "at": now})
+                    state["next_run_at"] = self._next_run(kind, now)
+                continue
+            job, _ = self._jobs.submit(kind, **schedule.get("params", {}))
+            with self._lock:
+                state["job_id"] = job["id"]
+                state["runs"] += 1
+            if self._lease is not None:
+                try:
+                    self._lease.note_started(kind, now)
+                except Exception as exc:
+                    print(f"⚠️ Không lưu được thời điểm chạy {kind}: {exc}")
+
+    def _resume(self, last_started: Dict[str, float]) -> None:
+        """New leader: keep the cadence of the previous one."""
+        with self._lock:
+            for kind, state in self._state.items():
+                started = last_started.get(kind)
+                if started:
+                    state["next_run_at"] = started + state["interval_seconds"]
+
+    def _collect(self, kind: str, now: float) -> None:
+        """Record the outcome of this kind's job once it has finished."""
+        with self._lock:
+            job_id = self._state[kind]["job_id"]
+        if job_id is None:
+            return
+        job = self._jobs.get(job_id)
+        if job is not None and job["finished_at"] is None:
+            return
+        with self._lock:
+            state = self._state[kind]
+            state["job_id"] = None
+            if job is None:
+                status, error, seconds = "failed", "job record expired", 0.0
+            else:
+                status, error, seconds = job["status"], job["error"], job["elapsed_seconds"]
+            if status == "succeeded":
+                state["succeeded"] += 1
+                state["consecutive_failures"] = 0
+            else:
+                state["failed"] += 1
+                state["consecutive_failures"] += 1
+            state["total_seconds"] += seconds
+            state["last_status"] = status
+            state["last_error"] = error
+            entry = {"status": status, "at": now, "job_id": job_id, "seconds": seconds}
+            if error:
+                entry["error"] = error
+            state["history"].append(entry)
+            state["next_run_at"] = self._next_run(kind, now)
+        if status != "succeeded":
+            print(f"⚠️ Đồng bộ {kind} theo lịch lỗi ({state['consecutive_failures']} lần liên tiếp): {error}")
+
+    def status(self) -> dict:
+        with self._lock:
+            kinds = {}
+            for kind, state in self._state.items():
+                finished = state["succeeded"] + state["failed"]
+                kinds[kind] = {
+                    **{key: value for key, value in state.items() if key != "history"},
+                    "avg_seconds": round(state["total_seconds"] / finished, 2) if finished else None,
+                    "history": list(state["history"]),
+                }
+        return {
+            "running": self._thread is not None and not self._stop.is_set(),
+            "leader": self._leader,
+            "owner": self._lease.owner if self._lease is not None else None,
+            "kinds": kinds,
+        }
@@ -0,0 +1,79 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+
+class Warmup:
+    """
+    Run startup warm-up tasks in parallel and track readiness.
+
+    Each task is a callable (e.g. load the product replica into the cache);
+    `ready` becomes true once every task has finished, successfully or not,
+    so a readiness probe does not hold traffic forever when Firestore is
+    down. Failures are reported in `status()`.
+    """
+
+    def __init__(self, tasks: Dict[str, Callable[[], object]]):
+        self._tasks = dict(tasks)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._started_at = None
+        self._finished_at = None
+        self._results = {name: {"status": "pending"} for name in self._tasks}
+
+    def start(self) -> "Warmup":
+        with self._lock:
+            if self._started_at is not None:
+                return self
+            self._started_at = time.time()
+        threading.Thread(target=self._run, name="cache-warmup", daemon=True).start()
+        return self
+
+    def _run(self):
+        print(f"🔥 Warm-up: {', '.join(self._tasks)}")
+        with ThreadPoolExecutor(max_workers=max(1, len(self._tasks)), thread_name_prefix="warmup") as pool:
+            futures = {name: pool.submit(self._run_task, name, task) for name, task in self._tasks.items()}
+            for future in futures.values():
+                future.result()
+        with self._lock:
+            self._finished_at = time.time()
+        self._done.set()
+        failed = [name for name, result in self._results.items() if result["status"] != "ok"]
+        elapsed = self._finished_at - self._started_at
+        if failed:
+            print(f"⚠️ Warm-up xong sau {elapsed:.1f}s, lỗi: {', '.join(failed)}")
+        else:
+            print(f"✅ Warm-up xong sau {elapsed:.1f}s")
+
+    def _run_task(self, name, task):
+        started = time.perf_counter()
+        with self._lock:
+            self._results[name] = {"status": "running"}
+        try:
+            result = task()
+            outcome = {"status": "ok", "result": result}
+        except Exception as exc:
+            outcome = {"status": "failed", "error": str(exc)}
+        outcome["seconds"] = round(time.perf_counter() - started, 3)
+        with self._lock:
+            self._results[name] = outcome
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def status(self) -> dict:
+        with self._lock:
+            tasks = {name: dict(result) for name, result in self._results.items()}
+            started_at, finished_at = self._started_at, self._finished_at
+        return {
+            "ready": self.ready,
+            "ok": self.ready and all(task["status"] == "ok" for task in tasks.values()),
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "tasks": tasks,
+        }
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import hmac
+import os
+from functools import wraps
+
+from flask import Blueprint, Response, jsonify, request
+
+from firebase.firebase_service.cache import CacheStats, registered_caches
+
+# Các endpoint admin yêu cầu header X-Admin-Token khớp ADMIN_API_TOKEN; không đặt thì tắt hẳn
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+# Endpoint Prometheus là tùy chọn (tắt bằng CACHE_PROMETHEUS_ENABLED=0)
+CACHE_PROMETHEUS_ENABLED = os.getenv("CACHE_PROMETHEUS_ENABLED", "1") not in ("0", "false", "False")
+
+
+def require_admin_token(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_API_TOKEN:
+            return jsonify({"error": "Admin endpoints are disabled"}), 404
+        supplied = request.headers.get("X-Admin-Token", "")
+        if not hmac.compare_digest(supplied.encode(), ADMIN_API_TOKEN.encode()):
+            return jsonify({"error": "Unauthorized"}), 401
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_cache_metrics(caches) -> str:
+    """Render cache stats in the Prometheus text exposition format."""
+    lines = []
+    metrics = [(field, "counter") for field in CacheStats.COUNTERS if field != "load_seconds_max"]
+    metrics += [("load_seconds_max", "gauge")] + [(field, "gauge") for field in CacheStats.GAUGES]
+    snapshots = [cache.stats() for cache in caches]
+
+    for field, kind in metrics:
+        name = f"taphoa_cache_{field}" + ("_total" if kind == "counter" and field != "load_seconds" else "")
+        lines.append(f"# TYPE {name} {kind}")
+        for snapshot in snapshots:
+            cache_label = _escape_label(snapshot["name"])
+            for prefix, row in sorted(snapshot["prefixes"].items()):
+                lines.append(f'{name}{{cache="{cache_label}",prefix="{_escape_label(prefix)}"}} {row[field]}')
+
+    for field in ("entries", "bytes", "max_entries", "max_bytes"):
+        name = f"taphoa_cache_size_{field}"
+        lines.append(f"# TYPE {name} gauge")
+        for snapshot in snapshots:
+            lines.append(f'{name}{{cache="{_escape_label(snapshot["name"])}"}} {snapshot[field]}')
+
+    return "\n".join(lines) + "\n"
+
+
+def create_admin_routes_bp() -> Blueprint:
+    bp = Blueprint("admin_routes", __name__, url_prefix="/api/admin")
+
+    @bp.route("/cache/stats", methods=["GET"])
+    @require_admin_token
+    def cache_stats():
+        """Hit/miss/eviction/load-time/bytes per cache and per key prefix."""
+        return jsonify({"caches": [cache.stats() for cache in registered_caches()]})
+
+    @bp.route("/cache/metrics", methods=["GET"])
+    @require_admin_token
+    def cache_metrics():
+        if not CACHE_PROMETHEUS_ENABLED:
+            return jsonify({"error": "Prometheus metrics are disabled"}), 404
+        return Response(render_cache_metrics(registered_caches()), mimetype="text/plain; version=0.0.4")
+
+    return bp
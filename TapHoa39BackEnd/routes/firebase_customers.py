@@ -6,9 +6,10 @@ from google.api_core.exceptions import ResourceExhausted
 from FromKiotViet.Model.customer import Customer
 from FromKiotViet.add_customer import add_customer_to_kiotviet
 from Utility.get_env import LatestBranchId
+from routes.response_cache import response_cache
 from routes.shared import (
     broadcast_customer_updates,
-    create_fetch_handler,
+    create_simple_fetch_handler,
     handle_api_errors,
     notify_customer_created,
 )
@@ -45,21 +46,12 @@ def create_firebase_customers_bp(customer_service, socketio) -> Blueprint:
             raise ValueError("KiotViet response missing customer Id")
         return kiot_response
 
-    def _coerce_numeric_ids(records):
-        for item in records or []:
-            if not isinstance(item, dict):
-                continue
-            id_value = item.get("Id")
-            if isinstance(id_value, str) and id_value.isdigit():
-                item["Id"] = int(id_value)
-        return records
-
     @bp.route("/get/customers", methods=["GET"])
     @handle_api_errors
     def get_all_customers():
+        # Numeric Id coercion happens once when the list is loaded into the cache
         customers = customer_service.read_all_customers()
-        _coerce_numeric_ids(customers)
-        return jsonify(customers)
+        return response_cache.respond("get/customers", customers)
 
     @bp.route("/customers/invoices/<customer_id>", methods=["GET"])
     @handle_api_errors
@@ -202,6 +194,6 @@ def create_firebase_customers_bp(customer_service, socketio) -> Blueprint:
         Accepts JSON: { "id": "123" } or { "ids": ["1","2"] }
         Returns the latest customer document(s) from Firestore.
         """
-        return create_fetch_handler(customer_service, "read_all_customers")()
+        return create_simple_fetch_handler(customer_service, "read_customers")()
 
     return bp
@@ -224,7 +224,7 @@ def create_firebase_invoices_bp(invoice_service, product_service, customer_servi
         Accepts JSON: { "id": "123" } or { "ids": ["1","2"] }
         Returns the latest invoice document(s) from Firestore.
         """
-        return create_simple_fetch_handler(invoice_service, "read_invoice")()
+        return create_simple_fetch_handler(invoice_service, "read_invoices")()
 
     @bp.route("/invoices/date", methods=["GET"])
     @handle_api_errors
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from flask import Blueprint, jsonify, request
+from routes.response_cache import response_cache
 from routes.shared import (
     create_simple_fetch_handler,
     handle_api_errors,
@@ -17,7 +18,7 @@ def create_firebase_orders_bp(order_service, socketio) -> Blueprint:
     @handle_api_errors
     def get_all_orders():
         orders = order_service.read_all_orders()
-        return jsonify(orders)
+        return response_cache.respond("orders", orders)
 
     @bp.route("/orders/<order_id>", methods=["GET"])
     @handle_api_errors
@@ -74,7 +75,7 @@ def create_firebase_orders_bp(order_service, socketio) -> Blueprint:
         Accepts JSON: { "id": "123" } or { "ids": ["1","2"] }
         Returns the latest order document(s) from Firestore.
         """
-        return create_simple_fetch_handler(order_service, "read_order")()
+        return create_simple_fetch_handler(order_service, "read_orders")()
 
     @bp.route("/orders/date", methods=["GET"])
     @handle_api_errors
@@ -3,23 +3,50 @@ from __future__ import annotations
 from flask import Blueprint, jsonify, request
 
 from firebase.firebase_hanghoa.import_to_firestore import update_products_from_banhang_app_to_firestore
+from firebase.firebase_service.product_index import project
+from routes.response_cache import response_cache
 from routes.shared import (
     apply_product_updates,
     broadcast_products_onhand_updated,
     create_simple_fetch_handler,
     handle_api_errors,
     normalize_product_updates,
+    run_sync_job,
+    sync_job_result,
+    sync_mode_arg,
     to_number,
 )
 
 
-def create_firebase_products_bp(product_service, socketio) -> Blueprint:
+PAGING_ARGS = ("cursor", "page_size", "order_by")
+
+
+def _fields_arg():
+    """`fields=Id,Code,BasePrice,OnHand` -> ["Id", "Code", ...] (None when absent)."""
+    raw = request.args.get("fields") or ""
+    fields = [field.strip() for field in raw.split(",") if field.strip()]
+    return list(dict.fromkeys(fields)) or None
+
+
+def _products_page(product_service, include_inactive, include_deleted, fields):
+    return jsonify(product_service.list_products_page(
+        order_by=request.args.get("order_by") or "Id",
+        cursor=request.args.get("cursor") or None,
+        page_size=request.args.get("page_size", type=int),
+        fields=fields,
+        include_inactive=include_inactive,
+        include_deleted=include_deleted,
+    ))
+
+
+def create_firebase_products_bp(product_service, socketio, sync_jobs) -> Blueprint:
     bp = Blueprint("firebase_products", __name__, url_prefix="/api/firebase")
 
     @bp.route("/products/update_onhand_batch", methods=["PUT"])
     def update_onhand_from_invoice():
         invoice_obj = request.json
         result = update_products_from_banhang_app_to_firestore(invoice_obj)
+        product_service.note_stock_updates(result.get('updated_products'))
         updates_for_broadcast = []
         for item in result.get('updated_products', []):
             pid = item.get("Id")
@@ -36,15 +63,71 @@ def create_firebase_products_bp(product_service, socketio) -> Blueprint:
     @bp.route("/get/products", methods=["GET"])
     @handle_api_errors
     def get_all_products():
+        """
+        Whole catalog as a list. Optional `fields=` keeps only those fields;
+        `page_size` / `cursor` / `order_by` (Id | SyncTimestamp) switch to a
+        paged response { products, next_cursor, has_more }.
+        """
         include_inactive = request.args.get("include_inactive", "false").lower() in ("1", "true", "yes")
         include_deleted = request.args.get("include_deleted", "false").lower() in ("1", "true", "yes")
+        fields = _fields_arg()
+        if any(arg in request.args for arg in PAGING_ARGS):
+            return _products_page(product_service, include_inactive, include_deleted, fields)
+
         products = product_service.read_all_products(include_inactive=include_inactive, include_deleted=include_deleted)
-        return jsonify(products)
+        return response_cache.respond(
+            ("get/products", include_inactive, include_deleted, tuple(fields or ())),
+            products,
+            build=(lambda snapshot: [project(product, fields) for product in snapshot]) if fields else list,
+        )
+
+    @bp.route("/products/changes", methods=["GET"])
+    @handle_api_errors
+    def get_product_changes():
+        """
+        Delta feed: products changed and ids deleted after `since`.
+
+        Query params: `since` (watermark from the previous response), `limit`.
+        Response: { products, deleted, watermark, has_more, reset }.
+        """
+        since = request.args.get("since") or None
+        limit = request.args.get("limit", type=int)
+        return jsonify(product_service.get_product_changes(since=since, limit=limit))
+
+    @bp.route("/products/summary", methods=["GET"])
+    @handle_api_errors
+    def get_products_summary():
+        """Stock value and products at or below `low_stock` (default 0) OnHand."""
+        threshold = request.args.get("low_stock", default=0, type=float)
+        include_inactive = request.args.get("include_inactive", "false").lower() in ("1", "true", "yes")
+        return jsonify(product_service.catalog_summary(low_stock_threshold=threshold, include_inactive=include_inactive))
+
+    @bp.route("/products/search", methods=["GET"])
+    @handle_api_errors
+    def search_products():
+        """Search products by name/Code, ignoring Vietnamese diacritics. Params: q, limit, include_inactive."""
+        query = (request.args.get("q") or "").strip()
+        if not query:
+            return jsonify({"status": "error", "message": "q is required"}), 400
+        limit = request.args.get("limit", type=int)
+        include_inactive = request.args.get("include_inactive", "false").lower() in ("1", "true", "yes")
+        products = product_service.search_products(query, limit=limit, include_inactive=include_inactive)
+        return jsonify({"query": query, "count": len(products), "products": products})
+
+    @bp.route("/products/by-code/<path:code>", methods=["GET"])
+    @handle_api_errors
+    def get_product_by_code(code: str):
+        """Barcode scan lookup; served from the in-memory Code index."""
+        include_inactive = request.args.get("include_inactive", "false").lower() in ("1", "true", "yes")
+        found = product_service.lookup_product_by_code(code, include_inactive=include_inactive)
+        if found:
+            return jsonify(found)
+        return jsonify({"error": "Product not found", "code": code}), 404
 
     @bp.route("/get/grouped_products", methods=["GET"])
     def get_grouped_products():
         grouped = product_service.group_product()
-        return jsonify(grouped)
+        return response_cache.respond("get/grouped_products", grouped)
 
     @bp.route("/get/products/<product_id>", methods=["GET"])
     def get_product(product_id: str):
@@ -161,25 +244,31 @@ def create_firebase_products_bp(product_service, socketio) -> Blueprint:
     def sync_products_from_kiotviet():
         """
         Trigger a sync from KiotViet into Firestore (KiotViet is source-of-truth).
-        Accepts optional JSON body: { "force": true, "limit": 100 }
-        Returns the sync summary and latest products (up to `limit`).
+        Accepts optional JSON body: { "force": true, "limit": 100, "mode": "auto", "async": false }
+        `force` runs a full reconciliation (same as mode "full").
+        Returns the sync summary and latest products (up to `limit`), or a 202
+        with the background job id when the sync outlasts SYNC_JOB_WAIT_SECONDS.
         """
         payload = request.get_json(silent=True) or {}
-        force = bool(payload.get("force", False))
         limit = int(payload.get("limit", 100)) if payload.get("limit") is not None else 100
 
-        sync_result = product_service.sync_products_from_kiotviet()
+        job, accepted = run_sync_job(sync_jobs, "products", payload, mode=sync_mode_arg(payload))
+        if accepted:
+            return accepted
+        sync_result = sync_job_result(job)
 
-        products = product_service.read_all_products() or []
+        products = product_service.read_all_products()
         if limit and isinstance(limit, int) and limit > 0:
             products = products[:limit]
+        else:
+            products = list(products)
 
         return jsonify({"sync": sync_result, "products": products})
 
     @bp.route("/products/latest", methods=["GET"])
     @handle_api_errors
     def get_latest_products():
-        """Return latest cached products (optional query param `limit`)."""
+        """Return latest cached products (optional `limit`, `fields`, or paging as in /get/products)."""
         try:
             limit = int(request.args.get("limit")) if request.args.get("limit") is not None else None
         except ValueError:
@@ -187,11 +276,24 @@ def create_firebase_products_bp(product_service, socketio) -> Blueprint:
 
         include_inactive = request.args.get("include_inactive", "false").lower() in ("1", "true", "yes")
         include_deleted = request.args.get("include_deleted", "false").lower() in ("1", "true", "yes")
+        fields = _fields_arg()
+        if any(arg in request.args for arg in PAGING_ARGS):
+            return _products_page(product_service, include_inactive, include_deleted, fields)
 
         products = product_service.read_all_products(include_inactive=include_inactive, include_deleted=include_deleted) or []
-        if limit and isinstance(limit, int) and limit > 0:
-            products = products[:limit]
-        return jsonify(products)
+        # Any limit past the end is the same response: keep one cache variant for all of them
+        if not (limit and isinstance(limit, int) and 0 < limit < len(products)):
+            limit = None
+
+        def build(snapshot):
+            rows = snapshot[:limit] if limit else snapshot
+            return [project(product, fields) for product in rows] if fields else list(rows)
+
+        return response_cache.respond(
+            ("products/latest", include_inactive, include_deleted, limit, tuple(fields or ())),
+            products,
+            build=build,
+        )
 
     @bp.route("/products/fetch", methods=["POST"])
     def fetch_products_changed():
@@ -223,7 +325,7 @@ def create_firebase_products_bp(product_service, socketio) -> Blueprint:
             return jsonify(products)
     
         # Original logic for single/multiple IDs
-        return create_simple_fetch_handler(product_service, "read_product")()
+        return create_simple_fetch_handler(product_service, "read_products")()
 
     @bp.route("/products/variants/<int:product_id>", methods=["GET"])
     @handle_api_errors
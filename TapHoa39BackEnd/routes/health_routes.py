@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from flask import Blueprint, jsonify
+
+
+def create_health_routes_bp(warmup=None) -> Blueprint:
+    bp = Blueprint("health_routes", __name__, url_prefix="/api/health")
+
+    @bp.route("/live", methods=["GET"])
+    def live():
+        return jsonify({"status": "ok"})
+
+    @bp.route("/ready", methods=["GET"])
+    def ready():
+        """503 until the startup warm-up has loaded the product and customer caches."""
+        if warmup is None:
+            return jsonify({"ready": True})
+        status = warmup.status()
+        return jsonify(status), 200 if status["ready"] else 503
+
+    return bp
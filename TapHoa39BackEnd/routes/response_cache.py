@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from flask import Response, current_app, request
+
+from firebase.firebase_service.cache import snapshot_alive, snapshot_version
+
+try:  # Optional: brotli is smaller than gzip for JSON, but gzip is enough without it
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "64"))
+# Query variants (fields=, limit=...) kept per endpoint; older ones are dropped first
+RESPONSE_CACHE_MAX_VARIANTS = int(os.getenv("RESPONSE_CACHE_MAX_VARIANTS", "8"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _source_token(source) -> Tuple[Optional[int], Optional[weakref.ref]]:
+    """
+    (version, weakref) identifying a snapshot without keeping it alive.
+
+    Tuples held by a service cache have a version; other snapshots (catalog
+    views, grouped products) are weakly referenced. (None, None) when neither
+    works: such a body is not kept.
+    """
+    version = snapshot_version(source)
+    if version is not None:
+        return version, None
+    try:
+        return None, weakref.ref(source)
+    except TypeError:
+        return None, None
+
+
+class _EncodedResponse:
+    __slots__ = ("version", "source_ref", "body", "etag", "variants", "lock")
+
+    def __init__(self, token, body: bytes):
+        # The snapshot this body was encoded from (see _source_token)
+        self.version, self.source_ref = token
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.variants = {}
+        self.lock = threading.Lock()
+
+    def encoded(self, encoding: str) -> bytes:
+        """Return the body compressed with `encoding`, compressing at most once."""
+        body = self.variants.get(encoding)
+        if body is not None:
+            return body
+        with self.lock:
+            body = self.variants.get(encoding)
+            if body is None:
+                if encoding == "br":
+                    body = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                else:
+                    body = gzip.compress(self.body, compresslevel=GZIP_LEVEL)
+                self.variants[encoding] = body
+        return body
+
+    def encodes(self, source, version: Optional[int]) -> bool:
+        if version is not None:
+            return self.version == version
+        return self.source_ref is not None and self.source_ref() is source
+
+    def alive(self) -> bool:
+        if self.version is not None:
+            return snapshot_alive(self.version)
+        return self.source_ref() is not None
+
+
+class ResponseCache:
+    """
+    Encoded JSON bodies for large GET endpoints.
+
+    Entries are keyed by the endpoint (plus its query variant) and tied to the
+    identity of the cached snapshot they were built from. Because the service
+    caches hand out the same read-only snapshot until it is reloaded or
+    invalidated, a poll with unchanged data reuses the encoded bytes, the
+    compressed variants and the ETag; clients sending If-None-Match get a 304.
+
+    Entries do not keep their snapshot alive: bodies of snapshots that are
+    gone are dropped whenever a new body is stored, and each endpoint keeps
+    at most RESPONSE_CACHE_MAX_VARIANTS query variants.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self._max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[Hashable, _EncodedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_entry(self, key: Hashable, source: Any, build: Optional[Callable[[Any], Any]]) -> _EncodedResponse:
+        token = _source_token(source)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.encodes(source, token[0]):
+                self._entries.move_to_end(key)
+                return entry
+
+        payload = build(source) if build is not None else source
+        entry = _EncodedResponse(token, current_app.json.dumps(payload).encode("utf-8"))
+        if token == (None, None):
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._trim_locked(key)
+        return entry
+
+    def _trim_locked(self, key: Hashable) -> None:
+        for stale in [other for other, entry in self._entries.items() if not entry.alive()]:
+            del self._entries[stale]
+        endpoint = _endpoint(key)
+        variants = [other for other in self._entries if _endpoint(other) == endpoint]
+        for other in variants[:max(0, len(variants) - RESPONSE_CACHE_MAX_VARIANTS)]:
+            del self._entries[other]
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def respond(self, key: Hashable, source: Any, build: Optional[Callable[[Any], Any]] = None) -> Response:
+        """
+        Serve `build(source)` (or `source`) as JSON.
+
+        `source` must be the snapshot returned by a service cache; `build`
+        derives the payload from it (e.g. applying a limit) and only runs when
+        the snapshot changed.
+        """
+        entry = self._get_entry(key, source, build)
+
+        encoding = _pick_encoding(request.accept_encodings)
+        # Each encoding is a different representation, so it gets its own strong ETag
+        etag = f"{entry.etag}-{encoding}" if encoding else entry.etag
+        known_etags = (entry.etag, f"{entry.etag}-gzip", f"{entry.etag}-br")
+
+        if any(request.if_none_match.contains(tag) for tag in known_etags):
+            response = Response(status=304)
+        elif encoding:
+            response = Response(entry.encoded(encoding), mimetype="application/json")
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response = Response(entry.body, mimetype="application/json")
+
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _endpoint(key: Hashable) -> Hashable:
+    return key[0] if isinstance(key, tuple) and key else key
+
+
+def _pick_encoding(accept_encodings) -> Optional[str]:
+    if brotli is not None and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+response_cache = ResponseCache()
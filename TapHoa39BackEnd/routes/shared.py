@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import os
 from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 from functools import wraps
 from flask import jsonify, request
@@ -7,9 +8,12 @@ from google.api_core.exceptions import ResourceExhausted
 import traceback
 
 from routes.firebase_websocket import set_last_notify
+from firebase.firebase_service.product_service import SYNC_MODES
 
 UPDATE_ID_KEYS: Tuple[str, ...] = ("Id", "id", "productId", "ProductId")
 ONHAND_KEYS: Tuple[str, ...] = ("OnHand", "onHand", "onhand")
+# Endpoint sync cũ chờ job nền tối đa chừng này giây, quá thì trả 202 kèm job id
+SYNC_JOB_WAIT_SECONDS = float(os.getenv("SYNC_JOB_WAIT_SECONDS", "25"))
 
 
 def norm_id(data: Dict[str, Any]) -> Optional[Any]:
@@ -88,6 +92,8 @@ def normalize_product_updates(payload: Any) -> List[Dict[str, Any]]:
 def apply_product_updates(product_service, normalized_items: Iterable[Dict[str, Any]]):
     results: List[Dict[str, Any]] = []
     broadcast_updates: List[Dict[str, Any]] = []
+    # Valid items are written together; each keeps its slot in `results`
+    pending: List[Tuple[int, Any, Dict[str, Any], Dict[str, Any], bool]] = []
 
     for item in normalized_items:
         pid = item.get("Id")
@@ -124,22 +130,35 @@ def apply_product_updates(product_service, normalized_items: Iterable[Dict[str,
                 results.append({"id": pid, "result": "no_updates"})
             continue
 
-        try:
-            update_result = product_service.update_product(pid, updates)
-            result_entry = {"id": pid, "result": update_result}
-            if invalid_onhand:
-                result_entry["warning"] = "invalid_onhand"
-            results.append(result_entry)
-
-            if broadcast_fields:
-                entry = {"Id": pid}
-                entry.update(broadcast_fields)
-                broadcast_updates.append(entry)
-        except Exception as exc:  # pragma: no cover - best effort logging
-            import traceback
-            print(f"Error updating product {pid}: {exc}")
-            print(traceback.format_exc())
-            results.append({"id": pid, "result": f"error: {str(exc)}"})
+        pending.append((len(results), pid, updates, broadcast_fields, invalid_onhand))
+        results.append({"id": pid, "result": None})
+
+    if not pending:
+        return results, broadcast_updates
+
+    try:
+        outcomes = product_service.update_products_bulk([(pid, updates) for _, pid, updates, _, _ in pending])
+    except Exception as exc:  # pragma: no cover - best effort logging
+        import traceback
+        print(f"Error updating products: {exc}")
+        print(traceback.format_exc())
+        outcomes = [exc] * len(pending)
+
+    for (slot, pid, _, broadcast_fields, invalid_onhand), outcome in zip(pending, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Error updating product {pid}: {outcome}")
+            results[slot] = {"id": pid, "result": f"error: {str(outcome)}"}
+            continue
+
+        result_entry = {"id": pid, "result": outcome}
+        if invalid_onhand:
+            result_entry["warning"] = "invalid_onhand"
+        results[slot] = result_entry
+
+        if broadcast_fields:
+            entry = {"Id": pid}
+            entry.update(broadcast_fields)
+            broadcast_updates.append(entry)
 
     return results, broadcast_updates
 
@@ -430,24 +449,24 @@ def handle_api_errors(f: Callable) -> Callable:
 # FETCH ENDPOINT FACTORY
 # ============================================================================
 
-def create_fetch_handler(service, read_method_name: str = "read_all"):
+def create_simple_fetch_handler(service, read_many_method_name: str):
     """
-    Factory function to create a fetch endpoint handler for any resource.
+    Fetch handler for { "id": "123" } or { "ids": ["1","2"] } bodies.
 
-    Accepts JSON: { "id": "123" } or { "ids": ["1","2"] }
-    Returns the latest document(s) from Firestore.
+    The service method takes the list of ids and returns the documents found,
+    in request order (cached hits reused, misses read with one batched get_all).
 
     Args:
-        service: The service instance (e.g., customer_service, product_service)
-        read_method_name: Name of the method to read all items (default: "read_all")
+        service: The service instance
+        read_many_method_name: Name of the batch read method (e.g., "read_products")
 
     Returns:
         Flask route handler function
 
     Usage:
-        @bp.route("/customers/fetch", methods=["POST"])
-        def fetch_customers():
-            return create_fetch_handler(customer_service, "read_all_customers")()
+        @bp.route("/products/fetch", methods=["POST"])
+        def fetch_products():
+            return create_simple_fetch_handler(product_service, "read_products")()
     """
     @handle_api_errors
     def fetch_handler():
@@ -465,27 +484,12 @@ def create_fetch_handler(service, read_method_name: str = "read_all"):
                 "message": "Provide 'id' or 'ids' in JSON body"
             }), 400
 
-        # Get all items and create lookup dictionary
-        read_all_method = getattr(service, read_method_name, None)
-        if not read_all_method:
-            raise ValueError(f"Service method '{read_method_name}' not found")
-
-        all_items = read_all_method() or []
-
-        # Build lookup by Id/id field
-        lookup = {}
-        for item in all_items:
-            if not isinstance(item, dict):
-                continue
-            item_id = str(item.get('Id') or item.get('id'))
-            if item_id:
-                lookup[item_id] = item
+        # Get read method
+        read_many = getattr(service, read_many_method_name, None)
+        if not read_many:
+            raise ValueError(f"Service method '{read_many_method_name}' not found")
 
-        # Find matching items
-        results = []
-        for item_id in ids:
-            if item_id in lookup:
-                results.append(lookup[item_id])
+        results = read_many(ids)
 
         # Return single item or array
         if len(results) == 1:
@@ -495,54 +499,49 @@ def create_fetch_handler(service, read_method_name: str = "read_all"):
     return fetch_handler
 
 
-def create_simple_fetch_handler(service, read_single_method_name: str):
-    """
-    Simplified fetch handler that reads items one by one.
-    Use this when you don't need to load all items into memory.
-
-    Args:
-        service: The service instance
-        read_single_method_name: Name of the method to read a single item (e.g., "read_product")
+def sync_mode_arg(payload: Dict[str, Any]) -> str:
+    """Product sync mode from a request body ("force": true means a full sync)."""
+    if payload.get("force"):
+        return "full"
+    mode = str(payload.get("mode") or "auto").lower()
+    if mode not in SYNC_MODES:
+        raise ValueError(f"Invalid sync mode: {mode!r} (expected one of {', '.join(SYNC_MODES)})")
+    return mode
 
-    Returns:
-        Flask route handler function
 
-    Usage:
-        @bp.route("/products/fetch", methods=["POST"])
-        def fetch_products():
-            return create_simple_fetch_handler(product_service, "read_product")()
+def run_sync_job(sync_jobs, kind: str, payload: Dict[str, Any], **params):
     """
-    @handle_api_errors
-    def fetch_handler():
-        payload = request.get_json(silent=True) or {}
-        ids = []
+    Start (or join) a background sync job for a legacy sync endpoint.
 
-        # Extract IDs from payload
-        if isinstance(payload, dict) and payload.get("id"):
-            ids = [str(payload.get("id"))]
-        elif isinstance(payload, dict) and payload.get("ids"):
-            ids = [str(i) for i in payload.get("ids") if i is not None]
-        else:
-            return jsonify({
-                "status": "error",
-                "message": "Provide 'id' or 'ids' in JSON body"
-            }), 400
-
-        # Get read method
-        read_method = getattr(service, read_single_method_name, None)
-        if not read_method:
-            raise ValueError(f"Service method '{read_single_method_name}' not found")
-
-        # Read items
-        results = []
-        for item_id in ids:
-            item = read_method(str(item_id))
-            if item:
-                results.append(item)
-
-        # Return single item or array
-        if len(results) == 1:
-            return jsonify(results[0])
-        return jsonify(results)
-
-    return fetch_handler
+    Returns (job, None) when the job finished within SYNC_JOB_WAIT_SECONDS, so
+    the endpoint can answer as before; otherwise (job, response) where the
+    response is a 202 pointing at the job status. `"async": true` in the
+    payload skips the wait.
+    """
+    job, _ = sync_jobs.submit(kind, **params)
+    if not payload.get("async"):
+        job = sync_jobs.wait(job["id"], SYNC_JOB_WAIT_SECONDS)
+    if job["finished_at"] is not None:
+        return job, None
+    return job, sync_job_accepted(job)
+
+
+def sync_job_accepted(job: Dict[str, Any]):
+    return jsonify({
+        "job": job,
+        "status_url": f"/api/sync/jobs/{job['id']}",
+        "message": "Đang đồng bộ nền, xem tiến độ qua status_url",
+    }), 202
+
+
+def sync_job_result(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The sync summary of a finished job (also for a job whose callable raised)."""
+    result = job.get("result")
+    if isinstance(result, dict):
+        return {**result, "job_id": job["id"]}
+    return {
+        "success": job["status"] == "succeeded",
+        "message": job.get("error") or "Đồng bộ thất bại",
+        "error": job.get("error"),
+        "job_id": job["id"],
+    }
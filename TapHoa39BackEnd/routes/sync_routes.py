@@ -2,22 +2,78 @@ from __future__ import annotations
 
 from flask import Blueprint, jsonify, request
 
-from routes.shared import handle_api_errors, safe_int
-from firebase.firebase_khachhang.import_to_firestore import update_customer_from_kiotviet_to_firestore
+from routes.shared import (
+    handle_api_errors,
+    run_sync_job,
+    safe_int,
+    sync_job_result,
+    sync_mode_arg,
+)
 
 
-def create_sync_routes_bp(product_service) -> Blueprint:
+def create_sync_routes_bp(product_service, sync_jobs, scheduler=None) -> Blueprint:
     bp = Blueprint("sync_routes", __name__, url_prefix="/api/sync")
 
+    @bp.route("/scheduler", methods=["GET"])
+    def get_sync_scheduler():
+        """Scheduled sync cadence, leadership and per-kind run history."""
+        if scheduler is None:
+            return jsonify({"running": False, "message": "Sync scheduler is disabled"})
+        return jsonify(scheduler.status())
+
+    @bp.route("/jobs/<kind>", methods=["POST"])
+    @handle_api_errors
+    def start_sync_job(kind):
+        """
+        Start a background sync job ("products" or "customers") and return at once (202).
+        A trigger while the same kind is running joins that job ("started": false).
+        Body for products: { "mode": "auto" | "incremental" | "full", "force": true }
+        """
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            payload = {}
+        if kind not in sync_jobs.kinds:
+            return jsonify({"error": f"Unknown sync job: {kind}"}), 404
+        params = {"mode": sync_mode_arg(payload)} if kind == "products" else {}
+        job, started = sync_jobs.submit(kind, **params)
+        return jsonify({"job": job, "started": started, "status_url": f"/api/sync/jobs/{job['id']}"}), 202
+
+    @bp.route("/jobs", methods=["GET"])
+    def list_sync_jobs():
+        """Recent sync jobs, newest first (optional ?kind=products)."""
+        return jsonify({"jobs": sync_jobs.list(request.args.get("kind"))})
+
+    @bp.route("/jobs/<job_id>", methods=["GET"])
+    def get_sync_job(job_id):
+        """Status, progress and (when finished) the result with its stats.breakdown timings."""
+        job = sync_jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job)
+
     @bp.route("/kiotviet/firebase/customers", methods=["PUT"])
+    @handle_api_errors
     def sync_customers_from_kiotviet():
-        return jsonify(update_customer_from_kiotviet_to_firestore())
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            payload = {}
+        job, accepted = run_sync_job(sync_jobs, "customers", payload)
+        if accepted:
+            return accepted
+        result = sync_job_result(job)
+        if job["status"] != "succeeded":
+            return jsonify({"error": result["message"], "job_id": job["id"]}), 500
+        return jsonify(result)
 
     @bp.route("/kiotviet/firebase/products", methods=["POST"])
     @handle_api_errors
     def sync_products_from_kiotviet():
         """Trigger a sync from KiotViet into Firestore and return final Firestore data.
-        Accepts optional JSON body: { "limit": 100, "skip_products": false }
+        Accepts optional JSON body: { "limit": 100, "skip_products": false, "mode": "auto", "async": false }
+        mode: "auto" (default, incremental with a periodic full reconciliation),
+        "incremental" or "full".
+        The sync runs as a background job; if it takes longer than
+        SYNC_JOB_WAIT_SECONDS (or "async" is true) the answer is a 202 with the job id.
 
         Optimizations:
         - Returns sync stats by default (no product data)
@@ -31,9 +87,13 @@ def create_sync_routes_bp(product_service) -> Blueprint:
             payload = {}
 
         skip_products = payload.get("skip_products", True)  # Default to skip for faster response
+        mode = sync_mode_arg(payload)
 
-        # Perform optimized sync
-        sync_result = product_service.update_products_from_kiotviet_to_firestore()
+        # Perform optimized sync as a background job (joins a sync that is already running)
+        job, accepted = run_sync_job(sync_jobs, "products", payload, mode=mode)
+        if accepted:
+            return accepted
+        sync_result = sync_job_result(job)
 
         # Check if sync succeeded
         if not sync_result.get("success", False):
@@ -52,7 +112,7 @@ def create_sync_routes_bp(product_service) -> Blueprint:
             })
 
         # Fetch and return products (slower)
-        products = product_service.read_all_products(include_inactive=True, include_deleted=True) or []
+        products = list(product_service.read_all_products(include_inactive=True, include_deleted=True))
 
         return jsonify({"sync": sync_result, "products": products})
 
@@ -101,8 +161,9 @@ def create_sync_routes_bp(product_service) -> Blueprint:
                 continue
 
             kv_dict = kv_item.__dict__ if hasattr(kv_item, "__dict__") else kv_item
-            kv_checksum = product_service.hash_item(kv_dict)
-            fb_checksum = fb_item.get("SyncChecksum") or product_service.hash_item(fb_item)
+            # Both sides recomputed: stored SyncChecksums may predate the current format
+            kv_checksum = product_service.hash_api_item(kv_dict)
+            fb_checksum = product_service.hash_item(fb_item)
 
             if kv_checksum != fb_checksum:
                 discrepancy = {
@@ -0,0 +1,197 @@
+"""
+Offline test setup.
+
+The service modules open their Firestore clients at import time, so
+`init_firestore` is replaced by real `google.cloud.firestore` clients whose
+RPC layer is `FakeFirestoreApi`: writes go through the library's own
+BulkWriter/WriteBatch code and land in an in-memory document store.
+"""
+import operator
+import os
+import sys
+import threading
+
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+from google.cloud.firestore_v1 import _helpers
+from google.cloud.firestore_v1.types import document as document_pb
+from google.cloud.firestore_v1.types import firestore as firestore_pb
+from google.cloud.firestore_v1.types import query as query_pb
+from google.cloud.firestore_v1.types import write as write_pb
+from google.protobuf import timestamp_pb2
+from google.rpc import code_pb2, status_pb2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# No catalog snapshots on disk from the tests
+os.environ.setdefault("CATALOG_SNAPSHOT_PATH", "")
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import firebase.init_firebase as init_firebase  # noqa: E402
+
+PROJECT = "taphoa39-test"
+
+
+class FakeFirestoreApi:
+    """
+    In-memory stand-in for the GAPIC Firestore client: batch_write, commit,
+    batch_get_documents, run_query (field filters joined by AND, ascending
+    order_by, start cursor, limit) and transactions (no contention: every
+    transaction commits on its first try).
+    """
+
+    FILTER_OPS = {
+        query_pb.StructuredQuery.FieldFilter.Operator.LESS_THAN: operator.lt,
+        query_pb.StructuredQuery.FieldFilter.Operator.LESS_THAN_OR_EQUAL: operator.le,
+        query_pb.StructuredQuery.FieldFilter.Operator.GREATER_THAN: operator.gt,
+        query_pb.StructuredQuery.FieldFilter.Operator.GREATER_THAN_OR_EQUAL: operator.ge,
+        query_pb.StructuredQuery.FieldFilter.Operator.EQUAL: operator.eq,
+    }
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+        self.documents = {}
+        self.batches = []
+        # path -> grpc code returned (once per write) instead of applying it
+        self.fail = {}
+
+    def _path(self, name: str) -> str:
+        return name.split("/documents/", 1)[1]
+
+    def batch_write(self, request, metadata=None, **kwargs):
+        results, statuses, paths = [], [], []
+        with self._lock:
+            for write in request["writes"]:
+                name = write.delete or write.update.name
+                path = self._path(name)
+                paths.append(path)
+                code = self.fail.get(path, code_pb2.OK)
+                if code == code_pb2.OK:
+                    code = self._apply(path, write)
+                statuses.append(status_pb2.Status(code=code))
+                results.append(write_pb.WriteResult(update_time=timestamp_pb2.Timestamp(seconds=1)))
+            self.batches.append(paths)
+        return firestore_pb.BatchWriteResponse(write_results=results, status=statuses)
+
+    def commit(self, request, metadata=None, **kwargs):
+        with self._lock:
+            for write in request["writes"]:
+                path = self._path(write.delete or write.update.name)
+                code = self._apply(path, write)
+                if code != code_pb2.OK:
+                    raise AssertionError(f"commit precondition failed for {path}")
+        results = [write_pb.WriteResult(update_time=timestamp_pb2.Timestamp(seconds=1)) for _ in request["writes"]]
+        return firestore_pb.CommitResponse(write_results=results, commit_time=timestamp_pb2.Timestamp(seconds=1))
+
+    def begin_transaction(self, request, metadata=None, **kwargs):
+        return firestore_pb.BeginTransactionResponse(transaction=b"fake-transaction")
+
+    def rollback(self, request, metadata=None, **kwargs):
+        return None
+
+    def _apply(self, path, write) -> int:
+        exists = path in self.documents
+        if "current_document" in write:
+            condition = write.current_document
+            if "exists" in condition and condition.exists != exists:
+                return code_pb2.NOT_FOUND if condition.exists else code_pb2.ALREADY_EXISTS
+        if write.delete:
+            self.documents.pop(path, None)
+            return code_pb2.OK
+        fields = _helpers.decode_dict(write.update.fields, self._client)
+        if "update_mask" in write:
+            current = dict(self.documents.get(path, {}))
+            for field_path in write.update_mask.field_paths:
+                name = field_path.strip("`")
+                if name in fields:
+                    current[name] = fields[name]
+                else:
+                    current.pop(name, None)
+            fields = current
+        self.documents[path] = fields
+        return code_pb2.OK
+
+    @staticmethod
+    def _document(name, data):
+        return document_pb.Document(
+            name=name,
+            fields=_helpers.encode_dict(data),
+            create_time=timestamp_pb2.Timestamp(seconds=1),
+            update_time=timestamp_pb2.Timestamp(seconds=1),
+        )
+
+    def batch_get_documents(self, request, metadata=None, **kwargs):
+        for name in request["documents"]:
+            data = self.documents.get(self._path(name))
+            if data is None:
+                yield firestore_pb.BatchGetDocumentsResponse(missing=name, read_time=timestamp_pb2.Timestamp(seconds=1))
+                continue
+            yield firestore_pb.BatchGetDocumentsResponse(
+                found=self._document(name, data), read_time=timestamp_pb2.Timestamp(seconds=1)
+            )
+
+    def run_query(self, request, metadata=None, **kwargs):
+        query = request["structured_query"]
+        collection = query.from_[0].collection_id
+        with self._lock:
+            rows = [
+                (path, dict(data)) for path, data in self.documents.items()
+                if path.rsplit("/", 1)[0] == collection
+            ]
+        if "where" in query:
+            if "field_filter" in query.where:
+                conditions = [query.where.field_filter]
+            elif query.where.composite_filter.op == query_pb.StructuredQuery.CompositeFilter.Operator.AND:
+                conditions = [part.field_filter for part in query.where.composite_filter.filters]
+            else:
+                raise NotImplementedError("FakeFirestoreApi supports field filters joined by AND")
+            for condition in conditions:
+                compare = self.FILTER_OPS[condition.op]
+                field = condition.field.field_path
+                value = _helpers.decode_value(condition.value, self._client)
+                rows = [(path, data) for path, data in rows if field in data and compare(data[field], value)]
+        for order in reversed(query.order_by):
+            field = order.field.field_path
+            if field != "__name__":
+                rows.sort(key=lambda row: row[1][field], reverse=order.direction == query_pb.StructuredQuery.Direction.DESCENDING)
+        if "start_at" in query:
+            # start_at / start_after over ascending orderings
+            cursor = query.start_at
+            values = [_helpers.decode_value(value, self._client) for value in cursor.values]
+            fields = [order.field.field_path for order in query.order_by][:len(values)]
+            compare = operator.ge if cursor.before else operator.gt
+            rows = [(path, data) for path, data in rows if compare([data.get(field) for field in fields], values)]
+        if "limit" in query:
+            limit = query.limit
+            rows = rows[:getattr(limit, "value", limit)]
+        prefix = request["parent"]
+        for path, data in rows:
+            if "select" in query and query.select.fields:
+                wanted = {ref.field_path for ref in query.select.fields}
+                data = {field: value for field, value in data.items() if field in wanted}
+            yield firestore_pb.RunQueryResponse(
+                document=self._document(f"{prefix}/{path}", data), read_time=timestamp_pb2.Timestamp(seconds=1)
+            )
+
+
+def offline_client() -> firestore.Client:
+    client = firestore.Client(project=PROJECT, credentials=AnonymousCredentials())
+    client._firestore_api_internal = FakeFirestoreApi(client)
+    return client
+
+
+_clients = {}
+
+
+def _init_firestore(account, app_name=None):
+    return _clients.setdefault(app_name or account, offline_client())
+
+
+init_firebase.init_firestore = _init_firestore
+
+
+@pytest.fixture
+def client():
+    return offline_client()
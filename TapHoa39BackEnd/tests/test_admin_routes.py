@@ -0,0 +1,29 @@
+import pytest
+from flask import Flask
+
+from routes import admin_routes
+from routes.admin_routes import create_admin_routes_bp
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(create_admin_routes_bp())
+    return app.test_client()
+
+
+@pytest.mark.parametrize("path", ["/api/admin/cache/stats", "/api/admin/cache/metrics"])
+def test_admin_endpoints_are_off_without_a_token(client, monkeypatch, path):
+    monkeypatch.setattr(admin_routes, "ADMIN_API_TOKEN", "")
+
+    assert client.get(path).status_code == 404
+    assert client.get(path, headers={"X-Admin-Token": ""}).status_code == 404
+
+
+@pytest.mark.parametrize("path", ["/api/admin/cache/stats", "/api/admin/cache/metrics"])
+def test_admin_endpoints_require_the_configured_token(client, monkeypatch, path):
+    monkeypatch.setattr(admin_routes, "ADMIN_API_TOKEN", "s3cret")
+
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert client.get(path, headers={"X-Admin-Token": "s3cret"}).status_code == 200
@@ -0,0 +1,60 @@
+import pytest
+from flask import Flask
+
+from firebase.firebase_service import product_service as product_module
+from firebase.firebase_service.cache import Cache
+from routes.firebase_products import create_firebase_products_bp
+
+PRODUCTS = [
+    {"Id": 10, "Code": "8934563138165", "FullName": "Mì Hảo Hảo", "isActive": True},
+    {"Id": 11, "Code": "8934563138172", "FullName": "Mì Hảo Hảo (thùng)", "MasterUnitId": 10,
+     "ConversionValue": 30, "isActive": True},
+    {"Id": 12, "Code": "COCA", "FullName": "Coca cũ", "isActive": False},
+    {"Id": 13, "Code": "coca ", "FullName": "Coca", "isActive": True},
+    {"Id": 14, "Code": "KEO", "FullName": "Kẹo", "isActive": False},
+]
+
+
+@pytest.fixture
+def service(client, monkeypatch):
+    monkeypatch.setattr(product_module, "db", client)
+    service = product_module.FirestoreProductService(Cache(name="test-barcodes", sweep_interval=0))
+    for product in PRODUCTS:
+        client._firestore_api.documents[f"products/{product['Id']}"] = dict(product)
+    service._index.rebuild(PRODUCTS, None)
+    return service
+
+
+def test_scan_resolves_the_unit_and_its_master(service):
+    found = service.lookup_product_by_code(" 8934563138172\n")
+
+    assert found["product"]["Id"] == 11
+    assert found["master"]["Id"] == 10
+    assert service.lookup_product_by_code("8934563138165") == {"product": PRODUCTS[0], "master": None}
+
+
+def test_scan_prefers_the_active_product_and_hides_inactive_ones(service):
+    assert service.lookup_product_by_code("Coca")["product"]["Id"] == 13
+    assert service.lookup_product_by_code("KEO") is None
+    assert service.lookup_product_by_code("KEO", include_inactive=True)["product"]["Id"] == 14
+    assert service.lookup_product_by_code("") is None
+
+
+def test_code_changes_move_the_lookup(service):
+    service.update_product(10, {"Code": "HAOHAO"})
+
+    assert service.lookup_product_by_code("8934563138165") is None
+    assert service.lookup_product_by_code("haohao")["product"]["Id"] == 10
+
+
+def test_by_code_endpoint(service):
+    app = Flask(__name__)
+    app.register_blueprint(create_firebase_products_bp(service, None, None))
+    client = app.test_client()
+
+    response = client.get("/api/firebase/products/by-code/8934563138172")
+    assert response.status_code == 200
+    assert response.get_json()["master"]["Id"] == 10
+    missing = client.get("/api/firebase/products/by-code/NOPE")
+    assert missing.status_code == 404
+    assert missing.get_json() == {"error": "Product not found", "code": "NOPE"}
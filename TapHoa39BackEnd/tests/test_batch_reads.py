@@ -0,0 +1,64 @@
+import pytest
+from flask import Flask
+
+from firebase.firebase_service import batch_reads
+from firebase.firebase_service import order_service as order_module
+from firebase.firebase_service.batch_reads import read_documents
+from firebase.firebase_service.cache import Cache
+from routes.firebase_orders import create_firebase_orders_bp
+
+
+@pytest.fixture
+def api(client):
+    api = client._firestore_api
+    for order_id in ("1", "2", "3", "4"):
+        api.documents[f"orders/{order_id}"] = {"status": f"s{order_id}"}
+    api.gets = []
+    batch_get = api.batch_get_documents
+
+    def counting_batch_get(request, **kwargs):
+        api.gets.append([name.rsplit("/", 1)[1] for name in request["documents"]])
+        return batch_get(request, **kwargs)
+
+    api.batch_get_documents = counting_batch_get
+    return api
+
+
+def test_misses_are_read_together_in_request_order(client, api):
+    cache = Cache(sweep_interval=0)
+    cache.set("2", {"status": "cached"})
+
+    orders = read_documents(client, client.collection("orders"), [3, "404", 2, 1, 3], cache=cache)
+
+    assert orders == [{"status": "s3"}, None, {"status": "cached"}, {"status": "s1"}, {"status": "s3"}]
+    assert len(api.gets) == 1
+    assert sorted(api.gets[0]) == ["1", "3", "404"]
+    # Fetched documents are cached under their id for the next request
+    assert cache.get("3") == {"status": "s3"}
+    read_documents(client, client.collection("orders"), ["1", "3"], cache=cache)
+    assert len(api.gets) == 1
+
+
+def test_large_requests_are_split_into_chunks(client, api, monkeypatch):
+    monkeypatch.setattr(batch_reads, "GET_ALL_CHUNK_SIZE", 3)
+
+    orders = read_documents(client, client.collection("orders"), ["4", "3", "2", "1"])
+
+    assert orders == [{"status": "s4"}, {"status": "s3"}, {"status": "s2"}, {"status": "s1"}]
+    assert [len(ids) for ids in api.gets] == [3, 1]
+
+
+def test_fetch_endpoint_uses_one_batched_read(client, api, monkeypatch):
+    monkeypatch.setattr(order_module, "db", client)
+    service = order_module.FirestoreorderService(Cache(name="test-fetch", sweep_interval=0))
+    app = Flask(__name__)
+    app.register_blueprint(create_firebase_orders_bp(service, None))
+    http = app.test_client()
+
+    response = http.post("/api/firebase/orders/fetch", json={"ids": ["2", "404", "1"]})
+
+    assert response.get_json() == [{"status": "s2"}, {"status": "s1"}]
+    assert len(api.gets) == 1
+    single = http.post("/api/firebase/orders/fetch", json={"id": "1"})
+    assert single.get_json() == {"status": "s1"}
+    assert len(api.gets) == 1
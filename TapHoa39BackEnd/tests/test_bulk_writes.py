@@ -0,0 +1,52 @@
+from google.api_core.exceptions import NotFound
+from google.rpc import code_pb2
+
+from firebase.firebase_service.bulk_writes import BulkWrites
+
+
+def test_same_document_twice_then_another(client):
+    products = client.collection("products")
+    done = []
+    with BulkWrites(client, "test") as writes:
+        writes.set(products.document("1"), {"Name": "a", "OnHand": 1}, on_success=lambda: done.append("1a"))
+        writes.update(products.document("1"), {"OnHand": 2}, on_success=lambda: done.append("1b"))
+        writes.set(products.document("2"), {"Name": "b"}, on_success=lambda: done.append("2"))
+
+    assert writes.failed == {}
+    assert writes.succeeded == 3
+    assert sorted(done) == ["1a", "1b", "2"]
+    assert client._firestore_api.documents == {
+        "products/1": {"Name": "a", "OnHand": 2},
+        "products/2": {"Name": "b"},
+    }
+    # The second write to products/1 went out after the first one had been acknowledged
+    first = next(i for i, paths in enumerate(client._firestore_api.batches) if "products/1" in paths)
+    assert "products/1" in [path for paths in client._firestore_api.batches[first + 1:] for path in paths]
+
+
+def test_many_writes_to_one_document_keep_their_order(client):
+    ref = client.collection("products").document("1")
+    with BulkWrites(client, "test") as writes:
+        writes.set(ref, {"OnHand": 0})
+        for value in range(1, 5):
+            writes.update(ref, {"OnHand": value})
+        for other in range(30):
+            writes.set(client.collection("products").document(f"x{other}"), {"OnHand": other})
+
+    assert writes.failed == {}
+    assert writes.succeeded == 35
+    assert client._firestore_api.documents["products/1"] == {"OnHand": 4}
+
+
+def test_failures_are_reported_per_key(client):
+    products = client.collection("products")
+    client._firestore_api.fail["products/bad"] = code_pb2.PERMISSION_DENIED
+    with BulkWrites(client, "test") as writes:
+        writes.set(products.document("ok"), {"Name": "ok"}, key=0)
+        writes.set(products.document("bad"), {"Name": "bad"}, key=1)
+        writes.update(products.document("missing"), {"Name": "x"}, key=2)
+
+    assert writes.succeeded == 1
+    assert set(writes.failed) == {1, 2}
+    assert isinstance(writes.failed[2], NotFound)
+    assert "products/ok" in client._firestore_api.documents
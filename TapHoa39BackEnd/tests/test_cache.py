@@ -0,0 +1,126 @@
+import gc
+import threading
+import time
+import weakref
+
+from firebase.firebase_service import cache as cache_module
+from firebase.firebase_service.cache import Cache, registered_caches
+
+
+def test_concurrent_misses_share_one_load():
+    cache = Cache(sweep_interval=0)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return [{"Id": 1}]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_load("all_products", loader)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
+    assert cache.get("all_products") == ({"Id": 1},)
+
+
+def test_stale_value_is_served_while_one_refresh_runs():
+    cache = Cache(sweep_interval=0)
+    cache.set("all_products", ["old"], ttl=0, hard_ttl=60)
+    refreshed, release = threading.Event(), threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        refreshed.set()
+        return ["new"]
+
+    assert cache.get_or_load("all_products", loader, ttl=60, hard_ttl=120) == ("old",)
+    assert cache.get_or_load("all_products", loader, ttl=60, hard_ttl=120) == ("old",)
+    release.set()
+    assert refreshed.wait(5)
+    deadline = time.time() + 5
+    while cache.get("all_products") is None and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert cache.get("all_products") == ("new",)
+    assert len(calls) == 1
+    assert cache.stats()["totals"]["stale_hits"] == 2
+
+
+def test_invalidation_during_a_load_drops_its_result():
+    cache = Cache(sweep_interval=0)
+
+    def loader():
+        cache.invalidate_tag("products")
+        return ["read before the write"]
+
+    assert cache.get_or_load("all_products", loader, tags=("products",)) == ("read before the write",)
+    assert cache.get("all_products") is None
+
+
+def test_key_invalidated_before_the_store_is_not_repopulated(monkeypatch):
+    cache = Cache(sweep_interval=0)
+    loaded = cache._stats.loaded
+
+    def invalidate_then_record(key, *args, **kwargs):
+        # Runs after the loader returned and before its result is stored
+        cache.invalidate(key)
+        loaded(key, *args, **kwargs)
+
+    monkeypatch.setattr(cache._stats, "loaded", invalidate_then_record)
+
+    assert cache.get_or_load("all_products", lambda: ["read before the write"]) == ("read before the write",)
+    assert cache.get("all_products") is None
+
+
+def test_sweeper_purges_expired_entries(monkeypatch):
+    monkeypatch.setattr(cache_module, "_SWEEPER_TICK", 0.01)
+    cache = Cache(sweep_interval=0.01)
+    cache.set("all_products", ["old"], ttl=0)
+    deadline = time.time() + 5
+    while cache.stats()["entries"] and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert cache.stats()["entries"] == 0
+    cache.close()
+
+
+def test_unreferenced_cache_is_collected():
+    cache = Cache(name="short-lived", sweep_interval=30)
+    cache.set("all_products", ["Id"])
+    ref = weakref.ref(cache)
+    del cache
+    gc.collect()
+
+    assert ref() is None
+    assert "short-lived" not in [cache.name for cache in registered_caches()]
+
+
+def test_failed_load_reaches_every_waiter_and_is_not_cached():
+    cache = Cache(sweep_interval=0)
+
+    def loader():
+        raise RuntimeError("firestore down")
+
+    try:
+        cache.get_or_load("all_products", loader)
+    except RuntimeError as exc:
+        assert str(exc) == "firestore down"
+    else:
+        raise AssertionError("expected the loader error")
+    assert cache.get_or_load("all_products", lambda: ["ok"]) == ("ok",)
@@ -0,0 +1,55 @@
+from firebase.firebase_service.cache_backends import LocalBackend, SharedCache
+
+
+def workers(count=2):
+    # Same name on one backend: the caches behave like one service in several processes
+    backend = LocalBackend()
+    return [SharedCache(backend, namespace="test", name="products", sweep_interval=0) for _ in range(count)]
+
+
+def test_one_worker_loads_and_the_others_read_the_shared_copy():
+    first, second = workers()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return [{"Id": 1}]
+
+    assert first.get_or_load("all_products", loader, tags=("products",)) == ({"Id": 1},)
+    assert second.get_or_load("all_products", loader, tags=("products",)) == ({"Id": 1},)
+    assert len(loads) == 1
+
+
+def test_tag_invalidation_reaches_every_worker():
+    first, second = workers()
+    first.get_or_load("all_products", lambda: ["old"], tags=("products",))
+    assert second.get("all_products") == ("old",)
+
+    second.invalidate_tag("products")
+
+    assert first.get("all_products") is None
+    assert second.get("all_products") is None
+    assert first.get_or_load("all_products", lambda: ["new"], tags=("products",)) == ("new",)
+    assert second.get("all_products") == ("new",)
+
+
+def test_key_invalidation_reaches_every_worker():
+    first, second = workers()
+    first.set("1", {"Id": 1, "OnHand": 5})
+    assert second.get("1") == {"Id": 1, "OnHand": 5}
+
+    first.invalidate("1")
+
+    assert second.get("1") is None
+    assert first.get("1") is None
+
+
+def test_a_dropped_subscription_clears_the_local_copy():
+    first, second = workers()
+    first.set("1", {"Id": 1})
+    assert second.get("1") == {"Id": 1}
+
+    # Invalidations may have been missed while disconnected
+    second._on_message(None)
+
+    assert second.entry_count() == 0
@@ -0,0 +1,85 @@
+import os
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from firebase.firebase_service import product_service as product_module
+from firebase.firebase_service.cache import Cache
+from firebase.firebase_service.catalog_snapshot import CatalogSnapshot, write_snapshot
+from firebase.firebase_service.warmup import Warmup
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = tmp_path / "catalog.snap"
+    stamp = datetime(2025, 6, 17, 8, 30, tzinfo=timezone.utc)
+    records = [{"Id": 1, "Name": "Mì tôm", "ModifiedDate": stamp}, {"Id": 2, "Units": [{"Unit": "lốc"}]}]
+
+    assert write_snapshot(str(path), records) == 2
+    with CatalogSnapshot(str(path)) as snapshot:
+        assert len(snapshot) == 2
+        assert snapshot[1] == {"Id": 2, "Units": [{"Unit": "lốc"}]}
+        assert list(snapshot) == records
+        assert snapshot.age < 60
+
+
+def test_damaged_snapshots_are_rejected(tmp_path):
+    path = tmp_path / "catalog.snap"
+    write_snapshot(str(path), [{"Id": 1, "Name": "Mì tôm"}])
+    data = path.read_bytes()
+
+    path.write_bytes(data[:-3])
+    with pytest.raises(ValueError):
+        CatalogSnapshot(str(path))
+    path.write_bytes(b"NOTACATS" + data[8:])
+    with pytest.raises(ValueError):
+        CatalogSnapshot(str(path))
+
+
+def product_ids(products):
+    return sorted(product["Id"] for product in products)
+
+
+def test_next_start_serves_the_snapshot_while_firestore_reloads(client, monkeypatch, tmp_path):
+    path = str(tmp_path / "catalog.snap")
+    monkeypatch.setattr(product_module, "db", client)
+    monkeypatch.setattr(product_module, "CATALOG_SNAPSHOT_PATH", path)
+    documents = client._firestore_api.documents
+    for pid in (1, 2):
+        documents[f"products/{pid}"] = {"Id": pid, "Code": f"SP{pid}", "isActive": True}
+
+    first = product_module.FirestoreProductService(Cache(name="first-start", sweep_interval=0))
+    assert product_ids(first.read_all_products()) == [1, 2]
+    deadline = time.time() + 5
+    while not os.path.exists(path) and time.time() < deadline:
+        time.sleep(0.01)
+    assert os.path.exists(path)
+
+    documents["products/3"] = {"Id": 3, "Code": "SP3", "isActive": True}
+    second = product_module.FirestoreProductService(Cache(name="second-start", sweep_interval=0))
+
+    assert second.restore_catalog_snapshot() == 2
+    assert product_ids(second.read_all_products()) == [1, 2]
+    deadline = time.time() + 5
+    while len(second.read_all_products()) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    assert product_ids(second.read_all_products()) == [1, 2, 3]
+
+
+def test_warmup_is_ready_once_every_task_finished():
+    def fail():
+        raise RuntimeError("firestore down")
+
+    warmup = Warmup({"products": lambda: 2, "customers": fail}).start()
+
+    assert warmup.wait(5)
+    status = warmup.status()
+    assert status["ready"] is True
+    assert status["ok"] is False
+    assert status["tasks"]["products"]["status"] == "ok"
+    assert status["tasks"]["products"]["result"] == 2
+    assert status["tasks"]["customers"] == {
+        "status": "failed",
+        "error": "firestore down",
+        "seconds": status["tasks"]["customers"]["seconds"],
+    }
@@ -0,0 +1,40 @@
+import pytest
+from google.rpc import code_pb2
+
+from firebase.firebase_khachhang import import_to_firestore as customer_sync
+from firebase.firebase_service.sync_jobs import SyncJobRunner
+
+
+@pytest.fixture
+def customers(client, monkeypatch):
+    monkeypatch.setattr(customer_sync, "db", client)
+    client._firestore_api.documents["customers/3"] = {"Id": 3, "Name": "Cũ"}
+    api_customers = [
+        {"Id": 1, "Name": "An"},
+        {"Id": 2, "Name": "Bình"},
+        {"Id": 3, "isDeleted": True},
+    ]
+    monkeypatch.setattr(customer_sync, "fetch_api_customers", lambda: api_customers)
+    return client._firestore_api
+
+
+def test_customer_sync_writes_changes(customers):
+    result = customer_sync.update_customer_from_kiotviet_to_firestore()
+
+    assert "message" in result
+    assert customers.documents["customers/1"] == {"Id": 1, "Name": "An"}
+    assert "customers/3" not in customers.documents
+
+
+def test_failed_customer_write_fails_the_sync_job(customers):
+    customers.fail["customers/2"] = code_pb2.PERMISSION_DENIED
+    runner = SyncJobRunner({"customers": customer_sync.update_customer_from_kiotviet_to_firestore})
+
+    job, _ = runner.submit("customers")
+    finished = runner.wait(job["id"], timeout=5)
+
+    assert finished["status"] == "failed"
+    assert finished["error"]
+    # The other writes still went through
+    assert customers.documents["customers/1"] == {"Id": 1, "Name": "An"}
+    assert "customers/3" not in customers.documents
@@ -0,0 +1,23 @@
+from firebase.firebase_hoadon import delete_hoadon
+from firebase.firebase_service import invoice_service as invoice_module
+from firebase.firebase_service.cache import Cache
+
+
+def test_month_delete_drops_cached_invoice_views(client, monkeypatch):
+    monkeypatch.setattr(delete_hoadon, "DB", client)
+    monkeypatch.setattr(invoice_module, "db", client)
+    service = invoice_module.FirestoreInvoiceService(Cache(name="test-invoices", sweep_interval=0))
+    documents = client._firestore_api.documents
+    documents["invoices/a"] = {"id": "a", "createdDate": "2026-09-05T08:00:00.000Z"}
+    documents["invoices/b"] = {"id": "b", "createdDate": "2026-09-30T20:00:00.000Z"}
+    documents["invoices/c"] = {"id": "c", "createdDate": "2026-10-01T07:00:00.000Z"}
+
+    assert [invoice["id"] for invoice in service.get_invoices_by_date("2026-09-05")] == ["a"]
+    assert [invoice["id"] for invoice in service.get_invoices_by_date("2026-10-01")] == ["c"]
+
+    summary = delete_hoadon.delete_invoices_by_month(2026, 9, invoice_cache=service.cache)
+
+    assert summary == {"deleted": 2, "total_matched": 2, "field": "createdDate"}
+    assert set(documents) == {"invoices/c"}
+    assert service.get_invoices_by_date("2026-09-05") == ()
+    assert [invoice["id"] for invoice in service.get_invoices_by_date("2026-10-01")] == ["c"]
@@ -0,0 +1,38 @@
+import json
+import pickle
+
+import pytest
+
+from firebase.firebase_service.cache import Cache
+from firebase.firebase_service.frozen import FrozenDict, freeze
+
+
+def test_cached_snapshots_reject_mutation():
+    cache = Cache(sweep_interval=0)
+    source = [{"Id": 1, "Units": [{"Unit": "lốc"}], "Tags": {"sale"}}]
+    cache.set("all_products", source)
+    products = cache.get("all_products")
+
+    with pytest.raises(TypeError):
+        products[0]["OnHand"] = 5
+    with pytest.raises(TypeError):
+        products[0]["Units"][0].update({"Unit": "thùng"})
+    with pytest.raises(AttributeError):
+        products.append({"Id": 2})
+    assert isinstance(products[0]["Tags"], frozenset)
+    # Every caller shares the one snapshot, and the caller's own list stays theirs
+    assert cache.get("all_products") is products
+    source[0]["Id"] = 9
+    assert products[0]["Id"] == 1
+
+
+def test_frozen_dict_still_behaves_like_a_dict():
+    snapshot = freeze({"Id": 1, "Units": [{"Unit": "lốc"}]})
+
+    assert isinstance(snapshot, dict)
+    assert json.loads(json.dumps(snapshot)) == {"Id": 1, "Units": [{"Unit": "lốc"}]}
+    assert pickle.loads(pickle.dumps(snapshot)) == snapshot
+    assert type(pickle.loads(pickle.dumps(snapshot))) is FrozenDict
+    copy = dict(snapshot)
+    copy["OnHand"] = 3
+    assert "OnHand" not in snapshot
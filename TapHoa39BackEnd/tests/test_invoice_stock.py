@@ -0,0 +1,64 @@
+import pytest
+
+from firebase.firebase_hanghoa import import_to_firestore as stock_sync
+
+
+@pytest.fixture
+def api(client, monkeypatch):
+    monkeypatch.setattr(stock_sync, "db", client)
+    api = client._firestore_api
+    api.documents["products/1"] = {"Id": 1, "OnHand": 10}
+    api.documents["products/2"] = {"Id": 2, "OnHand": 5}
+    api.commits = []
+    commit = api.commit
+
+    def counting_commit(request, **kwargs):
+        api.commits.append(len(request["writes"]))
+        return commit(request, **kwargs)
+
+    api.commit = counting_commit
+    return api
+
+
+INVOICE = [
+    {"productId": 1, "minus": 2, "invoiceId": "HD1"},
+    {"productId": 2, "minus": 1, "invoiceId": "HD1"},
+    {"productId": 1, "minus": 3, "invoiceId": "HD2"},
+    {"productId": 404, "minus": 1, "invoiceId": "HD1"},
+]
+
+
+def test_invoice_stock_is_applied_in_one_transaction(api):
+    result = stock_sync.update_products_from_banhang_app_to_firestore(INVOICE)
+
+    assert result["updated_products"] == [
+        {"Id": "1", "old_OnHand": 10, "new_OnHand": 8},
+        {"Id": "2", "old_OnHand": 5, "new_OnHand": 4},
+        {"Id": "1", "old_OnHand": 8, "new_OnHand": 5},
+    ]
+    # Two product writes (final OnHand each) and three markers in a single commit
+    assert api.commits == [5]
+    assert api.documents["products/1"]["OnHand"] == 5
+    assert api.documents["products/2"]["OnHand"] == 4
+    assert "SyncTimestamp" in api.documents["products/1"]
+    assert api.documents["product_updates_processed/HD1_1"] == {"applied": True, "productId": "1", "minus": 2}
+    assert "products/404" not in api.documents
+
+
+def test_replayed_invoice_lines_are_skipped(api):
+    stock_sync.update_products_from_banhang_app_to_firestore(INVOICE)
+
+    result = stock_sync.update_products_from_banhang_app_to_firestore(INVOICE + [{"productId": 2, "OnHand": 20}])
+
+    assert result["updated_products"] == [{"Id": "2", "old_OnHand": 4, "new_OnHand": 20}]
+    assert api.documents["products/1"]["OnHand"] == 5
+    assert api.documents["products/2"]["OnHand"] == 20
+
+
+def test_long_invoices_are_split_across_transactions(api, monkeypatch):
+    monkeypatch.setattr(stock_sync, "INVOICE_LINES_PER_TRANSACTION", 2)
+
+    stock_sync.update_products_from_banhang_app_to_firestore(INVOICE)
+
+    assert api.commits == [4, 2]
+    assert api.documents["products/1"]["OnHand"] == 5
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from Utility.json_stream import JsonArrayStream
+
+PAYLOAD = {
+    "total": 3,
+    "Data": [
+        {"id": 1, "name": "Mì Hảo Hảo", "basePrice": 4500, "units": [{"id": 11, "conversionValue": 30}]},
+        {"id": 2, "name": "Nước suối \"Lavie\"", "basePrice": 5000.5, "inventories": []},
+        {"id": 12345678901, "name": "Bánh", "basePrice": 1e3},
+    ],
+    "pageSize": 100,
+}
+
+
+def chunked(data: bytes, size: int):
+    return (data[start:start + size] for start in range(0, len(data), size))
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10000])
+def test_items_and_meta_for_any_chunking(size):
+    stream = JsonArrayStream(chunked(json.dumps(PAYLOAD, ensure_ascii=False).encode("utf-8"), size))
+
+    assert list(stream) == PAYLOAD["Data"]
+    assert stream.meta == {"total": 3, "pageSize": 100}
+
+
+def test_number_split_across_chunks():
+    stream = JsonArrayStream([b'{"Data": [12', b"34, 5", b"6]}"])
+
+    assert list(stream) == [1234, 56]
+
+
+def test_empty_payloads():
+    assert list(JsonArrayStream([b"{}"])) == []
+    stream = JsonArrayStream([b'{"Data": [], "total": 0}'])
+    assert list(stream) == []
+    assert stream.meta == {"total": 0}
+
+
+def test_truncated_payload_raises():
+    with pytest.raises(ValueError):
+        list(JsonArrayStream([b'{"Data": [{"id": 1}, {"id": 2']))
@@ -0,0 +1,75 @@
+import pytest
+import requests
+
+from firebase.firebase_service import product_service as product_module
+from firebase.firebase_service.cache import Cache
+
+PAGE = product_module.API_PAGE_SIZE
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self._payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture
+def service(client, monkeypatch):
+    monkeypatch.setattr(product_module, "db", client)
+    monkeypatch.setattr(product_module, "_api_headers", lambda: {})
+    monkeypatch.setattr(product_module.time, "sleep", lambda seconds: None)
+    return product_module.FirestoreProductService(Cache(name="test-pages"))
+
+
+def serve_pages(monkeypatch, total, broken=()):
+    calls = []
+
+    def fake_get(url, params=None, **kwargs):
+        page = params["pageIndex"]
+        calls.append(page)
+        if page in broken:
+            raise requests.exceptions.ConnectionError(f"page {page} unreachable")
+        start = page * PAGE
+        data = [{"Id": pid, "Code": f"SP{pid}"} for pid in range(start, min(start + PAGE, total))]
+        return FakeResponse({"Data": data, "Total": total})
+
+    monkeypatch.setattr(product_module.requests, "get", fake_get)
+    return calls
+
+
+def test_pages_are_yielded_in_order(service, monkeypatch):
+    serve_pages(monkeypatch, total=PAGE * 3 + 10)
+
+    pages = list(service._iter_pages())
+
+    assert [page for page, _ in pages] == [0, 1, 2, 3]
+    assert sum(len(items) for _, items in pages) == PAGE * 3 + 10
+
+
+def test_failed_page_raises_instead_of_ending_the_catalog(service, monkeypatch):
+    calls = serve_pages(monkeypatch, total=PAGE * 4, broken={2})
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        list(service._iter_pages())
+    assert calls.count(2) == 3
+
+
+def test_sync_with_a_failed_page_fails_and_keeps_the_watermark(service, client, monkeypatch):
+    serve_pages(monkeypatch, total=PAGE * 3, broken={1})
+    def single_batch_truncated(seen_ids, filters=None):
+        # Truncated single fetch: everything comes from the paginated API
+        return False
+        yield
+
+    monkeypatch.setattr(service, "_iter_single_batch", single_batch_truncated)
+
+    result = service.sync_products_from_kiotviet(mode="full")
+
+    assert result["success"] is False
+    assert "page 1 unreachable" in result["error"]
+    assert "sync_state/kiotviet_products" not in client._firestore_api.documents
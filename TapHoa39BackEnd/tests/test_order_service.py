@@ -0,0 +1,41 @@
+import threading
+import time
+
+import pytest
+
+from firebase.firebase_service import order_service as order_module
+from firebase.firebase_service.cache import Cache
+
+
+@pytest.fixture
+def orders(client, monkeypatch):
+    monkeypatch.setattr(order_module, "db", client)
+    client._firestore_api.documents["orders/1"] = {"status": "new"}
+    return order_module.FirestoreorderService(Cache(name="test-orders", sweep_interval=0))
+
+
+def test_stale_orders_are_served_while_one_refresh_reads_firestore(orders, client, monkeypatch):
+    # A list read earlier that has gone past its soft TTL
+    orders.cache.set("all_orders", [{"status": "new", "id": "1"}], ttl=0, hard_ttl=60, tags=(order_module.ORDERS_TAG,))
+    client._firestore_api.documents["orders/2"] = {"status": "new"}
+
+    loads, release = [], threading.Event()
+    load = orders._load_all_orders
+
+    def slow_load():
+        loads.append(1)
+        release.wait(5)
+        return load()
+
+    monkeypatch.setattr(orders, "_load_all_orders", slow_load)
+
+    # Both reads get the old list at once; one refresh runs behind them
+    assert orders.read_all_orders() == ({"status": "new", "id": "1"},)
+    assert orders.read_all_orders() == ({"status": "new", "id": "1"},)
+    release.set()
+    deadline = time.time() + 5
+    while orders.cache.get("all_orders") is None and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert orders.read_all_orders() == ({"status": "new", "id": "1"}, {"status": "new", "id": "2"})
+    assert len(loads) == 1
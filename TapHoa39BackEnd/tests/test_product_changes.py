@@ -0,0 +1,87 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from firebase.firebase_service import product_service as product_module
+from firebase.firebase_service.cache import Cache
+from firebase.firebase_service.product_changes import format_timestamp
+
+
+def stamp(minutes_ago: float) -> str:
+    return format_timestamp(datetime.utcnow() - timedelta(minutes=minutes_ago))
+
+
+@pytest.fixture
+def service(client, monkeypatch):
+    monkeypatch.setattr(product_module, "db", client)
+    service = product_module.FirestoreProductService(Cache(name="test-changes"))
+    # No background tombstone purge during the tests
+    service._tombstones_purged_at = time.time()
+    documents = client._firestore_api.documents
+    documents["products/1"] = {"Id": 1, "Name": "Mì", "SyncTimestamp": stamp(60)}
+    documents["products/2"] = {"Id": 2, "Name": "Nước", "SyncTimestamp": stamp(30)}
+    documents["products/3"] = {"Id": 3, "Name": "Bánh", "SyncTimestamp": stamp(20)}
+    documents["product_tombstones/4"] = {"Id": "4", "DeletedAt": stamp(25), "SyncTimestamp": stamp(25)}
+    # Re-added after its delete: reported as a product, not as deleted
+    documents["products/5"] = {"Id": 5, "Name": "Kẹo", "SyncTimestamp": stamp(10)}
+    documents["product_tombstones/5"] = {"Id": "5", "DeletedAt": stamp(15), "SyncTimestamp": stamp(15)}
+    return service
+
+
+def test_changes_after_a_watermark(service):
+    since = stamp(45)
+    changes = service.get_product_changes(since=since)
+
+    assert changes["reset"] is False
+    assert changes["has_more"] is False
+    assert sorted(p["Id"] for p in changes["products"]) == [2, 3, 5]
+    assert changes["deleted"] == ["4"]
+    assert changes["watermark"] == service.products_ref.document("5").get().to_dict()["SyncTimestamp"]
+
+
+def test_pages_cut_both_queries_at_the_same_point(service):
+    # Applied in page order, the client ends up with the latest state of every product
+    replica = {"1": "Mì", "4": "Đường"}
+    changes = service.get_product_changes(since=stamp(45), limit=1)
+    pages = 0
+    while True:
+        pages += 1
+        for product in changes["products"]:
+            replica[str(product["Id"])] = product["Name"]
+        for pid in changes["deleted"]:
+            replica.pop(pid, None)
+        if not changes["has_more"]:
+            break
+        assert changes["watermark"] > changes["since"]
+        changes = service.get_product_changes(since=changes["watermark"], limit=1)
+
+    assert pages > 1
+    assert replica == {"1": "Mì", "2": "Nước", "3": "Bánh", "5": "Kẹo"}
+
+
+def test_no_watermark_resets_to_the_full_catalog(service):
+    changes = service.get_product_changes()
+
+    assert changes["reset"] is True
+    assert sorted(p["Id"] for p in changes["products"]) == [1, 2, 3, 5]
+    assert changes["watermark"] == max(p["SyncTimestamp"] for p in changes["products"])
+    assert service.get_product_changes(since=changes["watermark"])["products"] == []
+
+
+def test_reset_reads_firestore_and_caps_the_watermark(service, client):
+    # A cached catalog from before the latest writes
+    service.read_catalog()
+    documents = client._firestore_api.documents
+    # Stamped a moment ago: may still have writes committing behind it
+    documents["products/6"] = {"Id": 6, "Name": "Sữa", "SyncTimestamp": stamp(0)}
+
+    changes = service.get_product_changes()
+
+    assert 6 in {p["Id"] for p in changes["products"]}
+    assert changes["watermark"] < documents["products/6"]["SyncTimestamp"]
+    assert changes["watermark"] >= documents["products/5"]["SyncTimestamp"]
+    # A write stamped inside the lag window before the reset is still delivered afterwards
+    documents["products/7"] = {"Id": 7, "Name": "Bia", "SyncTimestamp": stamp(0.01)}
+    later = service.get_product_changes(since=changes["watermark"])
+    assert 7 in {p["Id"] for p in later["products"]}
@@ -0,0 +1,159 @@
+from firebase.firebase_service.product_index import ProductIndex
+
+PRODUCTS = [
+    {"Id": 1, "Code": "8934563138165", "FullName": "Mì Hảo Hảo tôm chua cay", "BasePrice": 4500, "isActive": True},
+    {"Id": 2, "Code": "MIGOI", "FullName": "Mì gói Omachi", "BasePrice": 7000, "isActive": True},
+    {"Id": 3, "Code": "NUOC1", "FullName": "Nước suối Lavie 500ml", "BasePrice": 5000, "isActive": True},
+    {"Id": 4, "Code": "NUOC2", "FullName": "Nước ngọt Coca", "BasePrice": 10000, "isActive": False},
+    {"Id": 5, "Code": "KEO", "FullName": "Kẹo mút", "BasePrice": 1000, "isActive": True, "isDeleted": True},
+    {"Id": 6, "Code": "BANH", "FullName": "Bánh mì que", "BasePrice": 3000, "isActive": True},
+]
+
+
+def make_index():
+    index = ProductIndex()
+    index.rebuild(PRODUCTS, "w1")
+    return index
+
+
+def ids(products):
+    return [product["Id"] for product in products]
+
+
+def test_search_ignores_diacritics_and_needs_every_term():
+    index = make_index()
+
+    assert set(ids(index.search("mi"))) == {1, 2, 6}
+    assert ids(index.search("nuoc lavie")) == [3]
+    assert ids(index.search("MÌ omachi")) == [2]
+
+
+def test_search_ranks_exact_code_first_and_hides_invisible_products():
+    index = make_index()
+
+    assert ids(index.search("8934563138165")) == [1]
+    assert ids(index.search("nuoc")) == [3]
+    assert set(ids(index.search("nuoc", include_inactive=True))) == {3, 4}
+    assert ids(index.search("keo")) == []
+    assert ids(index.search("keo", include_deleted=True)) == [5]
+
+
+def test_search_follows_renames():
+    index = make_index()
+    index.patch(3, {"FullName": "Nước khoáng Aquafina"})
+
+    assert ids(index.search("lavie")) == []
+    assert ids(index.search("aquafina")) == [3]
+    assert index.search("nuoc khoang")[0]["Code"] == "NUOC1"
+
+
+def test_pages_walk_the_visible_products_in_order():
+    index = make_index()
+
+    first, more = index.page("BasePrice", limit=2)
+    assert ids(first) == [6, 1]
+    assert more is True
+    second, more = index.page("BasePrice", after=(first[-1]["BasePrice"], first[-1]["Id"]), limit=2)
+    assert ids(second) == [3, 2]
+    assert more is False
+
+    index.patch(2, {"BasePrice": 500})
+    assert ids(index.page("BasePrice", limit=10)[0]) == [2, 6, 1, 3]
+    assert ids(index.page("BasePrice", limit=10, include_inactive=True, include_deleted=True)[0]) == [2, 5, 6, 1, 3, 4]
+
+
+def test_visibility_matches_the_catalog_views():
+    odd_flags = [
+        {"Id": 11, "Code": "F11", "FullName": "Trà xanh", "isActive": "yes"},
+        {"Id": 12, "Code": "F12", "FullName": "Trà đá", "isActive": "n"},
+        {"Id": 13, "Code": "F13", "FullName": "Trà sữa", "isActive": 0.0},
+        {"Id": 14, "Code": "F14", "FullName": "Trà chanh", "isActive": "maybe", "isDeleted": "Y"},
+        {"Id": 15, "Code": "F15", "FullName": "Trà đào", "isDeleted": 1.0},
+    ]
+    index = ProductIndex()
+    index.rebuild(odd_flags, None)
+    catalog = index.catalog()
+
+    for include_inactive in (False, True):
+        for include_deleted in (False, True):
+            expected = {p["Id"] for p in catalog.view(include_inactive, include_deleted)}
+            found = index.search("tra", include_inactive=include_inactive, include_deleted=include_deleted)
+            paged, _ = index.page("Id", limit=10, include_inactive=include_inactive, include_deleted=include_deleted)
+            assert set(ids(found)) == expected
+            assert set(ids(paged)) == expected
+    assert ids(index.search("tra")) == [11]
+
+
+def test_pages_do_not_skip_products_sharing_a_value():
+    stamp = "2026-10-01T08:00:00.000000"
+    index = ProductIndex()
+    index.rebuild([{"Id": pid, "SyncTimestamp": stamp if pid < 8 else f"2026-10-02T{pid:02d}:00:00.000000"} for pid in range(1, 11)], None)
+
+    seen, after = [], None
+    while True:
+        products, more = index.page("SyncTimestamp", after=after, limit=3)
+        seen += ids(products)
+        if not more:
+            break
+        after = (products[-1]["SyncTimestamp"], products[-1]["Id"])
+
+    assert seen == list(range(1, 11))
+
+
+def grouped_index():
+    index = ProductIndex()
+    index.rebuild([
+        {"Id": 1, "Code": "MI", "OnHand": 10, "isActive": True},
+        {"Id": 2, "Code": "MI-LOC", "MasterUnitId": 1, "ConversionValue": 6, "OnHand": 1, "isActive": True},
+        {"Id": 3, "Code": "MI-THUNG", "MasterUnitId": 1, "ConversionValue": 30, "OnHand": 0, "isActive": True},
+        {"Id": 4, "Code": "NUOC", "OnHand": 5, "isActive": True},
+        {"Id": 5, "Code": "NUOC-LOC", "MasterUnitId": 4, "ConversionValue": 24, "OnHand": 2, "isActive": True},
+    ], None)
+    return index
+
+
+def test_stock_changes_patch_only_their_group(monkeypatch):
+    index = grouped_index()
+    before = index.grouped()
+    assert [ids(group["children"]) for group in before.values()] == [[2, 3], [5]]
+
+    # Rebuilding the grouping walks every product; a stock change must not
+    monkeypatch.setattr(index._products, "ids", lambda: (_ for _ in ()).throw(AssertionError("full rebuild")))
+    index.patch(2, {"OnHand": 0})
+    index.patch(1, {"OnHand": 9})
+    after = index.grouped()
+
+    assert after is not before
+    assert after["1"]["master"]["OnHand"] == 9
+    assert [child["OnHand"] for child in after["1"]["children"]] == [0, 0]
+    assert after["4"] is before["4"]
+    assert before["1"]["master"]["OnHand"] == 10
+    assert index.grouped() is after
+
+
+def test_grouping_changes_rebuild_the_groups():
+    index = grouped_index()
+    index.grouped()
+
+    index.patch(5, {"MasterUnitId": 1})
+    index.patch(3, {"isActive": False})
+    grouped = index.grouped()
+
+    assert ids(grouped["1"]["children"]) == [2, 5]
+    assert grouped["4"]["children"] == []
+
+
+def test_variants_follow_unit_and_variant_links():
+    index = grouped_index()
+    index.upsert({"Id": 6, "Code": "MI-CAY", "MasterProductId": 1, "OnHand": 4, "isActive": True})
+
+    assert ids(index.variants_of(1)) == [6, 2, 3]
+    assert ids(index.variants_of("4")) == [5]
+    assert index.variants_of(None) == []
+
+    index.patch(3, {"isDeleted": True})
+    index.remove(6)
+
+    assert ids(index.variants_of(1)) == [2, 3]
+    assert ids(index.variants_of(1, include_deleted=False)) == [2]
+    assert ids(index.grouped()["1"]["children"]) == [2]
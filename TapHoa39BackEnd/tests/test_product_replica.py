@@ -0,0 +1,139 @@
+import pickle
+import threading
+
+from firebase.firebase_service.product_index import ProductIndex
+from firebase.firebase_service.product_replica import ColumnarCatalog
+
+
+def product(pid, **fields):
+    record = {
+        "Name": f"Sản phẩm {pid}",
+        "Id": pid,
+        "Code": f"SP{pid:05d}",
+        "OnHand": pid % 7,
+        "BasePrice": 1000.5 * pid,
+        "isActive": pid % 5 != 0,
+        "isDeleted": False,
+        "ProductAttributes": [{"AttributeName": "Màu", "AttributeValue": "Đỏ"}],
+        "SyncTimestamp": f"2026-10-01T00:00:{pid % 60:02d}.000000",
+    }
+    record.update(fields)
+    return record
+
+
+def as_plain(value):
+    if isinstance(value, dict):
+        return {key: as_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [as_plain(item) for item in value]
+    return value
+
+
+def test_rows_round_trip_with_original_key_order():
+    records = [product(pid) for pid in range(1, 40)]
+    records.append({"Id": 99, "isActive": "false", "OnHand": 2 ** 60, "Rare": {"a": 1}, "Code": None})
+    catalog = ColumnarCatalog(records)
+
+    for position, record in enumerate(records):
+        row = catalog.row(position)
+        assert list(row) == list(record)
+        assert as_plain(row) == record
+        assert type(row["Id"]) is int
+    assert catalog.value(len(records) - 1, "OnHand") == 2 ** 60
+    assert catalog.value(0, "Missing", "default") == "default"
+
+
+def test_views_filter_and_are_shared_between_threads():
+    catalog = ColumnarCatalog([product(pid) for pid in range(1, 101)])
+    seen = []
+    barrier = threading.Barrier(8)
+
+    def _view():
+        barrier.wait()
+        seen.append(catalog.view())
+
+    threads = [threading.Thread(target=_view) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(view) for view in seen}) == 1
+    assert len(seen[0]) == 80
+    assert len(catalog.view(include_inactive=True)) == 100
+
+
+def test_catalog_pickles():
+    catalog = ColumnarCatalog([product(pid) for pid in range(1, 10)])
+    catalog.view()
+
+    copy = pickle.loads(pickle.dumps(catalog))
+
+    assert list(copy.view(include_inactive=True)) == list(catalog.view(include_inactive=True))
+    assert copy.view() is copy.view()
+
+
+def test_index_shares_the_catalog_columns():
+    catalog = ColumnarCatalog([product(pid) for pid in range(1, 101)])
+    index = ProductIndex()
+    index.rebuild(catalog.view(include_inactive=True, include_deleted=True), "w1")
+
+    assert index.catalog() is catalog
+    assert len(index) == 100
+    assert index.get(7)["Code"] == "SP00007"
+    assert index.find_by_code("sp00007")["Id"] == 7
+    assert [p["Id"] for p in index.search("SP00007")] == [7]
+
+
+def test_index_changes_show_up_in_lookups_and_the_next_catalog():
+    catalog = ColumnarCatalog([product(pid) for pid in range(1, 101)])
+    index = ProductIndex()
+    index.rebuild(catalog.view(include_inactive=True, include_deleted=True), "w1")
+
+    index.patch(3, {"OnHand": 50, "Name": "Nước mắm"})
+    index.remove(4)
+    index.upsert(product(500))
+
+    assert index.get(3)["OnHand"] == 50
+    assert index.get(4) is None
+    assert len(index) == 100
+    assert [p["Id"] for p in index.search("nuoc mam")] == [3]
+    products, has_more = index.page("Id", after=(2, 2), limit=2)
+    assert [p["Id"] for p in products] == [3, 6]  # 4 removed, 5 inactive
+    assert has_more
+
+    updated = index.catalog()
+    assert updated is not catalog
+    rows = {row["Id"]: row for row in updated.view(include_inactive=True)}
+    assert rows[3]["OnHand"] == 50 and 4 not in rows and 500 in rows
+    assert list(rows[3]) == list(product(3))
+    # The index now reads from the new columns
+    assert index.catalog() is updated
+    assert index.get(3)["Name"] == "Nước mắm"
+
+
+def test_writes_during_a_catalog_build_are_kept(monkeypatch):
+    from firebase.firebase_service import product_index
+
+    index = ProductIndex()
+    index.rebuild([product(pid) for pid in range(1, 21)], "w1")
+    index.patch(1, {"OnHand": 11})
+    build = product_index.ColumnarCatalog
+
+    def build_while_writing(records):
+        # Another request writes while the new columns are encoded
+        index.patch(2, {"OnHand": 22})
+        index.remove(3)
+        return build(records)
+
+    monkeypatch.setattr(product_index, "ColumnarCatalog", build_while_writing)
+    catalog = index.catalog()
+    monkeypatch.setattr(product_index, "ColumnarCatalog", build)
+
+    rows = {row["Id"]: row for row in catalog.view(include_inactive=True)}
+    assert rows[1]["OnHand"] == 11 and rows[2]["OnHand"] == 2 and 3 in rows
+    assert index.get(1)["OnHand"] == 11
+    assert index.get(2)["OnHand"] == 22
+    assert index.get(3) is None
+    assert len(index) == 19
+    assert index.catalog() is not catalog
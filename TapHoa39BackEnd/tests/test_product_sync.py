@@ -0,0 +1,173 @@
+from datetime import datetime
+
+import pytest
+
+from firebase.firebase_service import product_service as product_module
+from firebase.firebase_service.cache import Cache
+from firebase.firebase_service.field_diff import changed_fields, checksum, fingerprints
+
+
+def api_item(**fields):
+    raw = {
+        "Id": 1,
+        "Code": "SP1",
+        "Name": "Mì tôm",
+        "OnHand": 5,
+        "BasePrice": 4000,
+        "ModifiedDate": "2026-10-01T08:00:00",
+        "ProductAttributes": [{"AttributeName": "Vị", "AttributeValue": "Chua cay"}],
+    }
+    raw.update(fields)
+    return product_module.FirestoreProductService._coerce_api_item(raw)
+
+
+@pytest.fixture
+def service(client, monkeypatch):
+    monkeypatch.setattr(product_module, "db", client)
+    return product_module.FirestoreProductService(Cache(name="test-sync"))
+
+
+def run_full_sync(service, monkeypatch, items):
+    monkeypatch.setattr(service, "iter_api_items", lambda modified_since=None: iter([dict(item) for item in items]))
+    result = service.sync_products_from_kiotviet(mode="full")
+    assert result["success"], result
+    return result
+
+
+def test_changed_fields_ignores_equal_values():
+    stored = {"Name": "Mì", "OnHand": 5, "isActive": 1, "ModifiedDate": datetime(2026, 1, 1), "Tags": ["a"]}
+    item = {"Name": "Mì", "OnHand": 5.0, "isActive": True, "ModifiedDate": datetime(2026, 1, 1), "Tags": ["a"], "New": 1}
+    assert changed_fields(fingerprints(item), stored) == ["isActive", "New"]
+    assert checksum(fingerprints({"a": 1, "b": 2})) == checksum(fingerprints({"b": 2, "a": 1}))
+
+
+def test_full_sync_diffs_against_firestore_not_a_stale_index(service, client, monkeypatch):
+    current = api_item(OnHand=9, Name="Mì cũ")
+    client._firestore_api.documents["products/1"] = {**current, "SyncChecksum": "stale"}
+    # The index still holds an older copy in which OnHand already matches KiotViet
+    service._index.rebuild([{**current, "OnHand": 5}], None)
+
+    result = run_full_sync(service, monkeypatch, [api_item()])
+
+    stored = client._firestore_api.documents["products/1"]
+    assert stored["Name"] == "Mì tôm"
+    assert stored["OnHand"] == 5
+    assert stored["SyncChecksum"] == service.hash_item(api_item())
+    assert result["stats"]["updated_or_created"] == 1
+    assert client._firestore_api.documents["sync_state/kiotviet_products"]["LastMode"] == "full"
+
+
+def test_full_sync_migrates_old_checksums_without_touching_data(service, client, monkeypatch):
+    item = api_item()
+    client._firestore_api.documents["products/1"] = {**item, "SyncChecksum": "md5-of-json", "SyncTimestamp": "old"}
+
+    result = run_full_sync(service, monkeypatch, [item])
+
+    stored = client._firestore_api.documents["products/1"]
+    assert stored["SyncChecksum"] == service.hash_item(item)
+    assert stored["SyncTimestamp"] == "old"
+    assert result["stats"]["updated_or_created"] == 0
+    assert result["stats"]["fields_written"] == 0
+
+
+def test_full_sync_creates_missing_products(service, client, monkeypatch):
+    run_full_sync(service, monkeypatch, [api_item(Id=2, Code="SP2")])
+
+    stored = client._firestore_api.documents["products/2"]
+    assert stored["Code"] == "SP2"
+    assert stored["SyncChecksum"] == service.hash_item(api_item(Id=2, Code="SP2"))
+
+
+def test_sync_mode_runs_full_until_checksums_are_current():
+    resolve = product_module.FirestoreProductService._resolve_sync_mode
+    recent = {"ModifiedWatermark": "2026-10-01T00:00:00", "LastFullSyncAt": datetime.utcnow().isoformat()}
+
+    assert resolve("auto", recent) == "full"
+    assert resolve("incremental", recent) == "full"
+    current = {**recent, "ChecksumVersion": product_module.CHECKSUM_VERSION}
+    assert resolve("auto", current) == "incremental"
+    assert resolve("full", current) == "full"
+
+
+def test_full_sync_records_checksum_version(service, client, monkeypatch):
+    run_full_sync(service, monkeypatch, [api_item()])
+
+    state = service.get_product_sync_state()
+    assert state["ChecksumVersion"] == product_module.CHECKSUM_VERSION
+    assert service._resolve_sync_mode("auto", state) == "incremental"
+
+
+def test_compare_recomputes_checksums_on_both_sides(service, client, monkeypatch):
+    from flask import Flask
+
+    from firebase.firebase_hanghoa.product_class import Product
+    from firebase.firebase_service.sync_jobs import SyncJobRunner
+    from routes.sync_routes import create_sync_routes_bp
+
+    same, changed = api_item(Id=1), api_item(Id=2, Code="SP2")
+    client._firestore_api.documents["products/1"] = {**same, "SyncChecksum": "md5-of-json"}
+    client._firestore_api.documents["products/2"] = {**changed, "OnHand": 99, "SyncChecksum": "md5-of-json"}
+    monkeypatch.setattr(service, "fetch_api_items", lambda: [Product(**same), Product(**changed)])
+    app = Flask(__name__)
+    app.register_blueprint(create_sync_routes_bp(service, SyncJobRunner({})))
+
+    body = app.test_client().get("/api/sync/kiotviet/firebase/products/compare").get_json()
+
+    assert [item["Id"] for item in body["checksum_mismatches"]] == ["2"]
+
+
+def run_incremental_sync(service, monkeypatch, items):
+    requested = []
+
+    def iter_api_items(modified_since=None):
+        requested.append(modified_since)
+        return iter([dict(item) for item in items])
+
+    monkeypatch.setattr(service, "iter_api_items", iter_api_items)
+    result = service.sync_products_from_kiotviet(mode="incremental")
+    assert result["success"], result
+    assert result["mode"] == "incremental"
+    return result, requested[0]
+
+
+def test_incremental_sync_skips_unmodified_products_and_advances_the_watermark(service, client, monkeypatch):
+    old = api_item(Id=1, ModifiedDate="2026-09-01T08:00:00")
+    sold = api_item(Id=2, Code="SP2", ModifiedDate="2026-09-01T08:00:00")
+    recent = api_item(Id=4, Code="SP4")
+    run_full_sync(service, monkeypatch, [old, sold, recent])
+    assert service.get_product_sync_state()["ModifiedWatermark"] == "2026-10-01T08:00:00"
+
+    edited = api_item(Id=3, Code="SP3", ModifiedDate="2026-10-02T09:30:00")
+    result, since = run_incremental_sync(service, monkeypatch, [
+        old,
+        # A sale moves OnHand without bumping ModifiedDate
+        api_item(Id=2, Code="SP2", ModifiedDate="2026-09-01T08:00:00", OnHand=1),
+        # Inside the overlap window: compared by checksum, not skipped
+        recent,
+        edited,
+    ])
+
+    overlap = product_module.SYNC_WATERMARK_OVERLAP_SECONDS
+    assert since == datetime(2026, 10, 1, 8, 0) - product_module.timedelta(seconds=overlap)
+    assert result["stats"]["skipped_unmodified"] == 1
+    assert result["stats"]["unchanged"] == 2
+    assert result["stats"]["updated_or_created"] == 2
+    documents = client._firestore_api.documents
+    assert documents["products/2"]["OnHand"] == 1
+    assert documents["products/3"]["Code"] == "SP3"
+    assert result["watermark"] == "2026-10-02T09:30:00"
+    assert service.get_product_sync_state()["ModifiedWatermark"] == "2026-10-02T09:30:00"
+
+
+def test_failed_writes_keep_the_watermark(service, client, monkeypatch):
+    from google.rpc import code_pb2
+
+    run_full_sync(service, monkeypatch, [api_item()])
+    client._firestore_api.fail["products/3"] = code_pb2.PERMISSION_DENIED
+
+    result, _ = run_incremental_sync(service, monkeypatch, [
+        api_item(Id=3, Code="SP3", ModifiedDate="2026-10-02T09:30:00"),
+    ])
+
+    assert result["stats"]["write_errors"] == 1
+    assert service.get_product_sync_state()["ModifiedWatermark"] == "2026-10-01T08:00:00"
@@ -0,0 +1,149 @@
+import pytest
+from google.api_core.exceptions import NotFound
+
+from firebase.firebase_service import product_service as product_module
+from firebase.firebase_service.cache import Cache
+from routes.shared import apply_product_updates
+
+
+@pytest.fixture
+def service(client, monkeypatch):
+    monkeypatch.setattr(product_module, "db", client)
+    service = product_module.FirestoreProductService(Cache(name="test-products"))
+    products = [
+        {"Id": 1, "Code": "SP1", "Name": "Mì", "OnHand": 5, "isActive": True},
+        {"Id": 2, "Code": "SP2", "Name": "Nước", "OnHand": 7, "isActive": True},
+        {"Id": 3, "Code": "SP3", "Name": "Bánh", "OnHand": 1, "isActive": True},
+    ]
+    for product in products:
+        client._firestore_api.documents[f"products/{product['Id']}"] = dict(product)
+    service._index.rebuild(products, None)
+    return service
+
+
+def test_bulk_update_with_duplicate_ids(service, client):
+    results = service.update_products_bulk([
+        ("1", {"OnHand": 4}),
+        ("1", {"OnHand": 3}),
+        ("404", {"OnHand": 1}),
+        ("2", {"Name": "Nước suối"}),
+    ])
+
+    assert results[0] == {"message": "Product updated"}
+    assert results[1] == {"message": "Product updated"}
+    assert isinstance(results[2], NotFound)
+    assert results[3] == {"message": "Product updated"}
+    documents = client._firestore_api.documents
+    assert documents["products/1"]["OnHand"] == 3
+    assert documents["products/2"]["Name"] == "Nước suối"
+    assert service._index.get("1")["OnHand"] == 3
+
+
+def test_bulk_update_removes_deleted_product_once(service, client):
+    results = service.update_products_bulk([
+        ("3", {"isDeleted": True}),
+        ("3", {"OnHand": 0}),
+        ("2", {"OnHand": 9}),
+    ])
+
+    assert results[0] == {"message": "Product removed because inactive or deleted"}
+    assert results[1] == {"message": "Product removed because inactive or deleted"}
+    assert results[2] == {"message": "Product updated"}
+    documents = client._firestore_api.documents
+    assert "products/3" not in documents
+    assert "product_tombstones/3" in documents
+    assert documents["products/2"]["OnHand"] == 9
+    assert service._index.get("3") is None
+
+
+def test_apply_product_updates_reports_each_item(service):
+    results, broadcast = apply_product_updates(service, [
+        {"Id": "1", "fields": {"OnHand": 2}},
+        {"Id": "1", "fields": {"OnHand": 1}},
+        {"Id": "404", "fields": {"OnHand": 3}},
+        {"Id": "2", "fields": {"OnHand": 8}},
+    ])
+
+    assert results[0] == {"id": "1", "result": {"message": "Product updated"}}
+    assert results[1] == {"id": "1", "result": {"message": "Product updated"}}
+    assert results[2]["result"].startswith("error: ")
+    assert results[3] == {"id": "2", "result": {"message": "Product updated"}}
+    assert [item["Id"] for item in broadcast] == ["1", "1", "2"]
+    assert service.read_product("1")["OnHand"] == 1
+
+
+def test_catalog_shares_the_index_columns(service):
+    catalog = service.read_catalog()
+    assert catalog is service._index.catalog()
+
+    service.update_products_bulk([("2", {"OnHand": 1})])
+
+    products = {p["Id"]: p for p in service.read_all_products()}
+    assert products[2]["OnHand"] == 1
+    assert service.read_catalog() is service._index.catalog()
+
+
+def test_fresh_read_skips_the_cache_and_the_index(service, client, monkeypatch):
+    service.read_catalog()
+    client._firestore_api.documents["products/2"]["OnHand"] = 42
+    snapshots = []
+    monkeypatch.setattr(service, "_schedule_catalog_snapshot", snapshots.append)
+
+    products = {p["Id"]: p for p in service.read_all_products_fresh()}
+
+    assert products[2]["OnHand"] == 42
+    assert service._index.get("2")["OnHand"] == 7
+    assert snapshots == []
+
+
+def read_in_the_gap(service, monkeypatch):
+    """A catalog read landing while the index is being patched."""
+    upsert = service._index.upsert
+
+    def upsert_after_a_read(product):
+        service.read_catalog()
+        upsert(product)
+
+    monkeypatch.setattr(service._index, "upsert", upsert_after_a_read)
+
+
+def test_update_product_leaves_no_stale_catalog_cached(service, monkeypatch):
+    service.read_catalog()
+    read_in_the_gap(service, monkeypatch)
+
+    assert service.update_product("1", {"OnHand": 2}) == {"message": "Product updated"}
+
+    products = {p["Id"]: p for p in service.read_all_products()}
+    assert products[1]["OnHand"] == 2
+
+
+def test_add_product_leaves_no_stale_catalog_cached(service, monkeypatch):
+    service.read_catalog()
+    read_in_the_gap(service, monkeypatch)
+
+    service.add_product({"Id": 4, "Code": "SP4", "Name": "Kẹo", "OnHand": 3, "isActive": True})
+
+    assert 4 in {p["Id"] for p in service.read_all_products()}
+
+
+@pytest.mark.parametrize("loaded", [True, False])
+def test_cursor_pages_with_duplicate_stamps(service, client, monkeypatch, loaded):
+    stamp = "2026-10-01T08:00:00.000000"
+    documents = client._firestore_api.documents
+    products = []
+    for pid in range(1, 8):
+        product = {"Id": pid, "Code": f"SP{pid}", "OnHand": pid, "isActive": True, "SyncTimestamp": stamp}
+        documents[f"products/{pid}"] = product
+        products.append(dict(product))
+    service._index.rebuild(products, None)
+    monkeypatch.setattr(service._index, "loaded", loaded)
+
+    seen, cursor = [], None
+    while True:
+        page = service.list_products_page(order_by="SyncTimestamp", cursor=cursor, page_size=2, fields=["OnHand"])
+        seen += [product["Id"] for product in page["products"]]
+        cursor = page["next_cursor"]
+        if not page["has_more"]:
+            break
+
+    assert seen == list(range(1, 8))
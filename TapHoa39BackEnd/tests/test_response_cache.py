@@ -0,0 +1,69 @@
+import gc
+import weakref
+
+import pytest
+from flask import Flask
+
+from firebase.firebase_service.cache import Cache
+from firebase.firebase_service.product_replica import ColumnarCatalog
+from routes import response_cache as response_module
+from routes.response_cache import ResponseCache
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def respond(app, cache, key, source, headers=None, build=None):
+    with app.test_request_context(headers=headers or {}):
+        return cache.respond(key, source, build=build)
+
+
+def test_unchanged_snapshot_reuses_body_and_etag(app):
+    cache = Cache(sweep_interval=0)
+    cache.set("all_orders", [{"id": "1"}])
+    responses = ResponseCache()
+    orders = cache.get("all_orders")
+
+    first = respond(app, responses, "orders", orders)
+    second = respond(app, responses, "orders", orders, headers={"If-None-Match": first.get_etag()[0]})
+
+    assert first.get_json() == [{"id": "1"}]
+    assert second.status_code == 304
+    cache.set("all_orders", [{"id": "1"}, {"id": "2"}])
+    third = respond(app, responses, "orders", cache.get("all_orders"), headers={"If-None-Match": first.get_etag()[0]})
+    assert third.status_code == 200
+    assert len(third.get_json()) == 2
+
+
+def test_entries_do_not_keep_their_snapshot_alive(app):
+    responses = ResponseCache()
+    catalog = ColumnarCatalog([{"Id": pid, "isActive": True} for pid in range(10)])
+    respond(app, responses, ("get/products", False, False, ()), catalog.view(), build=list)
+    collected = weakref.ref(catalog)
+    del catalog
+    gc.collect()
+
+    assert collected() is None
+    cache = Cache(sweep_interval=0)
+    cache.set("all_customers", [{"Id": 1}])
+    respond(app, responses, "get/customers", cache.get("all_customers"))
+    # The body of the collected catalog went with the next store
+    assert len(responses) == 1
+    cache.invalidate("all_customers")
+    cache.set("all_orders", [{"id": "1"}])
+    respond(app, responses, "orders", cache.get("all_orders"))
+    assert len(responses) == 1
+
+
+def test_query_variants_per_endpoint_are_bounded(app, monkeypatch):
+    monkeypatch.setattr(response_module, "RESPONSE_CACHE_MAX_VARIANTS", 3)
+    responses = ResponseCache()
+    catalog = ColumnarCatalog([{"Id": 1, "Code": "A", "isActive": True}])
+    view = catalog.view()
+    for field in ("Id", "Code", "isActive", "Name", "OnHand"):
+        response = respond(app, responses, ("get/products", field), view, build=lambda rows, f=field: [{f: r.get(f)} for r in rows])
+        assert response.status_code == 200
+
+    assert len(responses) == 3
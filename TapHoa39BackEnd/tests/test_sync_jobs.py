@@ -0,0 +1,64 @@
+import threading
+
+from firebase.firebase_service.sync_jobs import SyncJobRunner
+
+
+def test_triggers_while_running_join_the_job():
+    release = threading.Event()
+    calls = []
+
+    def products(progress, mode="auto"):
+        calls.append(mode)
+        progress(fetched=10)
+        release.wait(5)
+        return {"success": True, "stats": {"updated": 1}}
+
+    runner = SyncJobRunner({"products": products})
+    job, started = runner.submit("products", mode="full")
+    joined, joined_started = runner.submit("products", mode="full")
+
+    assert started is True
+    assert joined_started is False
+    assert joined["id"] == job["id"]
+    release.set()
+    finished = runner.wait(job["id"], timeout=5)
+
+    assert calls == ["full"]
+    assert finished["status"] == "succeeded"
+    assert finished["coalesced"] == 1
+    assert finished["progress"] == {"fetched": 10}
+    assert finished["result"] == {"success": True, "stats": {"updated": 1}}
+    assert runner.running("products") is None
+    # Once finished, the next trigger starts a new job
+    second, second_started = runner.submit("products")
+    assert second_started is True
+    assert runner.wait(second["id"], timeout=5)["status"] == "succeeded"
+
+
+def test_failures_are_recorded():
+    def unsuccessful(progress):
+        return {"success": False, "error": "page 3 failed"}
+
+    def broken(progress):
+        raise RuntimeError("token expired")
+
+    runner = SyncJobRunner({"products": unsuccessful, "customers": broken})
+    products, _ = runner.submit("products")
+    customers, _ = runner.submit("customers")
+
+    assert runner.wait(products["id"], timeout=5)["status"] == "failed"
+    assert runner.get(products["id"])["error"] == "page 3 failed"
+    failed = runner.wait(customers["id"], timeout=5)
+    assert failed["status"] == "failed"
+    assert failed["error"] == "token expired"
+    assert [job["kind"] for job in runner.list()] == ["customers", "products"]
+
+
+def test_unknown_kind_is_rejected():
+    runner = SyncJobRunner({"products": lambda progress: None})
+    try:
+        runner.submit("orders")
+    except ValueError as exc:
+        assert "orders" in str(exc)
+    else:
+        raise AssertionError("expected ValueError")
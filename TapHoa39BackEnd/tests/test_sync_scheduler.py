@@ -0,0 +1,75 @@
+import threading
+import time
+
+from firebase.firebase_service import sync_scheduler
+from firebase.firebase_service.sync_jobs import SyncJobRunner
+from firebase.firebase_service.sync_scheduler import FirestoreLease, SyncScheduler
+
+
+def test_lease_has_one_holder_until_it_expires(client):
+    ref = client.collection("sync_scheduler").document("lease")
+    first = FirestoreLease(client, ref, ttl=60)
+    second = FirestoreLease(client, ref, ttl=60)
+
+    assert first.claim()[0] is True
+    assert second.claim()[0] is False
+    # The holder renews its own lease
+    assert first.claim()[0] is True
+
+    documents = client._firestore_api.documents
+    documents["sync_scheduler/lease"]["expires_at"] = time.time() - 1
+    taken, previous = second.claim()
+    assert taken is True
+    assert previous["owner"] == first.owner
+    assert first.claim()[0] is False
+
+
+def run_tick(scheduler, now, monkeypatch):
+    monkeypatch.setattr(sync_scheduler.time, "time", lambda: now)
+    scheduler._tick()
+
+
+def test_failures_back_off_and_success_resets(monkeypatch):
+    monkeypatch.setattr(sync_scheduler, "SYNC_SCHEDULER_JITTER", 0)
+    outcomes = [False, False, True]
+
+    def products(progress):
+        return {"success": outcomes.pop(0)}
+
+    runner = SyncJobRunner({"products": products})
+    scheduler = SyncScheduler(runner, {"products": {"interval": 600}})
+    now = 1_000_000.0
+
+    expected_delays = [1200, 2400, 600]
+    for delay in expected_delays:
+        run_tick(scheduler, now, monkeypatch)
+        job_id = scheduler._state["products"]["job_id"]
+        assert job_id is not None
+        runner.wait(job_id, timeout=5)
+        run_tick(scheduler, now, monkeypatch)
+        assert scheduler._state["products"]["next_run_at"] == now + delay
+        # Not due yet: nothing starts
+        run_tick(scheduler, now + delay - 1, monkeypatch)
+        assert scheduler._state["products"]["job_id"] is None
+        now += delay
+
+    status = scheduler.status()["kinds"]["products"]
+    assert (status["runs"], status["succeeded"], status["failed"]) == (3, 1, 2)
+    assert status["consecutive_failures"] == 0
+
+
+def test_due_run_is_skipped_while_a_manual_sync_runs(monkeypatch):
+    monkeypatch.setattr(sync_scheduler, "SYNC_SCHEDULER_JITTER", 0)
+    release = threading.Event()
+    runner = SyncJobRunner({"products": lambda progress: release.wait(5)})
+    scheduler = SyncScheduler(runner, {"products": {"interval": 600}})
+    manual, _ = runner.submit("products")
+
+    run_tick(scheduler, 1_000_000.0, monkeypatch)
+    release.set()
+    runner.wait(manual["id"], timeout=5)
+
+    state = scheduler.status()["kinds"]["products"]
+    assert state["skipped"] == 1
+    assert state["runs"] == 0
+    assert state["next_run_at"] == 1_000_600.0